@@ -4,7 +4,10 @@ import os
 import sys
 import time
 
-from crbuild_lib import (Builder, Cmd, ConfigReader, Env, Options)
+from crbuild_lib import (Builder, Cmd, ConfigReader, Env, Options, RunError)
+from crbuild_lib.self_profile import SelfProfiler
+from crbuild_lib.trace import tracer
+from wpt_lib import wpt_command
 
 def get_config_file_path():
   """Return the path to this application's configuration file."""
@@ -45,22 +48,34 @@ def format_duration(seconds):
   return "%02d:%02d:%02d" % (hours, minutes, seconds)
 
 if __name__ == '__main__':
+  if sys.argv[1:2] == ['wpt']:
+    sys.exit(wpt_command(sys.argv[2:]))
+  profiler = None
+  if SelfProfiler.requested(sys.argv[1:]):
+    profiler = SelfProfiler()
+    profiler.start()
   try:
     start = time.time()
 
-    reader = ConfigReader()
-    config = reader.read(get_config_file_path())
+    with tracer.span('load config'):
+      reader = ConfigReader()
+      config = reader.read(get_config_file_path())
 
     src_root_dir = get_source_root(os.getcwd())
     options = Options(Env(src_root_dir,
                           get_gclient_path(src_root_dir),
                           get_api_keys_path()),
                       config)
-    options.parse(sys.argv[1:])
+    with tracer.span('parse options'):
+      options.parse(sys.argv[1:])
 
     builder = Builder(options, config)
     errors = builder.build()
 
+    if options.trace_file:
+      tracer.write(options.trace_file)
+      print('Trace written to %s' % options.trace_file)
+
     runtime = time.time() - start
     if not errors:
       print()
@@ -70,7 +85,11 @@ if __name__ == '__main__':
 
     # Print errors and exit.
     for e in errors:
-      Cmd.print_error(e.cmd, env_vars=None, add_quotes=False)
+      if isinstance(e, RunError):
+        Cmd.print_error(e.cmd, env_vars=None, add_quotes=False, tail=e.tail,
+                        log_path=e.log_path, failures=e.failures)
+      else:
+        Cmd.print_error(e.cmd, env_vars=None, add_quotes=False)
 
     print()
     print(str.format("Run duration: {0}", format_duration(runtime)))
@@ -79,3 +98,7 @@ if __name__ == '__main__':
   except Exception as e:
     raise e
     #print(str.format('Exception: {0}', str(e)), file=sys.stderr)
+  finally:
+    if profiler:
+      profiler.stop()
+      profiler.write(SelfProfiler.default_path())
@@ -2,7 +2,7 @@
 
 from .adb import Adb
 from .builder import Builder
-from .command import Cmd
+from .command import (Cmd, RunError)
 from .env import Env
 from .loader import ConfigReader
 from .models import (Configuration, RunCommand, Target, TargetReference)
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
+import collections.abc
+import concurrent.futures
 import json
-import subprocess
+import threading
+
+from .adb_client import AdbClient
+from .trace import tracer
 
 def remove_nulls(d):
   return {k: v for k, v in d.items() if v is not None}
@@ -51,61 +56,127 @@ class DeviceInfo(object):
   def __repr__(self):
     return json.dumps(self.__dict__, cls=ClassJSONEncoder)
 
+class DeviceInfoMap(collections.abc.Mapping):
+  '''Map of device serial to DeviceInfo, queried from the devices lazily.
+
+  The serials are known up front, so iterating over (or counting) devices
+  is free. A DeviceInfo is only queried when first accessed, and all not
+  yet queried devices are queried concurrently when iterating over values
+  or items.
+  '''
+
+  def __init__(self, serials, query=None):
+    """
+    serials: the device serials.
+    query: function(serial) returning a DeviceInfo (default:
+           Adb.query_device_info).
+    """
+    self._serials = list(serials)
+    self._query = query or Adb.query_device_info
+    self._lock = threading.Lock()
+    self._info = {}
+
+  def _fetch(self, serials):
+    with self._lock:
+      missing = [s for s in serials if s not in self._info]
+      if not missing:
+        return
+      with tracer.span('android device info', 'env',
+                       args={'devices': missing}):
+        if len(missing) == 1:
+          self._info[missing[0]] = self._query(missing[0])
+          return
+        with concurrent.futures.ThreadPoolExecutor(len(missing)) as executor:
+          for serial, info in zip(missing, executor.map(self._query, missing)):
+            self._info[serial] = info
+
+  def __getitem__(self, serial):
+    if serial not in self._serials:
+      raise KeyError(serial)
+    self._fetch([serial])
+    return self._info[serial]
+
+  def __contains__(self, serial):
+    return serial in self._serials
+
+  def __iter__(self):
+    return iter(self._serials)
+
+  def __len__(self):
+    return len(self._serials)
+
+  def items(self):
+    self._fetch(self._serials)
+    return super(DeviceInfoMap, self).items()
+
+  def values(self):
+    self._fetch(self._serials)
+    return super(DeviceInfoMap, self).values()
+
 class Adb(object):
 
+  # Packages whose presence is checked by query_device_info (checking for
+  # specific packages is much faster than listing all of them).
+  probed_packages = ('com.google.android.gms',)
+
   @staticmethod
   def get_device_info():
-    device_info = {}
-    for device_serial, _ in Adb.devices().items():
-      device_info[device_serial] = DeviceInfo(
-          device_serial, Adb.api_level(device_serial),
-          Adb.cpu_abi(device_serial), Adb.get_installed_packages(device_serial))
-    return device_info
+    return DeviceInfoMap(Adb.devices().keys())
+
+  @staticmethod
+  def _device_info_script():
+    '''Return the shell script printing everything DeviceInfo needs: the API
+    level, CPU ABI, then each of the probed packages which is installed.'''
+    return ('getprop ro.build.version.sdk; getprop ro.product.cpu.abi; '
+            'for p in %s; do pm path $p >/dev/null 2>&1 && echo $p; done; '
+            'true' % ' '.join(Adb.probed_packages))
+
+  @staticmethod
+  def parse_device_info(serial, output):
+    '''Create a DeviceInfo from the output of _device_info_script.'''
+    lines = [line.strip() for line in output.splitlines()]
+    try:
+      api_level = int(lines[0])
+    except (IndexError, ValueError):
+      api_level = None
+    cpu_abi = lines[1] if len(lines) > 1 else None
+    packages = sorted(line for line in lines[2:] if line)
+    return DeviceInfo(serial, api_level, cpu_abi, packages)
+
+  @staticmethod
+  def query_device_info(serial):
+    '''Query a device's DeviceInfo with a single adb shell command.'''
+    output = AdbClient.get().check_shell(serial, Adb._device_info_script())
+    return Adb.parse_device_info(serial, output)
 
   @staticmethod
   def _path():
     return 'adb'
 
+  @staticmethod
+  def _getprop(device, name):
+    value = AdbClient.get().getprop(device, name)
+    return value if value else None
+
   @staticmethod
   def os_release(device = None):
-    cmd = [Adb._path(), 'shell', 'getprop', 'ro.build.version.release']
-    if device:
-      cmd = [cmd[0]] + ['-s', device] + cmd[1:]
-    for line in subprocess.check_output(cmd).splitlines():
-      return int(line.strip())
-    return None
+    release = Adb._getprop(device, 'ro.build.version.release')
+    return int(release) if release else None
 
   @staticmethod
   def api_level(device = None):
-    cmd = [Adb._path(), 'shell', 'getprop', 'ro.build.version.sdk']
-    if device:
-      cmd = [cmd[0]] + ['-s', device] + cmd[1:]
-    for line in subprocess.check_output(cmd).splitlines():
-      return int(line.strip())
-    return None
+    api_level = Adb._getprop(device, 'ro.build.version.sdk')
+    return int(api_level) if api_level else None
 
   @staticmethod
   def cpu_abi(device = None):
-    cmd = [Adb._path(), 'shell', 'getprop', 'ro.product.cpu.abi']
-    if device:
-      cmd = [cmd[0]] + ['-s', device] + cmd[1:]
-    for line in subprocess.check_output(cmd).splitlines():
-      return line.strip().decode('utf-8')
-    return None
+    return Adb._getprop(device, 'ro.product.cpu.abi')
 
   @staticmethod
   def get_installed_packages(device = None):
-    if device:
-      cmd = str.format(
-          "adb -s {0} shell 'pm list packages -f' | sed -e 's/.*=//' | sort",
-          device)
-    else:
-      cmd = "adb shell 'pm list packages -f' | sed -e 's/.*=//' | sort"
-
-    packages = []
-    for line in subprocess.check_output(cmd, shell=True).splitlines():
-      packages.append(line.strip().decode('utf-8'))
-    return packages
+    output = AdbClient.get().check_shell(device, 'pm list packages -f')
+    return sorted(line.strip().split('=')[-1]
+                  for line in output.splitlines() if line.strip())
 
   @staticmethod
   def has_gms(device = None):
@@ -114,10 +185,4 @@ class Adb(object):
   @staticmethod
   def devices():
     """Return a map of device serial to type."""
-    cmd = [Adb._path(), 'devices']
-    devices = {}
-    for line in subprocess.check_output(cmd).splitlines():
-      items = line.strip().split()
-      if len(items) == 2:
-        devices[items[0].decode('utf-8')] = items[1].decode('utf-8')
-    return devices
+    return AdbClient.get().devices()
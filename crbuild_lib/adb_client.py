@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+import os
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+class AdbError(Exception):
+  pass
+
+class ShellSession(object):
+  '''A shell command running on a device with the input (e.g. a tar
+  stream) written by the caller. File-like: write() then close_stdin() and
+  wait() for the result.'''
+
+  exit_marker = b'\x01crbuild-exit:'
+  # Shell protocol (v2) packet ids.
+  stdin_id = 0
+  stdout_id = 1
+  stderr_id = 2
+  exit_id = 3
+  close_stdin_id = 4
+  max_packet_size = 64 * 1024
+
+  def __init__(self, sock, command, shell_v2):
+    self._sock = sock
+    self._command = command
+    self._shell_v2 = shell_v2
+
+  def write(self, data):
+    if not self._shell_v2:
+      self._sock.sendall(data)
+      return len(data)
+    data = memoryview(data)
+    for start in range(0, len(data), ShellSession.max_packet_size):
+      chunk = data[start:start + ShellSession.max_packet_size]
+      self._sock.sendall(struct.pack('<BI', ShellSession.stdin_id,
+                                     len(chunk)))
+      self._sock.sendall(chunk)
+    return len(data)
+
+  def close_stdin(self):
+    if self._shell_v2:
+      self._sock.sendall(struct.pack('<BI', ShellSession.close_stdin_id, 0))
+    else:
+      self._sock.shutdown(socket.SHUT_WR)
+
+  @staticmethod
+  def parse_legacy_output(command, output):
+    '''Split the output of a command followed by an echo of exit_marker and
+    its exit status into (returncode, stdout, stderr).'''
+    pos = output.rfind(ShellSession.exit_marker)
+    if pos == -1:
+      raise AdbError('shell:%s: no exit status' % command)
+    returncode = int(output[pos + len(ShellSession.exit_marker):].strip() or 1)
+    return (returncode, output[:pos], b'')
+
+  def wait(self):
+    """Wait for the command to exit returning (returncode, stdout, stderr)
+    as bytes (stderr is in stdout for devices without the shell protocol)."""
+    with self._sock as sock:
+      if not self._shell_v2:
+        return ShellSession.parse_legacy_output(self._command,
+                                                AdbClient._recv_all(sock))
+      out = {ShellSession.stdout_id: [], ShellSession.stderr_id: []}
+      while True:
+        packet_id, size = struct.unpack(
+            '<BI', AdbClient._recv_exactly(sock, 5))
+        data = AdbClient._recv_exactly(sock, size)
+        if packet_id == ShellSession.exit_id:
+          return (data[0], b''.join(out[ShellSession.stdout_id]),
+                  b''.join(out[ShellSession.stderr_id]))
+        if packet_id in out:
+          out[packet_id].append(data)
+
+class AdbClient(object):
+  '''Talks to the local adb server using the adb host protocol (see
+  SERVICES.TXT and protocol.txt in the adb sources) instead of running the
+  adb binary for every command.
+
+  Every request is "<4 hex digit length><request>", answered with "OKAY" or
+  "FAIL<4 hex digit length><message>". Host services (host:*) are handled by
+  the server, device services (shell:, exec:, reverse:, ...) are sent after
+  first switching the connection to a device with host:transport:<serial>.
+  The server closes a connection once its service is done, so each request
+  uses a new (local, cheap) connection; independent requests can therefore
+  be run concurrently from several threads.
+  '''
+
+  default_port = 5037
+  # The largest sync protocol DATA packet.
+  sync_data_max = 64 * 1024
+  _instance = None
+  _instance_lock = threading.Lock()
+
+  def __init__(self, host='127.0.0.1', port=None, adb_path='adb',
+               start_server=True):
+    self.host = host
+    self.port = port or int(os.environ.get('ANDROID_ADB_SERVER_PORT',
+                                           AdbClient.default_port))
+    self._adb_path = adb_path
+    self._start_server = start_server
+    self._lock = threading.Lock()
+    self._features = {}  # serial -> set of features.
+
+  @staticmethod
+  def get():
+    '''Return the shared client for the default adb server.'''
+    with AdbClient._instance_lock:
+      if not AdbClient._instance:
+        AdbClient._instance = AdbClient()
+      return AdbClient._instance
+
+  def _connect(self):
+    try:
+      return socket.create_connection((self.host, self.port))
+    except ConnectionRefusedError:
+      if not self._start_server:
+        raise AdbError('No adb server on port %d' % self.port)
+      with self._lock:
+        # Once only: adb start-server returns after the server is listening.
+        if self._start_server:
+          subprocess.check_call([self._adb_path, 'start-server'])
+          self._start_server = False
+      return socket.create_connection((self.host, self.port))
+
+  @staticmethod
+  def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+      chunk = sock.recv(size - len(data))
+      if not chunk:
+        raise AdbError('adb server closed the connection')
+      data.extend(chunk)
+    return bytes(data)
+
+  @staticmethod
+  def _recv_all(sock):
+    chunks = []
+    while True:
+      chunk = sock.recv(64 * 1024)
+      if not chunk:
+        return b''.join(chunks)
+      chunks.append(chunk)
+
+  @staticmethod
+  def _read_string(sock):
+    size = int(AdbClient._recv_exactly(sock, 4), 16)
+    return AdbClient._recv_exactly(sock, size)
+
+  @staticmethod
+  def _request(sock, request):
+    '''Send a request and wait for it to be accepted.'''
+    data = request.encode('utf-8')
+    sock.sendall(b'%04x' % len(data) + data)
+    AdbClient._read_status(sock, request)
+
+  @staticmethod
+  def _read_status(sock, request):
+    status = AdbClient._recv_exactly(sock, 4)
+    if status == b'OKAY':
+      return
+    if status == b'FAIL':
+      raise AdbError('%s: %s' % (
+          request, AdbClient._read_string(sock).decode('utf-8', 'replace')))
+    raise AdbError('%s: unexpected reply %r' % (request, status))
+
+  def _host_query(self, request):
+    '''Send a host service request returning its (length prefixed) reply.'''
+    with self._connect() as sock:
+      AdbClient._request(sock, request)
+      return AdbClient._read_string(sock).decode('utf-8')
+
+  def _open(self, serial, service):
+    '''Return a connection to |service| on the given device (or the only
+    device if |serial| is None).'''
+    sock = self._connect()
+    try:
+      if serial:
+        AdbClient._request(sock, 'host:transport:%s' % serial)
+      else:
+        AdbClient._request(sock, 'host:transport-any')
+      AdbClient._request(sock, service)
+    except:
+      sock.close()
+      raise
+    return sock
+
+  def version(self):
+    return int(self._host_query('host:version'), 16)
+
+  def devices(self):
+    '''Return a map of device serial to type (state).'''
+    devices = {}
+    for line in self._host_query('host:devices').splitlines():
+      items = line.strip().split()
+      if len(items) == 2:
+        devices[items[0]] = items[1]
+    return devices
+
+  def features(self, serial):
+    with self._lock:
+      if serial in self._features:
+        return self._features[serial]
+    if serial:
+      request = 'host-serial:%s:features' % serial
+    else:
+      request = 'host:features'
+    features = set(self._host_query(request).split(','))
+    with self._lock:
+      self._features[serial] = features
+    return features
+
+  def shell(self, serial, command):
+    '''Run a shell command on a device, returning (returncode, stdout,
+    stderr) with stdout and stderr as bytes.
+
+    Devices which don't support the shell protocol (< Android N) can't
+    separate stdout from stderr, so they are both returned in stdout, and
+    the exit status is echoed after the command.'''
+    if 'shell_v2' not in self.features(serial):
+      return self._legacy_shell(serial, command)
+    session = ShellSession(self._open(serial, 'shell,v2,raw:%s' % command),
+                           command, True)
+    session.close_stdin()
+    return session.wait()
+
+  def _legacy_shell(self, serial, command):
+    with self._open(serial, 'shell:(%s); echo "%s$?"' % (
+        command, ShellSession.exit_marker.decode('utf-8'))) as sock:
+      return ShellSession.parse_legacy_output(command,
+                                              AdbClient._recv_all(sock))
+
+  def open_shell(self, serial, command):
+    '''Start a shell command whose stdin will be written to, returning the
+    ShellSession.'''
+    if 'shell_v2' in self.features(serial):
+      return ShellSession(self._open(serial, 'shell,v2,raw:%s' % command),
+                          command, True)
+    # exec: (unlike shell:) has no pty, which would mangle binary input.
+    return ShellSession(self._open(serial, 'exec:(%s); echo "%s$?"' % (
+        command, ShellSession.exit_marker.decode('utf-8'))), command, False)
+
+  def check_shell(self, serial, command):
+    '''Run a shell command, returning stdout (as a string) or raising
+    subprocess.CalledProcessError if it fails.'''
+    if not isinstance(command, str):
+      command = ' '.join(shlex.quote(arg) for arg in command)
+    returncode, stdout, stderr = self.shell(serial, command)
+    stdout = stdout.decode('utf-8', errors='replace')
+    if returncode:
+      raise subprocess.CalledProcessError(
+          returncode, ['adb', '-s', serial, 'shell', command], stdout,
+          stderr.decode('utf-8', errors='replace'))
+    return stdout
+
+  def exec_out(self, serial, command):
+    '''Run a command on a device, returning its raw stdout (bytes). Unlike
+    shell no pty or line ending translation is used on any device.'''
+    with self.open_exec(serial, command) as sock:
+      return AdbClient._recv_all(sock)
+
+  def open_exec(self, serial, command):
+    '''Start a command on a device, returning the socket its raw stdout is
+    streamed from (for long running commands such as logcat). Closing the
+    socket ends the command.'''
+    return self._open(serial, 'exec:%s' % command)
+
+  def getprop(self, serial, name):
+    return self.check_shell(serial, ['getprop', name]).strip()
+
+  @staticmethod
+  def _read_forward_reply(sock, request, port_requested):
+    AdbClient._read_status(sock, request)
+    if port_requested == 'tcp:0':
+      # The allocated port.
+      return int(AdbClient._read_string(sock))
+    return None
+
+  def forward(self, serial, local, remote):
+    '''Forward host socket |local| (e.g. "tcp:8000") to |remote| on the
+    device. Returns the allocated port when |local| is "tcp:0".'''
+    request = 'host-serial:%s:forward:%s;%s' % (serial, local, remote)
+    with self._connect() as sock:
+      AdbClient._request(sock, request)
+      return AdbClient._read_forward_reply(sock, request, local)
+
+  def forward_remove(self, serial, local):
+    with self._connect() as sock:
+      AdbClient._request(sock, 'host-serial:%s:killforward:%s' %
+                         (serial, local))
+
+  def reverse(self, serial, remote, local):
+    '''Forward device socket |remote| to |local| on the host. Returns the
+    allocated device port when |remote| is "tcp:0".'''
+    request = 'reverse:forward:%s;%s' % (remote, local)
+    with self._open(serial, request) as sock:
+      return AdbClient._read_forward_reply(sock, request, remote)
+
+  def reverse_remove(self, serial, remote):
+    request = 'reverse:killforward:%s' % remote
+    with self._open(serial, request) as sock:
+      AdbClient._read_status(sock, request)
+
+  def push(self, serial, data, remote_path, mode=0o644, mtime=None):
+    '''Write |data| (bytes or memoryview) to |remote_path| on the device
+    using the sync protocol.'''
+    data = memoryview(data)
+    request = 'sync:'
+    with self._open(serial, request) as sock:
+      path_mode = ('%s,%d' % (remote_path, mode)).encode('utf-8')
+      sock.sendall(b'SEND' + struct.pack('<I', len(path_mode)) + path_mode)
+      for start in range(0, len(data), AdbClient.sync_data_max):
+        chunk = data[start:start + AdbClient.sync_data_max]
+        sock.sendall(b'DATA' + struct.pack('<I', len(chunk)))
+        sock.sendall(chunk)
+      sock.sendall(b'DONE' + struct.pack('<I', int(mtime or time.time())))
+      status, size = struct.unpack('<4sI', AdbClient._recv_exactly(sock, 8))
+      if status != b'OKAY':
+        message = AdbClient._recv_exactly(sock, size).decode('utf-8',
+                                                             'replace')
+        raise AdbError('push %s: %s' % (remote_path, message))
+      sock.sendall(b'QUIT' + struct.pack('<I', 0))
+
+  def install(self, serial, data, args=('-r', '-d', '-t')):
+    '''Install an APK (bytes or memoryview) on the device.
+
+    Where supported (Android N+) the APK is streamed directly into the
+    package manager, otherwise it is pushed to a temporary file first.'''
+    if 'cmd' in self.features(serial):
+      with self._open(serial, 'exec:cmd package install -S %d %s' % (
+          len(data), ' '.join(args))) as sock:
+        sock.sendall(data)
+        output = AdbClient._recv_all(sock).decode('utf-8', 'replace')
+    else:
+      tmp_path = '/data/local/tmp/crbuild-%d-%d.apk' % (
+          os.getpid(), threading.get_ident())
+      self.push(serial, data, tmp_path)
+      _, output, _ = self.shell(serial, 'pm install %s %s; rm -f %s' % (
+          ' '.join(args), tmp_path, tmp_path))
+      output = output.decode('utf-8', 'replace')
+    if 'Success' not in output:
+      raise AdbError('install: %s' % output.strip())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import shlex
+import threading
+
+from .adb_client import AdbError
+
+class AndroidStackSymbolizer(object):
+  '''Finds native crash stacks in Android logcat output and tombstones and
+  symbolizes them against the unstripped libraries in the build directory.
+
+  Frames are those written by debuggerd, e.g.:
+
+    #00 pc 000000000123abcd  /data/app/.../lib/arm64/libchrome.so (BuildId: 12ab...)
+
+  The pc is an offset into the library, so it is looked up in
+  <build dir>/lib.unstripped/libchrome.so by the shared Symbolizer, whose
+  processes keep the library's debug info loaded and whose SymbolCache is
+  keyed by build ID and offset. Frames whose build ID doesn't match the
+  unstripped library (the device runs a different build) are left as is.
+
+  Each symbolized stack is written, as text, to |out| (a function(str)).
+  '''
+
+  frame_re = re.compile(r'(#[0-9]+) pc ([0-9a-f]+) +(\S+)(.*?)'
+                        r'(?: \(BuildId: ([0-9a-f]+)\))?\s*$')
+  tombstone_dir = '/data/tombstones'
+  # Precedes each tombstone read from the device (which contain "*** ***").
+  _tombstone_marker = 'crbuild-tombstone: '
+  # Tombstone lines describing the crash, shown above its stack.
+  tombstone_header_re = re.compile(r'^(signal |Abort message|Cmdline:|pid: )')
+
+  def __init__(self, build_dir, symbolizer, out):
+    self.lib_dir = os.path.join(build_dir, 'lib.unstripped')
+    self._symbolizer = symbolizer
+    self._out = out
+    self._lock = threading.Lock()
+    self._partial = b''
+    self._stack = []  # Frame lines of the stack being read.
+
+  def _library(self, path, build_id):
+    '''Return the unstripped library for a device path, or None.'''
+    # Libraries loaded directly from an APK are "base.apk!libchrome.so".
+    name = path.split('!')[-1].rsplit('/', 1)[-1]
+    library = os.path.join(self.lib_dir, name)
+    key = self._symbolizer.cache.module_key(library)
+    if not key or (build_id and key != build_id):
+      return None
+    return library
+
+  def symbolize_frames(self, lines):
+    '''Symbolize a list of frame lines, returning the lines to show (one per
+    frame, plus one per inlined function). Returns None if no frame could
+    be symbolized.'''
+    frames = []
+    for line in lines:
+      m = AndroidStackSymbolizer.frame_re.search(line)
+      library = self._library(m.group(3), m.group(5)) if m else None
+      frames.append((m, library))
+    resolved = self._symbolizer.resolve(
+        (library, int(m.group(2), 16)) for m, library in frames if library)
+    out = []
+    symbolized = False
+    for line, (m, library) in zip(lines, frames):
+      symbols = resolved.get((library, int(m.group(2), 16))) \
+          if library else None
+      if not symbols or symbols[0][0] == '??':
+        out.append(line[m.start():] if m else line)
+        continue
+      symbolized = True
+      for function, location in symbols:
+        out.append('%s pc %s  %s %s %s' % (
+            m.group(1), m.group(2), os.path.basename(library), function,
+            location))
+    return out if symbolized else None
+
+  def _write_stack(self, header, lines):
+    symbolized = self.symbolize_frames(lines)
+    if symbolized:
+      self._out('\n'.join([header] + symbolized) + '\n')
+
+  def process(self, data):
+    '''Scan logcat output (bytes, as it is read) for crash stacks, writing
+    each (symbolized) once it ends.'''
+    with self._lock:
+      data = self._partial + data
+      cut = data.rfind(b'\n') + 1
+      self._partial = data[cut:]
+      for line in data[:cut].decode('utf-8', errors='replace').splitlines():
+        if AndroidStackSymbolizer.frame_re.search(line):
+          self._stack.append(line)
+        elif self._stack:
+          self._write_stack('Symbolized crash stack:', self._stack)
+          self._stack = []
+
+  def flush(self):
+    '''Write the stack being read (if any), e.g. once logcat has stopped.'''
+    with self._lock:
+      if self._stack:
+        self._write_stack('Symbolized crash stack:', self._stack)
+        self._stack = []
+
+  def symbolize_tombstone(self, path, text):
+    '''Write the crash described by a tombstone and its symbolized main
+    thread backtrace.'''
+    header = ['Symbolized crash stack (%s):' % path]
+    frames = []
+    in_backtrace = False
+    for line in text.splitlines():
+      if AndroidStackSymbolizer.tombstone_header_re.match(line):
+        header.append(line)
+      elif line.strip() == 'backtrace:':
+        in_backtrace = True
+      elif in_backtrace:
+        if not AndroidStackSymbolizer.frame_re.search(line):
+          break  # Only the crashing thread's backtrace.
+        frames.append(line)
+    if frames:
+      self._write_stack('\n'.join(header), frames)
+
+  def read_tombstones(self, client, serial, max_age):
+    '''Symbolize the tombstones written on the device in the last |max_age|
+    seconds. Tombstones usually aren't readable without root, in which case
+    nothing is written.'''
+    script = (
+        'now=$(date +%%s); for f in %s/tombstone_[0-9]*; do '
+        'if [ -r "$f" ] && [ $((now - $(stat -c %%Y "$f"))) -le %d ]; then '
+        'echo "%s$f"; cat "$f"; fi; done 2>/dev/null' % (
+            shlex.quote(AndroidStackSymbolizer.tombstone_dir), max_age,
+            AndroidStackSymbolizer._tombstone_marker))
+    try:
+      _, out, _ = client.shell(serial, script)
+    except (AdbError, OSError):
+      return
+    text = out.decode('utf-8', errors='replace')
+    marker = '\n' + AndroidStackSymbolizer._tombstone_marker
+    for tombstone in ('\n' + text).split(marker)[1:]:
+      path, _, contents = tombstone.partition('\n')
+      self.symbolize_tombstone(path, contents)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import re
+import subprocess
+import threading
+
+from .adb_client import (AdbClient, AdbError)
+
+class ApkInstaller(object):
+  '''Installs APKs on Android devices through the adb server.
+
+  Each APK is mapped into memory once and the same pages are streamed to
+  every device, so installing to several devices concurrently doesn't read
+  (or copy) the APK once per device.
+  '''
+
+  # APKs referenced by a generated bin/<target> wrapper script.
+  apk_path_re = re.compile(r'''['"]([^'"]*apks[/\\][^'"]+\.apk)['"]''')
+
+  def __init__(self, client=None):
+    self._client = client
+    self._lock = threading.Lock()
+    self._mapped = {}  # path -> (file, mmap)
+
+  def _get_client(self):
+    return self._client or AdbClient.get()
+
+  @staticmethod
+  def find_apks(wrapper_path):
+    '''Return the (absolute) APK paths referenced by a Chromium generated
+    wrapper script (e.g. out/Debug/bin/chrome_public_apk), main APK first.'''
+    try:
+      with open(wrapper_path, 'r') as f:
+        script = f.read()
+    except IOError:
+      return []
+    apks = []
+    for path in ApkInstaller.apk_path_re.findall(script):
+      path = os.path.normpath(os.path.join(os.path.dirname(wrapper_path),
+                                           path))
+      if path not in apks:
+        apks.append(path)
+    return apks
+
+  def _apk_data(self, apk_path):
+    with self._lock:
+      if apk_path not in self._mapped:
+        f = open(apk_path, 'rb')
+        self._mapped[apk_path] = (f, mmap.mmap(f.fileno(), 0,
+                                               access=mmap.ACCESS_READ))
+      return memoryview(self._mapped[apk_path][1])
+
+  def install(self, serial, apk_path):
+    '''Install |apk_path| on the given device. Raises
+    subprocess.CalledProcessError on failure.'''
+    data = self._apk_data(apk_path)
+    try:
+      self._get_client().install(serial, data)
+    except (AdbError, OSError) as e:
+      print('[%s] %s' % (serial, e))
+      raise subprocess.CalledProcessError(
+          1, ['adb', '-s', serial, 'install', apk_path])
+    finally:
+      data.release()
+
+  def close(self):
+    '''Unmap all APKs.'''
+    with self._lock:
+      for f, mapped in self._mapped.values():
+        mapped.close()
+        f.close()
+      self._mapped = {}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import contextlib
+import json
+import os
+import subprocess
+import uuid
+
+from .file_lock import FileLock
+
+class BuildLock(object):
+  '''Serializes gn/ninja in one build directory across crbuild processes.
+
+  A request to build targets that are all part of the build currently
+  running attaches to that build and gets its result instead of starting
+  another ninja. Other requests that arrive while a build is running are
+  queued, and the next process to get the lock builds every queued request
+  in a single follow-up build.
+
+  The queue lives in a small JSON state file next to the build directory
+  (and not in it, so that clobbering doesn't delete it).
+  '''
+
+  # The maximum number of unclaimed results to keep in the state file.
+  max_results = 100
+
+  def __init__(self, build_dir):
+    parent, name = os.path.split(os.path.normpath(build_dir))
+    base = os.path.join(parent, '.crbuild-%s' % name)
+    self.build_dir = build_dir
+    self._lock = FileLock(base + '.lock')
+    self._state_lock = FileLock(base + '.state.lock')
+    self._state_path = base + '.state.json'
+
+  def exclusive(self):
+    '''Return a context manager holding the build lock (e.g. for gn gen).'''
+    return self._lock
+
+  @contextlib.contextmanager
+  def _state(self):
+    '''Yield the (mutable) state dictionary, saving it on exit.'''
+    with self._state_lock:
+      state = {'running': None, 'pid': None, 'pending': [], 'results': {}}
+      try:
+        with open(self._state_path, 'r') as f:
+          state.update(json.load(f))
+      except (IOError, ValueError):
+        pass
+      yield state
+      with open(self._state_path, 'w') as f:
+        json.dump(state, f)
+
+  @staticmethod
+  def _encode(exceptions):
+    return [{'returncode': e.returncode, 'cmd': e.cmd} for e in exceptions]
+
+  @staticmethod
+  def _decode(result):
+    return [subprocess.CalledProcessError(returncode=r['returncode'],
+                                          cmd=r['cmd']) for r in result]
+
+  @staticmethod
+  def _targets(requests):
+    targets = set()
+    for request in requests:
+      targets.update(request['targets'])
+    return targets
+
+  def build(self, targets, build_func):
+    '''Build |targets| by calling |build_func| with a list of target names.
+
+    |build_func| returns a list of exceptions (CalledProcessError), which is
+    also what this function returns.
+    '''
+    request = {'id': uuid.uuid4().hex, 'targets': sorted(set(targets))}
+    with self._state() as state:
+      running = state['running']
+      if running is not None and \
+          set(request['targets']).issubset(BuildLock._targets(running)):
+        print('Waiting for running build of %s (pid %s)' %
+              (' '.join(request['targets']), state['pid']))
+        running.append(request)
+      else:
+        if running is not None:
+          print('Build running in %s (pid %s), queuing follow-up build' %
+                (self.build_dir, state['pid']))
+        state['pending'].append(request)
+
+    with self._lock:
+      with self._state() as state:
+        if request['id'] in state['results']:
+          return BuildLock._decode(state['results'].pop(request['id']))
+        if state['running'] is not None:
+          # The previous build died before recording its result. Redo it.
+          state['pending'] = state['running'] + state['pending']
+        requests = state['pending']
+        if request['id'] not in [r['id'] for r in requests]:
+          requests.append(request)
+        state['pending'] = []
+        state['running'] = requests
+        state['pid'] = os.getpid()
+      if len(requests) > 1:
+        print('Combining %d build requests' % len(requests))
+
+      exceptions = build_func(sorted(BuildLock._targets(requests)))
+
+      with self._state() as state:
+        result = BuildLock._encode(exceptions)
+        for r in state['running'] or []:
+          if r['id'] != request['id']:
+            state['results'][r['id']] = result
+        while len(state['results']) > BuildLock.max_results:
+          del state['results'][next(iter(state['results']))]
+        state['running'] = None
+        state['pid'] = None
+      return exceptions
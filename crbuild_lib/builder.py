@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
 
 import copy
+import functools
 import os
+import shutil
 import subprocess
 import sys
+import time
 
-from .command import Cmd
+from .adb_client import (AdbClient, AdbError)
+from .android_stack import AndroidStackSymbolizer
+from .apk_installer import ApkInstaller
+from .build_lock import BuildLock
+from .device_pool import DevicePool
+from .command import (Cmd, RunError)
+from .data_push import DataPusher
+from .env import Env
+from .failure_matcher import FailureMatcher
 from .gn import GN
+from .install_index import InstallIndex
+from .logcat import LogcatCapture
 from .models import NotFound
-from .stream_reader import StreamReader
+from .plan import Plan
+from .result_cache import ResultCache
+from .run_log import RunLog
+from .stream_reader import (PrefixedOutput, StreamReader)
+from .symbolizer import Symbolizer
+from .trace import (Tracer, tracer)
 from .variable_expander import VariableExpander
+from .xvfb_pool import (XvfbError, XvfbPool)
 
 class Builder(object):
   def __init__(self, options, config):
@@ -17,6 +36,18 @@ class Builder(object):
     self.config = config
     self.variable_expander = VariableExpander(options)
     self._gn = GN(options.env, self.variable_expander)
+    self._build_lock = BuildLock(self._build_dir())
+    self._result_cache = ResultCache(self._build_dir())
+    self._apk_installer = ApkInstaller()
+    self._install_index = InstallIndex(
+        os.path.join(Env.get_cache_dir(), 'installed_apks.json'))
+    self._data_pusher = DataPusher(
+        options.env.src_root_dir,
+        os.path.join(Env.get_cache_dir(), 'device_data'))
+    # (target name, device serial) -> result, when running on --devices.
+    self._device_results = {}
+    self._ninja_targets = {}  # Target name -> whether the build has it.
+    self._xvfb_pool = self._create_xvfb_pool()
     self._set_env_vars()
 
   # Linking on Windows can sometimes fail with this error:
@@ -123,7 +154,8 @@ class Builder(object):
     print('Deleting intermediate files...')
     if os.path.exists(self.options.gyp_state_path):
       os.remove(self.options.gyp_state_path)
-    self._delete_dir(self._build_dir())
+    with self._build_lock.exclusive():
+      self._delete_dir(self._build_dir())
 
   def _is_run_only(self, target_name):
     try:
@@ -155,8 +187,15 @@ class Builder(object):
         filter(lambda name: not self._is_run_only(name), target_names))
     cmd.extend(target_names_to_build)
     Cmd.print_ok(cmd, env_vars=None, add_quotes=True)
+    ninja_log_size = Tracer.ninja_log_size(build_dir)
+    start = time.time()
     try:
-      subprocess.check_call(cmd)
+      try:
+        with tracer.span('ninja', 'ninja', args={'targets': target_names}):
+          subprocess.check_call(cmd)
+      finally:
+        if self.options.trace_file:
+          tracer.import_ninja_log(build_dir, ninja_log_size, start)
       if (self.options.buildopts.is_asan and
           self.options.buildopts.target_os == 'win'):
         self._instrument_SyzyASan(build_dir)
@@ -164,9 +203,108 @@ class Builder(object):
     except subprocess.CalledProcessError as e:
       return [e]
 
-  def _run(self, run_command):
+  def _locked_build(self, target_names):
+    '''Build the specified GN target names while holding the build lock.
+
+    If another crbuild is already building these targets in the same build
+    dir then this waits for, and returns, that build's result.'''
+    # Decided now that gn has generated the build (see
+    # _get_incremental_wrapper).
+    target_names = set(target_names) | self._incremental_build_targets()
+    if self.options.noop:
+      return self._build(target_names)
+    return self._build_lock.build(target_names, self._build)
+
+  def _create_run_log(self, cmd, device=None, shard=None):
+    '''Create the RunLog capturing the output of (expanded) |cmd|.'''
+    if isinstance(cmd, list):
+      name = os.path.basename(cmd[0]) if cmd else 'run'
+    else:
+      name = os.path.basename(cmd.split()[0]) if cmd.strip() else 'run'
+    if device:
+      name += '-' + device
+    if shard:
+      name += '-shard%d' % shard.index
+    return RunLog(os.path.join(self._build_dir(), 'crbuild_logs'), name,
+                  stream_names=('out', 'err', 'logcat'))
+
+  def _logcat_device(self, run_command, device):
+    '''Return the serial of the Android device whose logcat is captured
+    while running |run_command|, or None.'''
+    if not device and self.options.buildopts.target_os == 'android':
+      device = self.options.target_android_device_serial
+    if not device or not self.options.capture_logcat or \
+        Builder._is_install_command(run_command):
+      return None
+    return device
+
+  def _start_logcat(self, run_command, device, sinks):
+    '''Start capturing the logcat of |device| returning the LogcatCapture
+    (or None).'''
+    package = run_command.package
+    if package:
+      package = self.variable_expander.expand_variables([package])[0]
+    logcat = LogcatCapture(device, sinks, package=package,
+                           tags=run_command.logcat_tags)
     try:
-      cmd = self.variable_expander.expand_variables(run_command.cmd_line())
+      logcat.start()
+    except (AdbError, OSError) as e:
+      print('[%s] Not capturing logcat: %s' % (device, e))
+      return None
+    return logcat
+
+  def _create_stack_symbolizer(self, output):
+    '''Return an AndroidStackSymbolizer writing to |output| (or None if
+    there is no llvm-symbolizer).'''
+    symbolizer = Symbolizer.get(self.options.env.src_root_dir)
+    if not symbolizer:
+      return None
+
+    def write(text):
+      output.buffer.write(text.encode('utf-8'))
+      output.flush()
+
+    return AndroidStackSymbolizer(self._build_dir(), symbolizer, write)
+
+  def _create_xvfb_pool(self):
+    '''Return the XvfbPool to run ${xvfb} commands on, or None if they are
+    to be run with testing/xvfb.py.'''
+    if not self.options.use_xvfb_pool or \
+        self.options.env.build_platform != 'linux':
+      return None
+    xvfb = XvfbPool.find_xvfb()
+    if not xvfb:
+      return None
+    return XvfbPool(os.path.join(Env.get_cache_dir(), 'xvfb'),
+                    self.options.env.num_cpus, xvfb)
+
+  @staticmethod
+  def _uses_xvfb(run_command):
+    return any('${xvfb}' in item for item in run_command.cmd_line())
+
+  def _run(self, run_command, device=None, shard=None):
+    '''Run |run_command|. If |device| is given the command is run for that
+    Android device (rather than the default) and its output is prefixed
+    with the device serial. |shard| is the Shard to run, if sharded.
+
+    Commands using ${xvfb} are run on a display leased from the XvfbPool,
+    if there is one, rather than by testing/xvfb.py.'''
+    if self._xvfb_pool and Builder._uses_xvfb(run_command):
+      try:
+        with self._xvfb_pool.lease() as display:
+          return self._run_command(run_command, device, shard, display)
+      except XvfbError as e:
+        print('%s, running with testing/xvfb.py' % e)
+    return self._run_command(run_command, device, shard)
+
+  def _run_command(self, run_command, device=None, shard=None, display=None):
+    try:
+      if device or shard or display:
+        variable_expander = VariableExpander(self.options, android_device=device,
+                                             shard=shard, display=display)
+      else:
+        variable_expander = self.variable_expander
+      cmd = variable_expander.expand_variables(run_command.cmd_line())
       if self.options.print_cmds:
         add_quotes = not run_command.shell
         if run_command.env_var:
@@ -175,25 +313,87 @@ class Builder(object):
         else:
           Cmd.print_ok(cmd, env_vars=None, add_quotes=add_quotes)
 
+      cache_key = None
+      # Results depend on the device's state, which isn't part of the key.
+      if run_command.cacheable and self.options.use_result_cache and \
+          not device:
+        cache_key = self._result_cache.key(
+            cmd, run_command.env_var,
+            self.variable_expander.expand_variables(run_command.data))
+        if self._result_cache.has_pass(cache_key):
+          print('Cached pass (nothing changed since last pass, use --no-cache '
+                'to rerun)')
+          return []
+
       symbolize = self.options.buildopts.is_asan or \
           self.options.buildopts.is_tsan
       my_env = os.environ.copy()
       if run_command.env_var:
         my_env[run_command.env_var.name] = run_command.env_var.values_str()
+      if device:
+        my_env['ANDROID_SERIAL'] = device
+      if display:
+        my_env['DISPLAY'] = display
+      run_log = self._create_run_log(cmd, device, shard)
+      matcher = FailureMatcher(run_command.failure_patterns,
+                               stream_names=('stdout', 'stderr', 'logcat'),
+                               highlight=Cmd._can_output_color())
+      if device:
+        prefix = '[%s %s] ' % (device, shard) if shard else '[%s] ' % device
+        outputs = [PrefixedOutput(sys.stdout, prefix),
+                   PrefixedOutput(sys.stderr, prefix)]
+      else:
+        outputs = [sys.stdout, sys.stderr]
+      logcat = None
+      stack_symbolizer = None
+      logcat_device = self._logcat_device(run_command, device)
+      if logcat_device:
+        sinks = [functools.partial(run_log.write, 2),
+                 functools.partial(matcher.process, 2)]
+        stack_symbolizer = self._create_stack_symbolizer(outputs[0])
+        if stack_symbolizer:
+          sinks.append(stack_symbolizer.process)
+        # Started first so the logcat from the very start of the run is kept.
+        logcat = self._start_logcat(run_command, logcat_device, sinks)
+      run_start = time.time()
       p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE, shell=run_command.shell)
-      stderr_symbolizer = StreamReader(p.stderr, sys.stderr,
-                                       self.options.env.src_root_dir,
-                                       symbolize)
-      stdout_symbolizer = StreamReader(p.stdout, sys.stdout,
-                                       self.options.env.src_root_dir,
-                                       symbolize)
+                           stderr=subprocess.PIPE, shell=run_command.shell,
+                           env=my_env)
+      # Flush so our output isn't reordered with the child's (which is
+      # written to the underlying binary buffer).
+      sys.stdout.flush()
+      sys.stderr.flush()
+      reader = StreamReader(list(zip([p.stdout, p.stderr], outputs)),
+                            self.options.env.src_root_dir, symbolize,
+                            sinks=[run_log.write], matcher=matcher)
       p.wait()
-      stderr_symbolizer.join()
-      stdout_symbolizer.join()
+      reader.join()
+      if logcat:
+        logcat.stop()
+      if stack_symbolizer:
+        stack_symbolizer.flush()
+        if p.returncode:
+          # In case the crash wasn't in the (filtered) logcat.
+          stack_symbolizer.read_tombstones(
+              AdbClient.get(), logcat_device,
+              int(time.time() - run_start) + 2)
+      for output in outputs:
+        if isinstance(output, PrefixedOutput):
+          output.close()
+      run_log.close()
+      tracer.add_event(os.path.basename(run_log.path), 'run', run_start,
+                       time.time() - run_start,
+                       args={'cmd': cmd, 'returncode': p.returncode})
+      for line in matcher.summary():
+        print(line)
       if p.returncode:
-        raise subprocess.CalledProcessError(returncode=p.returncode, cmd=cmd)
+        raise RunError(returncode=p.returncode, cmd=cmd,
+                       tail=run_log.tail(self.options.error_tail_lines),
+                       log_path=run_log.path,
+                       failures=[str(m) for m in matcher.matches])
 
+      if cache_key:
+        self._result_cache.add_pass(cache_key, cmd)
       return []
     except subprocess.CalledProcessError as e:
       return [e]
@@ -202,53 +402,356 @@ class Builder(object):
     return self.variable_expander.get_build_dir()
 
   def _need_to_re_gn(self):
+    with tracer.span('gn regen check', 'gn'):
+      try:
+        existing_args = self._gn.get_args()
+        preferred_args = self._gn.build_args(self.options)
+        return existing_args != preferred_args
+      except IOError:
+        # File not found (likely).
+        return True
+
+  def _gen(self):
+    '''Regenerate the GN build files if the build args have changed.'''
+    if not self._need_to_re_gn():
+      return []
+    with self._build_lock.exclusive():
+      # Another crbuild may have regenerated while we waited for the lock.
+      if not self._need_to_re_gn():
+        return []
+      try:
+        build_dir = self._build_dir()
+        if not os.path.isdir(build_dir):
+          # This creates the directory.
+          self._gn.gen(self.options)
+        self._gn.put_args(self._gn.build_args(self.options))
+        self._gn.gen(self.options)
+        return []
+      except subprocess.CalledProcessError as e:
+        return [e]
+
+  def _run_exclusive_resources(self):
+    '''The resources a run command holds while it is running.'''
+    # Run commands write directly to the console, so only one at a time.
+    resources = ['console']
+    if self.options.buildopts.target_os == 'android' and \
+        self.options.target_android_device_serial:
+      resources.append(self.options.target_android_device_serial)
+    return resources
+
+  @staticmethod
+  def _is_install_command(run_command):
+    '''Is this a "bin/<target>_apk install" run command?'''
+    return bool(run_command.args) and run_command.args[0] == 'install'
+
+  def _get_apks(self, target_name, install_commands):
+    '''Return the APKs to install for |target_name|: those listed in the
+    config, or else those its install wrapper script installs.'''
+    target = self.config.targets.get(target_name)
+    if target and target.apks:
+      return [os.path.join(self._build_dir(), apk) for apk in target.apks]
+    for run_command in install_commands:
+      wrapper = self.variable_expander.expand_variables(
+          run_command.commands[0]) if run_command.commands else None
+      apks = ApkInstaller.find_apks(wrapper) if wrapper else []
+      if apks:
+        return apks
+    return []
+
+  def _has_ninja_target(self, name):
+    '''Is |name| a target of the generated build?'''
+    if name not in self._ninja_targets:
+      try:
+        self._ninja_targets[name] = subprocess.run(
+            ['ninja', '-C', self._build_dir(), '-t', 'query', name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL).returncode == 0
+      except OSError:
+        self._ninja_targets[name] = False
+    return self._ninja_targets[name]
+
+  def _get_incremental_wrapper(self, install_commands):
+    '''Return the path to the bin/<target>_incremental wrapper script of an
+    install command, or None if the build has no such target (incremental
+    install targets are only generated for some builds). The build graph
+    decides, not whether the wrapper was built, so this is only called once
+    gn has generated the build.'''
+    for run_command in install_commands:
+      if not run_command.commands:
+        continue
+      wrapper = self.variable_expander.expand_variables(
+          run_command.commands[0]) + '_incremental'
+      if self._has_ninja_target(os.path.basename(wrapper)):
+        return wrapper
+    return None
+
+  def _incremental_build_targets(self):
+    '''Return the _incremental targets to also build so that APKs which
+    changed can be installed incrementally.'''
+    targets = set()
+    if not self.options.target_android_devices or \
+        not self.options.run_targets:
+      return targets
+    for target_name in self.options.active_targets:
+      try:
+        run_commands = self.config.get_run_commands(target_name, self.options)
+      except NotFound:
+        continue
+      wrapper = self._get_incremental_wrapper(
+          [c for c in run_commands if Builder._is_install_command(c)])
+      if wrapper:
+        targets.add(os.path.basename(wrapper))
+    return targets
+
+  def _install_incremental(self, device, wrapper):
+    cmd = [wrapper, 'install', '-d', device]
+    print('[%s] %s' % (device, ' '.join(cmd)))
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if p.returncode:
+      for line in p.stdout.decode('utf-8', errors='replace').splitlines():
+        print('[%s] %s' % (device, line))
+      raise subprocess.CalledProcessError(p.returncode, cmd)
+
+  def _install_apks(self, target_name, device, apks, install_commands):
+    '''Install |apks| on |device|, skipping those already installed. If the
+    main (first) APK changed and the target has an incremental install
+    wrapper (see |install_commands|) then that is used instead of a full
+    install.'''
+    for idx, apk in enumerate(apks):
+      if self.options.noop:
+        print('[%s] Installing %s' % (device, os.path.basename(apk)))
+        continue
+      try:
+        digest = self._install_index.digest(apk)
+        if not self.options.force_install and \
+            self._install_index.is_installed(device, apk, digest):
+          print('[%s] %s is up to date (use --force-install to reinstall)' %
+                (device, os.path.basename(apk)))
+          continue
+        incremental_wrapper = self._get_incremental_wrapper(
+            install_commands) if idx == 0 else None
+        if incremental_wrapper and os.path.isfile(incremental_wrapper):
+          self._install_incremental(device, incremental_wrapper)
+        else:
+          print('[%s] Installing %s' % (device, os.path.basename(apk)))
+          self._apk_installer.install(device, apk)
+        self._install_index.add(device, apk, digest)
+      except subprocess.CalledProcessError as e:
+        self._install_index.remove(device, apk)
+        self._device_results[(target_name, device)] = 'install failed'
+        return [e]
+    return []
+
+  def _get_device_data(self, run_commands):
+    '''Return the files/directories the run commands need on the device.'''
+    paths = []
+    for run_command in run_commands:
+      for path in self.variable_expander.expand_variables(
+          run_command.device_data):
+        if path not in paths:
+          paths.append(path)
+    return paths
+
+  def _push_device_data(self, target_name, device, paths):
+    if self.options.noop:
+      print('[%s] Pushing changed data files for %s: %s' % (
+          device, target_name, ' '.join(paths)))
+      return []
     try:
-      existing_args = self._gn.get_args()
-      preferred_args = self._gn.build_args(self.options)
-      return existing_args != preferred_args
-    except IOError:
-      # File not found (likely).
-      return True
+      count = self._data_pusher.push(device, paths)
+      print('[%s] Pushed %d changed data files for %s' % (device, count,
+                                                        target_name))
+    except subprocess.CalledProcessError as e:
+      self._device_results[(target_name, device)] = 'push failed'
+      return [e]
+    return []
 
-  def build(self):
-    if self.options.buildopts.target_os == 'win':
-      self._kill_pdb_server()
+  def _run_on_device(self, target_name, device, run_commands):
+    for run_command in run_commands:
+      errors = self._run(run_command, device)
+      if errors:
+        self._device_results[(target_name, device)] = 'failed'
+        return errors
+    self._device_results[(target_name, device)] = 'passed'
+    return []
 
-    if self.options.clobber:
-      self.clobber()
+  @staticmethod
+  def _is_shardable(run_command):
+    '''Does this run command use the ${shard_index}/${total_shards}
+    variables (and so can be sharded across devices)?'''
+    return any('${%s}' % var in item for item in run_command.cmd_line()
+               for var in VariableExpander.shard_variables)
 
-    if self._need_to_re_gn():
-      build_dir = self._build_dir()
-      if not os.path.isdir(build_dir):
-        # This creates the directory.
-        self._gn.gen(self.options)
-      self._gn.put_args(self._gn.build_args(self.options))
-      self._gn.gen(self.options)
+  def _run_sharded(self, target_name, apks, install_commands, device_data,
+                   run_commands):
+    '''Run the shardable run commands of |target_name| in shards over all
+    devices (see DevicePool). Each device first has the APKs installed, the
+    data pushed and runs the target's other run commands.'''
+    pool = DevicePool(self.options.target_android_devices)
+    if not pool.devices:
+      print('No online devices to run %s on.' % target_name)
+      return [subprocess.CalledProcessError(1, ['adb', 'devices'])]
+    setup_commands = [c for c in run_commands
+                      if not Builder._is_shardable(c)]
+    sharded_commands = [c for c in run_commands if Builder._is_shardable(c)]
+
+    def setup(device):
+      errors = self._install_apks(target_name, device, apks,
+                                  install_commands) if apks else []
+      if device_data and not errors:
+        errors = self._push_device_data(target_name, device, device_data)
+      for run_command in setup_commands:
+        if errors:
+          break
+        errors = self._run(run_command, device)
+      return errors
+
+    def run_shard(device, shard):
+      for run_command in sharded_commands:
+        errors = self._run(run_command, device, shard)
+        if errors:
+          return errors
+      return []
+
+    num_shards = self.options.num_shards or \
+        DevicePool.shards_per_device * len(pool.devices)
+    shards = pool.run(num_shards, run_shard, setup)
+    print()
+    print('%s:' % target_name)
+    for line in DevicePool.summary(shards):
+      print(line)
+    errors = []
+    for shard in shards:
+      if shard.exceptions is None:
+        errors.append(subprocess.CalledProcessError(
+            1, ['%s (%s not run)' % (target_name, shard)]))
+      else:
+        errors.extend(shard.exceptions)
+    return errors
+
+  def _add_device_steps(self, plan, build, target_name, run_commands):
+    '''Add steps to install |target_name| on, and run it on, every device
+    selected with --devices. Each device is independent, so a failure on
+    one device doesn't stop the others.'''
+    install_commands = [c for c in run_commands
+                        if Builder._is_install_command(c)]
+    apks = self._get_apks(target_name, install_commands)
+    device_data = self._get_device_data(run_commands)
+    if apks:
+      # Installed natively, all devices concurrently.
+      run_commands = [c for c in run_commands
+                      if not Builder._is_install_command(c)]
+    if any(Builder._is_shardable(c) for c in run_commands):
+      plan.add_step(
+          'run %s [sharded]' % target_name,
+          functools.partial(self._run_sharded, target_name, apks,
+                            install_commands, device_data, run_commands),
+          deps=[build], inputs=apks,
+          exclusive=list(self.options.target_android_devices), cost=30.0)
+      return
+    for device in self.options.target_android_devices:
+      install = None
+      push = None
+      if apks:
+        install = plan.add_step(
+            'install %s [%s]' % (target_name, device),
+            functools.partial(self._install_apks, target_name, device, apks,
+                              install_commands),
+            deps=[build], inputs=apks, exclusive=[device], cpus=0,
+            cost=20.0)
+      if device_data:
+        # Not exclusive: pushing data overlaps installing on the device.
+        push = plan.add_step(
+            'push data %s [%s]' % (target_name, device),
+            functools.partial(self._push_device_data, target_name, device,
+                              device_data),
+            deps=[build], cpus=0, cost=20.0)
+      if run_commands:
+        plan.add_step(
+            'run %s [%s]' % (target_name, device),
+            functools.partial(self._run_on_device, target_name, device,
+                              run_commands),
+            deps=[build, install, push], exclusive=[device], cost=10.0)
+
+  def _print_device_summary(self):
+    if not self.options.target_android_devices:
+      return
+    print()
+    print('Device summary:')
+    for target_name in self.options.active_targets:
+      for device in self.options.target_android_devices:
+        result = self._device_results.get((target_name, device))
+        if result:
+          print('  %-32s %-20s %s' % (target_name, device, result))
+
+  def create_plan(self):
+    '''Return the Plan containing all steps to build and run the targets.'''
+    build_dir = self._build_dir()
+    plan = Plan(self.options.env.num_cpus, self.options.env.memory_mb,
+                os.path.join(build_dir, '.crbuild_timings.json'))
+
+    pre_build = []
+    if self.options.buildopts.target_os == 'win':
+      pre_build.append(plan.add_step('kill_pdb_server', self._kill_pdb_server,
+                                     cost=1.0))
+    clobber = None
+    if self.options.clobber:
+      clobber = plan.add_step('clobber', self.clobber, outputs=[build_dir],
+                              cost=10.0)
+    gn = plan.add_step('gn', self._gen, deps=[clobber],
+                       inputs=[self._gn.args_path()],
+                       outputs=[os.path.join(build_dir, 'build.ninja')],
+                       cost=15.0)
 
-    exceptions = []
     build_targets = self.config.get_build_targets(
         self.options.active_targets, self.options)
     if not build_targets:
       build_targets = self.options.active_targets
-    exceptions.extend(self._build(build_targets))
-    if exceptions:
-      return exceptions
+    build = plan.add_step('build', functools.partial(self._locked_build,
+                                                     build_targets),
+                          deps=[gn] + pre_build,
+                          inputs=[os.path.join(build_dir, 'build.ninja')],
+                          cpus=self.options.env.num_cpus, cost=60.0)
 
     if not self.options.run_targets:
-      return exceptions
+      return plan
 
-    # Now run all executables
+    # Run commands for one target are run in order, stopping on the first
+    # error, but a failure does not stop the commands of other targets.
     for target_name in self.options.active_targets:
       try:
-        for run_command in self.config.get_run_commands(target_name, self.options):
-          e = self._run(run_command)
-          exceptions.extend(e)
-          if e:
-            # Stop on first error.
-            break
-        if self.options.profile:
-          # TODO: Re-add support for profiling message.
-          pass
+        run_commands = self.config.get_run_commands(target_name, self.options)
       except NotFound as e:
         print('Nothing to run for %s' % target_name)
-    return exceptions
+        continue
+      if self.options.target_android_devices:
+        self._add_device_steps(plan, build, target_name, run_commands)
+        continue
+      prev_step = build
+      device_data = self._get_device_data(run_commands)
+      device = self.options.target_android_device_serial
+      if device_data and self.options.buildopts.target_os == 'android' and \
+          device:
+        prev_step = plan.add_step(
+            'push data %s [%s]' % (target_name, device),
+            functools.partial(self._push_device_data, target_name, device,
+                              device_data),
+            deps=[prev_step], cpus=0, cost=20.0)
+      for idx, run_command in enumerate(run_commands):
+        prev_step = plan.add_step(
+            'run %s[%d]' % (target_name, idx),
+            functools.partial(self._run, run_command), deps=[prev_step],
+            exclusive=self._run_exclusive_resources(), cost=10.0)
+    return plan
+
+  def build(self):
+    plan = self.create_plan()
+    if self.options.print_plan:
+      plan.print_plan()
+      return []
+    try:
+      return plan.execute()
+    finally:
+      self._apk_installer.close()
+      Symbolizer.close_all()
+      self._print_device_summary()
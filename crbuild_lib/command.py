@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import platform
+import subprocess
 import sys
 
 class bcolors:
@@ -11,6 +12,20 @@ class bcolors:
     FAIL = '\033[91m'
     ENDC = '\033[0m'
 
+class RunError(subprocess.CalledProcessError):
+  '''A run command failed.
+
+  |tail| is a list of the last lines of output, |log_path| the path to
+  the full log and |failures| a list of the failure lines found in the
+  output (any may be None).'''
+
+  def __init__(self, returncode, cmd, tail=None, log_path=None,
+               failures=None):
+    super(RunError, self).__init__(returncode=returncode, cmd=cmd)
+    self.tail = tail
+    self.log_path = log_path
+    self.failures = failures
+
 class Cmd(object):
   '''Simple wrapper for executing and printing commands.'''
 
@@ -62,18 +77,32 @@ class Cmd(object):
     Cmd._print(cmd, env_vars, bcolors.OKBLUE, add_quotes)
 
   @staticmethod
-  def print_error(cmd, env_vars, add_quotes):
+  def print_error(cmd, env_vars, add_quotes, tail=None, log_path=None,
+                  failures=None):
     '''Print the error command to stdout.
 
     May supply a string of list of strings.
     |env_vars| is a printable string that would appear on the command-line
     such as 'FOO="bar" BAZ="45"'.
+    |tail| is an optional list of the last lines output by the command,
+    |log_path| the path to its full log and |failures| a list of the
+    failure lines found in its output.
     '''
     if isinstance(cmd, list):
       cmd = ['Failed: '] + cmd
     else:
       cmd = 'Failed: ' + cmd
     Cmd._print(cmd, env_vars, bcolors.FAIL, add_quotes)
+    if tail:
+      print('Last %d lines of output:' % len(tail))
+      for line in tail:
+        print('  ' + line)
+    if failures:
+      print('First failure: %s' % failures[0])
+      if len(failures) > 1:
+        print('(%d failure lines in total)' % len(failures))
+    if log_path:
+      print('Full log: %s' % log_path)
 
   @staticmethod
   def _can_output_color():
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import posixpath
+import shlex
+import subprocess
+import tarfile
+import threading
+import uuid
+
+from .adb_client import (AdbClient, AdbError)
+from .file_hash import FileHasher
+
+class DataPusher(object):
+  '''Pushes test data (files and directories below the source root) to
+  Android devices.
+
+  The digest of every file pushed to a device is remembered in a manifest
+  (one per device, in the crbuild cache directory) so only files changed
+  since the last push are sent, and they are sent as a single tar stream
+  extracted on the device rather than with one adb push per file.
+
+  Each manifest has a random id which is also written to the device. If the
+  device doesn't have the same id (it was wiped, or another host pushed to
+  it) all files are pushed again. Files removed on the host are not
+  removed from the device.
+  '''
+
+  device_root = '/sdcard/chromium_tests_root'
+  id_file = '.crbuild_manifest_id'
+
+  def __init__(self, src_root, manifest_dir, client=None, device_root=None):
+    self.src_root = src_root
+    self.manifest_dir = manifest_dir
+    self.device_root = device_root or DataPusher.device_root
+    self._client = client
+    self._lock = threading.Lock()
+    self._device_locks = {}
+    memo = {}
+    try:
+      with open(self._hashes_path(), 'r') as f:
+        memo = json.load(f)
+    except (IOError, ValueError):
+      pass
+    self._hasher = FileHasher(memo)
+
+  def _get_client(self):
+    return self._client or AdbClient.get()
+
+  def _hashes_path(self):
+    return os.path.join(self.manifest_dir, 'hashes.json')
+
+  def _manifest_path(self, serial):
+    return os.path.join(self.manifest_dir, '%s.json' % serial)
+
+  def _device_lock(self, serial):
+    with self._lock:
+      return self._device_locks.setdefault(serial, threading.Lock())
+
+  def _load_manifest(self, serial):
+    try:
+      with open(self._manifest_path(serial), 'r') as f:
+        manifest = json.load(f)
+        if manifest.get('root') == self.device_root:
+          return manifest
+    except (IOError, ValueError):
+      pass
+    return {'id': None, 'root': self.device_root, 'files': {}}
+
+  @staticmethod
+  def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(data, f)
+    os.replace(tmp_path, path)
+
+  def _save_manifest(self, serial, manifest):
+    DataPusher._write_json(self._manifest_path(serial), manifest)
+    with self._lock:
+      DataPusher._write_json(self._hashes_path(), self._hasher.memo)
+
+  def host_files(self, paths):
+    '''Return {device relative path: host path} of every file within
+    |paths| (files or directories, relative to the source root).'''
+    files = {}
+    for path in paths:
+      full_path = os.path.join(self.src_root, path)
+      if os.path.isfile(full_path):
+        full_paths = [full_path]
+      else:
+        full_paths = []
+        for root, dirs, names in os.walk(full_path):
+          dirs.sort()
+          full_paths.extend(os.path.join(root, n) for n in sorted(names))
+      for file_path in full_paths:
+        rel_path = os.path.relpath(file_path, self.src_root)
+        files[rel_path.replace(os.sep, '/')] = file_path
+    return files
+
+  def _digest(self, path):
+    with self._lock:
+      return self._hasher.hash_file(path)
+
+  def delta(self, paths, manifest):
+    '''Return {device relative path: (host path, digest)} of the files in
+    |paths| which differ from those recorded in |manifest|.'''
+    changed = {}
+    for rel_path, file_path in self.host_files(paths).items():
+      digest = self._digest(file_path)
+      if manifest['files'].get(rel_path) != digest:
+        changed[rel_path] = (file_path, digest)
+    return changed
+
+  def _device_id(self, serial):
+    returncode, out, _ = self._get_client().shell(
+        serial, 'cat %s 2>/dev/null' % shlex.quote(
+            posixpath.join(self.device_root, DataPusher.id_file)))
+    return out.decode('utf-8').strip() if returncode == 0 else None
+
+  def push(self, serial, paths):
+    '''Push the changed files within |paths| to the device, returning the
+    number of files pushed. Raises subprocess.CalledProcessError on
+    failure.'''
+    root = shlex.quote(self.device_root)
+    with self._device_lock(serial):
+      try:
+        manifest = self._load_manifest(serial)
+        if not manifest['id'] or manifest['id'] != self._device_id(serial):
+          manifest = {'id': uuid.uuid4().hex, 'root': self.device_root,
+                      'files': {}}
+        changed = self.delta(paths, manifest)
+        if not changed:
+          return 0
+        # The id is written last so an interrupted push is retried in full.
+        session = self._get_client().open_shell(
+            serial, 'mkdir -p %s && tar -xf - -C %s && echo %s > %s' % (
+                root, root, manifest['id'],
+                shlex.quote(posixpath.join(self.device_root,
+                                           DataPusher.id_file))))
+        with tarfile.open(fileobj=session, mode='w|',
+                          format=tarfile.GNU_FORMAT) as tar:
+          for rel_path in sorted(changed):
+            tar.add(changed[rel_path][0], arcname=rel_path, recursive=False)
+        session.close_stdin()
+        returncode, out, err = session.wait()
+      except (AdbError, OSError) as e:
+        print('[%s] %s' % (serial, e))
+        returncode, out, err = 1, b'', b''
+      if returncode:
+        for line in (out + err).decode('utf-8', 'replace').splitlines():
+          print('[%s] %s' % (serial, line))
+        raise subprocess.CalledProcessError(
+            returncode, ['adb', '-s', serial, 'shell', 'tar', '-x', '-C',
+                         self.device_root])
+      for rel_path, (_, digest) in changed.items():
+        manifest['files'][rel_path] = digest
+      self._save_manifest(serial, manifest)
+      return len(changed)
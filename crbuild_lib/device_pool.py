@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import threading
+
+from .adb_client import (AdbClient, AdbError)
+
+class Shard(object):
+  def __init__(self, index, total):
+    self.index = index
+    self.total = total
+    self.devices = []        # Every device the shard was run on.
+    self.exceptions = None   # None until the shard has been run.
+
+  def passed(self):
+    return self.exceptions is not None and not self.exceptions
+
+  def __repr__(self):
+    return 'shard %d/%d' % (self.index + 1, self.total)
+
+class DevicePool(object):
+  '''Runs the shards of a test suite on a pool of Android devices.
+
+  Shards are handed out dynamically (work stealing): every device takes the
+  next shard as soon as it finishes its previous one, so faster devices
+  run more shards and all devices finish at about the same time. A shard
+  which fails because its device went offline is put back for another
+  device, and that device leaves the pool. With |retry_failures| any failed
+  shard is put back for a device which hasn't yet run it.
+  '''
+
+  # The default number of shards: more shards than devices lets faster
+  # devices take more of the work.
+  shards_per_device = 2
+
+  def __init__(self, devices, is_online=None, max_attempts=3,
+               retry_failures=False):
+    """
+    devices: serials of the devices to use (devices not currently online are
+             ignored).
+    is_online: function(serial) returning whether a device is (still)
+               online. Defaults to asking the adb server.
+    max_attempts: the most devices a shard is run on.
+    retry_failures: whether failed shards are run again on another device.
+    """
+    self._is_online = is_online or DevicePool._adb_is_online
+    self.devices = [d for d in devices if self._is_online(d)]
+    self.max_attempts = max_attempts
+    self.retry_failures = retry_failures
+    self._cond = threading.Condition()
+
+  @staticmethod
+  def _adb_is_online(serial):
+    try:
+      return AdbClient.get().devices().get(serial) == 'device'
+    except (AdbError, OSError):
+      return False
+
+  def run(self, num_shards, run_shard, setup=None):
+    '''Run |num_shards| shards returning the list of Shard.
+
+    run_shard: function(device, shard) returning a list of exceptions.
+    setup: optional function(device) returning a list of exceptions, called
+           before a device takes its first shard. Devices failing setup
+           are not used.
+    '''
+    shards = [Shard(i, num_shards) for i in range(num_shards)]
+    pending = list(shards)
+    state = {'running': 0}
+    # Devices which may yet run shards.
+    live = set(self.devices)
+
+    def next_shard(device):
+      '''Return the next shard for |device| to run, or None when done.'''
+      with self._cond:
+        while True:
+          # A shard is never run twice on the same device.
+          for shard in pending:
+            if device not in shard.devices:
+              pending.remove(shard)
+              state['running'] += 1
+              return shard
+          if not state['running']:
+            return None
+          # A running shard may yet be requeued.
+          self._cond.wait()
+
+    def finish_shard(device, shard, exceptions, offline):
+      with self._cond:
+        state['running'] -= 1
+        if len(shard.devices) >= self.max_attempts or not exceptions:
+          shard.exceptions = exceptions
+        elif offline:
+          pending.insert(0, shard)
+        elif self.retry_failures and \
+            any(d not in shard.devices for d in live):
+          print('[%s] %s failed, retrying on another device.' % (device,
+                                                                 shard))
+          shard.exceptions = exceptions  # Unless a retry is run.
+          pending.insert(0, shard)
+        else:
+          shard.exceptions = exceptions
+        self._cond.notify_all()
+
+    def run_shards(device):
+      try:
+        if setup and setup(device):
+          return
+      except Exception as e:
+        print('[%s] Setup failed: %s' % (device, e))
+        return
+      while True:
+        shard = next_shard(device)
+        if not shard:
+          return
+        shard.devices.append(device)
+        try:
+          exceptions = run_shard(device, shard) or []
+        except Exception as e:
+          exceptions = [e]
+        offline = bool(exceptions) and not self._is_online(device)
+        finish_shard(device, shard, exceptions, offline)
+        if offline:
+          print('[%s] Device went offline, leaving the pool.' % device)
+          return
+
+    def worker(device):
+      try:
+        run_shards(device)
+      finally:
+        with self._cond:
+          live.discard(device)
+          self._cond.notify_all()
+
+    threads = [threading.Thread(target=worker, args=(device,))
+               for device in self.devices]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return shards
+
+  @staticmethod
+  def summary(shards):
+    '''Return a list of lines summarizing the results of all shards.'''
+    passed = sum(1 for s in shards if s.passed())
+    lines = ['%d of %d shards passed' % (passed, len(shards))]
+    for shard in shards:
+      if shard.exceptions is None:
+        result = 'not run (no devices left)'
+      elif shard.exceptions:
+        result = 'failed'
+      else:
+        result = 'passed'
+      devices = ' -> '.join(shard.devices)
+      lines.append('  %-12s %-8s %s' % (shard, result, devices))
+    return lines
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 
 import multiprocessing
+import os
 import platform
 
 from .adb import Adb
+from .trace import tracer
 
 class Env(object):
   '''Attributes of the environment (host, location, etc.).'''
@@ -18,6 +20,7 @@ class Env(object):
     self.gclient_path = gclient_path
     self.api_keys_path = api_keys_path
     self.num_cpus = multiprocessing.cpu_count()
+    self.memory_mb = Env.get_memory_mb()
     self.build_platform = Env.get_build_platform()
     # None means the info hasn't been retrieved (using Adb). This allows tests
     # to set it, and if not set Adb will be used.
@@ -26,13 +29,34 @@ class Env(object):
   @property
   def android_devices(self):
     if self._devices is None:
-      self._devices = Adb.get_device_info()
+      with tracer.span('android device discovery', 'env'):
+        # Only lists the devices; each DeviceInfo is queried on first use.
+        self._devices = Adb.get_device_info()
     return self._devices
 
   @android_devices.setter
   def android_devices(self, info):
     self._devices = info
 
+  @staticmethod
+  def get_cache_dir():
+    '''Return the directory where crbuild caches data between invocations.'''
+    if os.name == 'nt':
+      base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+      base = os.environ.get('XDG_CACHE_HOME',
+                            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'crbuild')
+
+  @staticmethod
+  def get_memory_mb():
+    '''Return the amount of physical memory (in MB) or None if unknown.'''
+    try:
+      return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') /
+                 (1024 * 1024))
+    except (AttributeError, ValueError, OSError):
+      return None
+
   @staticmethod
   def get_build_platform():
     '''Return the name of the platform on which the build is running.
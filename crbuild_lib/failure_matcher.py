@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import re
+import threading
+
+from .command import bcolors
+
+class FailureMatch(object):
+  def __init__(self, stream_name, line_number, pattern, line):
+    self.stream_name = stream_name
+    self.line_number = line_number
+    self.pattern = pattern
+    self.line = line
+
+  def __str__(self):
+    return '%s:%d: %s' % (self.stream_name, self.line_number, self.line)
+
+class FailureMatcher(object):
+  '''Finds failure signatures in output as it is produced.
+
+  All patterns are literal strings compiled into a single regular expression
+  (an alternation) which is run over each whole chunk of output - not line
+  by line - by the C regex engine. Line numbers are only computed for the
+  (rare) chunks that contain a match.
+  '''
+
+  default_patterns = (
+      '[  FAILED  ]',
+      'Check failed:',
+      'DCHECK failed',
+      'ERROR: AddressSanitizer',
+      'ERROR: LeakSanitizer',
+      'WARNING: MemorySanitizer',
+      'WARNING: ThreadSanitizer',
+      'runtime error:',
+  )
+  # The number of matches to remember (the rest are only counted).
+  max_matches = 100
+  # The longest partial line kept to find matches split across chunks.
+  max_carry = 4096
+
+  def __init__(self, patterns=None, stream_names=('stdout', 'stderr'),
+               highlight=False):
+    self.patterns = list(FailureMatcher.default_patterns)
+    for pattern in patterns or []:
+      if pattern not in self.patterns:
+        self.patterns.append(pattern)
+    # Longest first so the longest of overlapping patterns is reported.
+    alternatives = sorted(self.patterns, key=len, reverse=True)
+    self._re = re.compile(b'|'.join(re.escape(p.encode('utf-8'))
+                                    for p in alternatives))
+    self._stream_names = stream_names
+    self._highlight = highlight
+    self._lock = threading.Lock()
+    self._line_numbers = [1] * len(stream_names)
+    self._carry = [b''] * len(stream_names)
+    self.matches = []
+    self.num_matches = 0
+
+  def process(self, stream_index, data):
+    '''Scan |data| read from the given stream, and return it (highlighted if
+    enabled).'''
+    carry = self._carry[stream_index]
+    buf = carry + data if carry else data
+    line_number = self._line_numbers[stream_index]
+    out = []
+    data_pos = 0
+    pos = 0
+    for m in self._re.finditer(buf):
+      if m.end() <= len(carry):
+        continue  # Already found in the previous chunk.
+      line_number += buf.count(b'\n', pos, m.start())
+      pos = m.start()
+      line_start = buf.rfind(b'\n', 0, m.start()) + 1
+      line_end = buf.find(b'\n', m.end())
+      if line_end == -1:
+        line_end = len(buf)
+      with self._lock:
+        self.num_matches += 1
+        if len(self.matches) < FailureMatcher.max_matches:
+          self.matches.append(FailureMatch(
+              self._stream_names[stream_index], line_number,
+              m.group(0).decode('utf-8'),
+              buf[line_start:line_end].decode('utf-8', errors='replace')))
+      start = m.start() - len(carry)
+      if self._highlight and start >= 0:
+        out.append(data[data_pos:start])
+        out.append(bcolors.FAIL.encode('utf-8') + m.group(0) +
+                   bcolors.ENDC.encode('utf-8'))
+        data_pos = m.end() - len(carry)
+
+    newlines = data.count(b'\n')
+    self._line_numbers[stream_index] += newlines
+    if newlines:
+      carry = data[data.rfind(b'\n') + 1:]
+    else:
+      carry = buf
+    self._carry[stream_index] = carry[-FailureMatcher.max_carry:]
+    if not out:
+      return data
+    out.append(data[data_pos:])
+    return b''.join(out)
+
+  def summary(self):
+    '''Return a list of lines summarizing the matches.'''
+    if not self.num_matches:
+      return []
+    lines = ['%d failure line(s) found:' % self.num_matches]
+    lines.extend('  %s' % m for m in self.matches)
+    if self.num_matches > len(self.matches):
+      lines.append('  ... and %d more' % (self.num_matches - len(self.matches)))
+    return lines
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+
+class FileHasher(object):
+  '''Computes SHA-256 digests of files and directories.
+
+  Digests are memoized by (size, mtime) so unchanged files - even very
+  large ones - are only read once. The memo is a plain dictionary so that
+  callers can persist it.
+  '''
+
+  chunk_size = 1024 * 1024
+
+  def __init__(self, memo=None):
+    self.memo = memo if memo is not None else {}
+
+  @staticmethod
+  def _digest_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+      for chunk in iter(lambda: f.read(FileHasher.chunk_size), b''):
+        h.update(chunk)
+    return h.hexdigest()
+
+  def hash_file(self, path):
+    '''Return the hex digest of the file at |path|.'''
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    entry = self.memo.get(path)
+    if entry and entry[:2] == stamp:
+      return entry[2]
+    digest = FileHasher._digest_file(path)
+    self.memo[path] = stamp + [digest]
+    return digest
+
+  def hash_path(self, path):
+    '''Return the hex digest of a file, or of all files within a directory.
+
+    A path which does not exist has a digest of None.'''
+    if os.path.isfile(path):
+      return self.hash_file(path)
+    if not os.path.isdir(path):
+      return None
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+      dirs.sort()
+      for name in sorted(files):
+        file_path = os.path.join(root, name)
+        h.update(os.path.relpath(file_path, path).encode('utf-8'))
+        h.update(self.hash_file(file_path).encode('utf-8'))
+    return h.hexdigest()
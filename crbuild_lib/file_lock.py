@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+  import msvcrt
+
+class FileLock(object):
+  '''An inter-process lock held on a file.
+
+  The lock is released by the OS if the process holding it dies, so a
+  crashed crbuild never leaves a stale lock behind.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    self._fd = None
+
+  def _try_lock(self, fd):
+    try:
+      if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      else:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+      return True
+    except (BlockingIOError, PermissionError):
+      return False
+    except OSError as e:
+      # msvcrt raises a plain OSError (EACCES/EDEADLOCK) when locked.
+      if fcntl:
+        raise
+      return False
+
+  def acquire(self, blocking=True):
+    '''Acquire the lock. Returns False if |blocking| is False and the lock is
+    held by another process.'''
+    assert self._fd is None
+    dir_name = os.path.dirname(self.path)
+    if dir_name and not os.path.isdir(dir_name):
+      os.makedirs(dir_name, exist_ok=True)
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl and blocking:
+      fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+      while not self._try_lock(fd):
+        if not blocking:
+          os.close(fd)
+          return False
+        time.sleep(0.1)
+    self._fd = fd
+    return True
+
+  def release(self):
+    assert self._fd is not None
+    if fcntl:
+      fcntl.flock(self._fd, fcntl.LOCK_UN)
+    else:
+      msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+    os.close(self._fd)
+    self._fd = None
+
+  def locked(self):
+    '''Return True if this instance holds the lock.'''
+    return self._fd is not None
+
+  def __enter__(self):
+    self.acquire()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.release()
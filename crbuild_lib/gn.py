@@ -5,6 +5,7 @@ import re
 import subprocess
 
 from .command import Cmd
+from .trace import tracer
 
 class GN(object):
   '''This module is for interacting with GN.'''
@@ -149,4 +150,5 @@ class GN(object):
       return
     # If build_dir doesn't exist then Windows fails with default shell=False
     shell = self._env.build_platform == 'win'
-    subprocess.check_call(cmd, shell=shell)
+    with tracer.span('gn gen', 'gn'):
+      subprocess.check_call(cmd, shell=shell)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+
+from .file_hash import FileHasher
+
+class InstallIndex(object):
+  '''Remembers the digest of every APK crbuild installed on each device, so
+  that installing an unchanged APK again can be skipped without querying
+  the device.
+
+  APKs are identified by file name (e.g. ChromePublic.apk) rather than path
+  so that installing the same APK from a different build directory replaces
+  the entry. The index is shared by all build directories (devices are) and
+  is stored in the crbuild cache directory.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._devices = {}
+    memo = {}
+    try:
+      with open(path, 'r') as f:
+        data = json.load(f)
+        self._devices = data['devices']
+        memo = data['hashes']
+    except (IOError, ValueError, KeyError):
+      pass
+    self._hasher = FileHasher(memo)
+
+  def digest(self, apk_path):
+    with self._lock:
+      return self._hasher.hash_file(apk_path)
+
+  def is_installed(self, serial, apk_path, digest):
+    with self._lock:
+      entry = self._devices.get(serial, {}).get(os.path.basename(apk_path))
+      return bool(entry) and entry['hash'] == digest
+
+  def add(self, serial, apk_path, digest):
+    with self._lock:
+      self._devices.setdefault(serial, {})[os.path.basename(apk_path)] = {
+          'hash': digest, 'path': apk_path, 'time': time.time()}
+      self._save(serial)
+
+  def remove(self, serial, apk_path):
+    '''Forget an APK, e.g. because its install failed part way.'''
+    with self._lock:
+      self._devices.get(serial, {}).pop(os.path.basename(apk_path), None)
+      self._save(serial)
+
+  def _save(self, serial):
+    # Another crbuild may have installed to other devices since the index
+    # was read, so only this device's entries are replaced.
+    devices = {}
+    try:
+      with open(self.path, 'r') as f:
+        devices = json.load(f)['devices']
+    except (IOError, ValueError, KeyError):
+      pass
+    devices[serial] = self._devices.get(serial, {})
+    self._devices.update(devices)
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump({'devices': devices, 'hashes': self._hasher.memo}, f)
+    os.replace(tmp_path, self.path)
@@ -56,6 +56,30 @@ class ConfigReader(object):
         run_command.args = [config['args']]
       else:
         run_command.args = config['args']
+    if 'cacheable' in config:
+      run_command.cacheable = bool(config['cacheable'])
+    if 'data' in config:
+      if isinstance(config['data'], str):
+        run_command.data = [config['data']]
+      else:
+        run_command.data = config['data']
+    if 'device_data' in config:
+      if isinstance(config['device_data'], str):
+        run_command.device_data = [config['device_data']]
+      else:
+        run_command.device_data = config['device_data']
+    if 'package' in config:
+      run_command.package = config['package']
+    if 'logcat_tags' in config:
+      if isinstance(config['logcat_tags'], str):
+        run_command.logcat_tags = [config['logcat_tags']]
+      else:
+        run_command.logcat_tags = config['logcat_tags']
+    if 'failure_patterns' in config:
+      if isinstance(config['failure_patterns'], str):
+        run_command.failure_patterns = [config['failure_patterns']]
+      else:
+        run_command.failure_patterns = config['failure_patterns']
     if 'env' in config:
       e = config['env']
       assert(isinstance(e, dict))
@@ -129,6 +153,12 @@ class ConfigReader(object):
         if 'title' in target_params:
           target.title = target_params['title']
 
+        if 'apk' in target_params:
+          if isinstance(target_params['apk'], str):
+            target.apks = [target_params['apk']]
+          else:
+            target.apks = target_params['apk']
+
         if 'options' in target_params:
           options = target_params['options']
           if isinstance(options, str) and options == 'run_only':
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import shlex
+import socket
+import threading
+
+from .adb_client import (AdbClient, AdbError)
+
+class LogcatCapture(object):
+  '''Captures an Android device's logcat while a command runs.
+
+  Filtering is done by logcat on the device so only the wanted lines are
+  sent: by tag (if |tags| are given) and by the PID of |package| (if given).
+  The package's process usually doesn't exist until the command starts it,
+  so it is polled for; when it appears (or is restarted with a new PID) the
+  logcat stream is (re)started from the time of the previous poll, so no
+  lines are missed. Without a package the stream starts immediately.
+
+  Native crashes are logged by debuggerd (crash_dump), not the crashing
+  process, so the crash_tags are always captured: with a package they are
+  read from a second stream, not filtered by PID.
+
+  Output is passed, as whole lines, to each of |sinks| (functions(data)).
+  '''
+
+  poll_interval = 1.0
+  crash_tags = ('DEBUG', 'libc')
+  # logcat -T takes a time in this format.
+  date_format = '+%m-%d %H:%M:%S.000'
+
+  def __init__(self, serial, sinks, package=None, tags=None, client=None):
+    self.serial = serial
+    self.package = package
+    self.tags = tags or []
+    self._sinks = sinks
+    self._client = client
+    self._stopped = threading.Event()
+    self._thread = None
+    self._lock = threading.Lock()  # Held while passing output to the sinks.
+
+  def _get_client(self):
+    return self._client or AdbClient.get()
+
+  def _poll(self):
+    '''Return (PID of the package or None, device time).'''
+    command = 'date %s' % shlex.quote(LogcatCapture.date_format)
+    if self.package:
+      command = 'pidof -s %s; %s' % (shlex.quote(self.package), command)
+    _, out, _ = self._get_client().shell(self.serial, command)
+    lines = out.decode('utf-8').split('\n')
+    lines = [line.strip() for line in lines if line.strip()]
+    if not lines:
+      raise AdbError('%s: no output' % command)
+    return (lines[0] if len(lines) > 1 else None, lines[-1])
+
+  def command(self, since, pid=None):
+    '''Return the logcat command line for output after |since|. With a
+    |pid| the crash_tags are left to the crash_command stream.'''
+    cmd = ['logcat', '-v', 'threadtime', '-T', since]
+    if pid:
+      cmd.append('--pid=%s' % pid)
+      tags = [t for t in self.tags if t not in LogcatCapture.crash_tags]
+      if not self.tags:
+        cmd.extend('%s:S' % tag for tag in LogcatCapture.crash_tags)
+    else:
+      tags = list(self.tags) + [t for t in LogcatCapture.crash_tags
+                                if t not in self.tags]
+    if self.tags:
+      cmd.extend('%s:V' % tag for tag in tags)
+      cmd.append('*:S')
+    return ' '.join(shlex.quote(arg) for arg in cmd)
+
+  def crash_command(self, since):
+    '''Return the logcat command line for crash output (of any process)
+    after |since|.'''
+    cmd = ['logcat', '-v', 'threadtime', '-T', since]
+    cmd.extend('%s:V' % tag for tag in LogcatCapture.crash_tags)
+    cmd.append('*:S')
+    return ' '.join(shlex.quote(arg) for arg in cmd)
+
+  def start(self):
+    '''Start capturing. Raises AdbError/OSError if the device can't be
+    reached.'''
+    _, since = self._poll()
+    self._thread = threading.Thread(target=self._capture, args=(since,))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _write(self, data):
+    with self._lock:
+      for sink in self._sinks:
+        sink(data)
+
+  def _read(self, sock):
+    # Only whole lines are written, so those of two streams don't mix.
+    partial = b''
+    try:
+      while True:
+        data = sock.recv(64 * 1024)
+        if not data:
+          break
+        data = partial + data
+        cut = data.rfind(b'\n') + 1
+        partial = data[cut:]
+        if cut:
+          self._write(data[:cut])
+    except OSError:
+      pass  # Closed by _close_stream.
+    if partial:
+      self._write(partial)
+
+  def _open_stream(self, command):
+    '''Start streaming the output of a logcat |command|, returning the
+    stream to pass to _close_stream.'''
+    sock = self._get_client().open_exec(self.serial, command)
+    reader = threading.Thread(target=self._read, args=(sock,))
+    reader.daemon = True
+    reader.start()
+    return (sock, reader)
+
+  @staticmethod
+  def _close_stream(stream):
+    if not stream:
+      return
+    sock, reader = stream
+    try:
+      sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    reader.join()
+    sock.close()
+
+  def _capture(self, since):
+    pid = None
+    stream = None
+    crash_stream = None
+    try:
+      if not self.package:
+        stream = self._open_stream(self.command(since))
+        self._stopped.wait()
+        return
+      crash_stream = self._open_stream(self.crash_command(since))
+      while True:
+        new_pid, now = self._poll()
+        if new_pid and new_pid != pid:
+          LogcatCapture._close_stream(stream)
+          pid = new_pid
+          stream = self._open_stream(self.command(since, pid))
+        since = now
+        if self._stopped.wait(LogcatCapture.poll_interval):
+          return
+    except (AdbError, OSError) as e:
+      print('[%s] logcat capture failed: %s' % (self.serial, e))
+    finally:
+      LogcatCapture._close_stream(stream)
+      LogcatCapture._close_stream(crash_stream)
+
+  def stop(self):
+    '''Stop capturing, waiting for output already received to be passed to
+    the sinks.'''
+    self._stopped.set()
+    if self._thread:
+      self._thread.join()
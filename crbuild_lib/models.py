@@ -58,6 +58,12 @@ class RunCommand(object):
     self.args = []
     self.env_var = None
     self.shell = False
+    self.cacheable = False  # True if passing results can be cached.
+    self.data = []          # Files/directories read when run.
+    self.device_data = []   # Files/directories pushed to Android devices.
+    self.package = None     # Android package whose logcat is captured.
+    self.logcat_tags = []   # Logcat tags captured (empty for all tags).
+    self.failure_patterns = []  # Output indicating failure (+ defaults).
 
   def cmd_line(self):
     if self.commands:
@@ -101,6 +107,7 @@ class Target(object):
     self.reference_self = True
     self.executable_names = None
     self.run_only = False
+    self.apks = None              # APKs to install (relative to build dir).
 
   def get_build_targets(self, options):
     '''Given a Target.name return an array of GN build targets.
@@ -10,6 +10,7 @@ import sys
 from .build_settings import BuildSettings
 from .gclient import GClient
 from . import git
+from .trace import tracer
 
 class InvalidOption(Exception):
   pass
@@ -23,20 +24,25 @@ class Options(object):
   valid_cpus = valid_arm_cpus + valid_x86_cpus + valid_mips_cpus
 
   def __init__(self, env, config):
-    self.gclient = GClient(env.gclient_path)
+    with tracer.span('read .gclient', 'env'):
+      self.gclient = GClient(env.gclient_path)
     self._config = config
     self.env = env
-    self.buildopts = BuildSettings(git.CurrentBranch(),
-                                   self.gclient.default_target_os)
+    with tracer.span('git current branch', 'env'):
+      branch = git.CurrentBranch()
+    self.buildopts = BuildSettings(branch, self.gclient.default_target_os)
     self.keep_going = True
     self.sudo_pwd = None
     self.verbosity = 0
     self.print_cmds = True
     self.noop = False
+    self.print_plan = False
     self.regyp = False
-    self.buildopts.goma_dir = Options._get_goma_dir()
+    with tracer.span('goma dir', 'env'):
+      self.buildopts.goma_dir = Options._get_goma_dir()
     if self.buildopts.use_goma:
-      self.buildopts.use_goma = Options._is_goma_running()
+      with tracer.span('goma status', 'env'):
+        self.buildopts.use_goma = Options._is_goma_running()
     self.llvm_path = os.path.join(env.src_root_dir, 'third_party', 'llvm-build',
                                   'Release+Asserts', 'bin')
     if not os.path.exists(self.llvm_path):
@@ -57,8 +63,18 @@ class Options(object):
     self.heap_profiling = False
     self.profile_file = '/tmp/cpuprofile'
     self.run_targets = True
+    self.use_result_cache = True
+    self.trace_file = None
+    self.error_tail_lines = 40
     self.gtest = None
     self.target_android_device_serial = None
+    # Devices to install to, and run on, concurrently (--devices).
+    self.target_android_devices = []
+    self.force_install = False
+    self.num_shards = None
+    self.capture_logcat = True
+    # Run ${xvfb} commands on a leased, long lived Xvfb display (XvfbPool).
+    self.use_xvfb_pool = True
 
   @staticmethod
   def _goma_ctl():
@@ -142,6 +158,18 @@ class Options(object):
                         help="Don't do anything, print what would be done")
     parser.add_argument('-R', '--no-run', action='store_true',
                         help='Do not run targets after building.')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Run cacheable run commands even when nothing '
+                        'they depend on has changed since they last passed.')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                        help='Write a timeline of this invocation (viewable '
+                        'in chrome://tracing) to FILE.')
+    parser.add_argument('--profile-self', action='store_true',
+                        help='Profile crbuild itself (not the build) and '
+                        'print the slowest functions on exit.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Print the execution plan (with estimated '
+                        'timings) and exit.')
     parser.add_argument('--cfi',
                         type=Options.str2bool, nargs='?',
                         const=True, default=self.buildopts.is_cfi,
@@ -185,6 +213,23 @@ class Options(object):
                                                          'architecture')
     parser.add_argument('--device', type=str, nargs=1, help='The target Android'
                                                             ' device.')
+    parser.add_argument('--devices', type=str, metavar='all|SERIAL,...',
+                        help='Install to, and run on, each of these Android '
+                        'devices concurrently.')
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help='With several devices, the number of shards to '
+                        'split run commands using ${shard_index} into '
+                        '(default: 2 per device).')
+    parser.add_argument('--no-logcat', action='store_true',
+                        help="Don't capture the Android device's logcat into "
+                        'the run log while running.')
+    parser.add_argument('--no-xvfb-pool', action='store_true',
+                        help='Run commands using ${xvfb} with testing/xvfb.py '
+                        '(a new X server each run) rather than on a '
+                        'persistent Xvfb display.')
+    parser.add_argument('--force-install', action='store_true',
+                        help='With --devices, install APKs even if they are '
+                        'unchanged since last installed.')
     parser.add_argument('-p', '--profile', action='store_true',
                         help="Profile the executable")
     parser.add_argument('-j', '--jobs',
@@ -240,6 +285,20 @@ GN files."""
       self.noop = True
     if namespace.no_run:
       self.run_targets = False
+    if namespace.no_cache:
+      self.use_result_cache = False
+    if namespace.plan:
+      self.print_plan = True
+    if namespace.shards:
+      self.num_shards = namespace.shards
+    if namespace.force_install:
+      self.force_install = True
+    if namespace.no_logcat:
+      self.capture_logcat = False
+    if namespace.no_xvfb_pool:
+      self.use_xvfb_pool = False
+    if namespace.trace:
+      self.trace_file = namespace.trace
     if namespace.use_clang:
       self.buildopts.use_clang = True
     elif namespace.no_use_clang:
@@ -350,13 +409,44 @@ GN files."""
     self.gtest = Options.fixup_google_test_filter_args(namespace.gtest)
     self.active_targets = namespace.target
     if self.buildopts.target_os == 'android':
+      if namespace.devices:
+        self.target_android_devices = Options.select_android_devices(
+            namespace.devices, self.env.android_devices)
+        if not self.target_android_device_serial:
+          self.target_android_device_serial = self.target_android_devices[0]
+        if not self.buildopts.target_cpu:
+          self.buildopts.target_cpu = \
+              self.env.android_devices[self.target_android_device_serial].cpu_abi
       self.set_android_defaults()
+      for serial in self.target_android_devices:
+        device_cpu = self.env.android_devices[serial].cpu_abi
+        if not Options._build_cpu_matches_device(self.buildopts.target_cpu,
+                                                 device_cpu):
+          raise InvalidOption(str.format(
+              'Device {0} CPU ("{1}") does not match target CPU ("{2}")',
+              serial, device_cpu, self.buildopts.target_cpu))
       if self.target_android_device_serial:
         # system_webview_package_name only works on N+.
         # Also, this may change args.gn every build, but that's OK.
         self.buildopts.system_webview_package_name = \
             self._get_system_webview_package_name(self.target_android_device_serial)
 
+  @staticmethod
+  def select_android_devices(spec, android_devices):
+    '''Return the list of device serials selected by |spec| - "all" or a comma
+    separated list of serials.'''
+    if spec == 'all':
+      serials = list(android_devices)
+      if not serials:
+        raise InvalidOption('No Android devices attached.')
+      return serials
+    serials = [s.strip() for s in spec.split(',') if s.strip()]
+    for serial in serials:
+      if serial not in android_devices:
+        raise InvalidOption(str.format('No such device "{0}". Must be one of {1}',
+                                       serial, list(android_devices)))
+    return serials
+
   @staticmethod
   def _build_cpu_matches_device(build_cpu, device_cpu):
     # https://chromium.googlesource.com/chromium/src/+/HEAD/docs/android_build_instructions.md#figuring-out-target_cpu
@@ -374,9 +464,11 @@ GN files."""
 
     Generally the rule is:
       1. If both are specified then validate and use.
-      2. If none are specified then:
+      2. If only the CPU is specified then use all devices with that CPU.
+      3. If none are specified then:
         a. If only one device then use it.
-        b. else error.
+        b. If all devices have the same CPU then use them all.
+        c. else error.
     """
     assert self.buildopts.target_os == 'android'
     if self.buildopts.target_cpu and \
@@ -401,27 +493,33 @@ GN files."""
         self.buildopts.target_cpu = device_info.cpu_abi
         self.target_android_device_serial = device_info.serial
         return
-      raise Exception('There are ' + str(num_devices) + ' devices. Specify one with '
-                      '--cpu or --device options.')
+      cpus = set(d.cpu_abi for d in self.env.android_devices.values())
+      if len(cpus) == 1:
+        # All devices can run the same build, so use them all.
+        self.target_android_devices = list(self.env.android_devices)
+        self.buildopts.target_cpu = cpus.pop()
+        self.target_android_device_serial = self.target_android_devices[0]
+        return
+      raise Exception('There are ' + str(num_devices) + ' devices with '
+                      'different CPUs. Specify one with --cpu or --device '
+                      'options.')
 
     if self.buildopts.target_cpu:
-      # Find the first device whose CPU type matches the target CPU. If there
-      # is more than one then error because this is ambiguous.
-      matching_device = None
+      # Use every device whose CPU type matches the target CPU (the first
+      # being the default device).
+      matching_devices = []
       cpus = []
       for _, device_info in self.env.android_devices.items():
         cpus.append(device_info.cpu_abi)
         if Options._build_cpu_matches_device(self.buildopts.target_cpu,
                                              device_info.cpu_abi):
-          if matching_device:
-            raise Exception(str.format('There are multiple devices with "%s"'
-                                       ' CPU. Specify with --device option.',
-                                       self.buildopts.target_cpu))
-          matching_device = device_info
-      if not matching_device:
+          matching_devices.append(device_info.serial)
+      if not matching_devices:
         raise Exception('No device with CPU matching "' + \
                         self.buildopts.target_cpu + '"' + str(cpus))
-      self.target_android_device_serial = matching_device.serial
+      self.target_android_device_serial = matching_devices[0]
+      if len(matching_devices) > 1 and not self.target_android_devices:
+        self.target_android_devices = matching_devices
 
   def _get_default_device(self):
     device_info = self.env.android_devices
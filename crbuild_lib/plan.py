@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from .trace import tracer
+
+class PlanError(Exception):
+  pass
+
+class Step(object):
+  '''A single unit of work in a Plan.
+
+  |func| is called with no arguments and returns a list of exceptions (or
+  None) - the same convention used by Builder._build and Builder._run.
+  '''
+
+  def __init__(self, name, func, deps, inputs, outputs, cpus, memory_mb,
+               exclusive, cost):
+    self.name = name
+    self.func = func
+    self.deps = deps              # List of Step.
+    self.inputs = inputs          # Files/dirs read (informational).
+    self.outputs = outputs        # Files/dirs written (informational).
+    self.cpus = cpus
+    self.memory_mb = memory_mb
+    self.exclusive = exclusive    # Resource names held exclusively.
+    self.cost = cost              # Estimated duration (seconds).
+    self.exceptions = None        # Set once the step has completed.
+    self.skipped = False
+    self.duration = None
+
+  def succeeded(self):
+    return self.exceptions is not None and not self.exceptions
+
+  def __repr__(self):
+    return self.name
+
+class Plan(object):
+  '''A directed acyclic graph of Steps and a scheduler to execute them.
+
+  Steps are started as soon as all of their dependencies have succeeded and
+  their resource requirements (CPUs, memory and exclusive resources such as
+  an Android device or the console) can be met. Steps whose dependencies
+  failed are skipped.
+  '''
+
+  def __init__(self, num_cpus, memory_mb=None, timings_path=None):
+    """Constructor.
+
+    memory_mb: total memory available to steps, or None for no limit.
+    timings_path: file used to remember step durations, which are then used
+                  as the cost estimate the next time. May be None.
+    """
+    self.num_cpus = num_cpus
+    self.memory_mb = memory_mb
+    self.timings_path = timings_path
+    self.steps = []
+    self._timings = Plan._read_timings(timings_path)
+
+  @staticmethod
+  def _read_timings(timings_path):
+    if not timings_path or not os.path.exists(timings_path):
+      return {}
+    try:
+      with open(timings_path, 'r') as f:
+        return json.load(f)
+    except ValueError:
+      return {}
+
+  def _write_timings(self):
+    if not self.timings_path:
+      return
+    for step in self.steps:
+      if step.duration is not None and step.succeeded():
+        self._timings[step.name] = round(step.duration, 3)
+    if not os.path.isdir(os.path.dirname(self.timings_path)):
+      return
+    with open(self.timings_path, 'w') as f:
+      json.dump(self._timings, f, indent=2, sort_keys=True)
+
+  def add_step(self, name, func, deps=None, inputs=None, outputs=None, cpus=1,
+               memory_mb=0, exclusive=None, cost=1.0):
+    '''Add a new step to this plan and return it.
+
+    |cost| is the default estimate used when no previous duration for a step
+    with the same name has been recorded.'''
+    if any(s.name == name for s in self.steps):
+      raise PlanError('Step "%s" already exists.' % name)
+    deps = [d for d in (deps or []) if d is not None]
+    for dep in deps:
+      if dep not in self.steps:
+        raise PlanError('Step "%s" depends on unknown step "%s".' %
+                        (name, dep.name))
+    step = Step(name, func, deps, inputs or [], outputs or [],
+                min(cpus, self.num_cpus), memory_mb, exclusive or [],
+                self._timings.get(name, cost))
+    self.steps.append(step)
+    return step
+
+  def estimate(self):
+    '''Return a dictionary of Step to (start, finish) estimated times.
+
+    Assumes resources are unconstrained, so this is the critical path timing.
+    '''
+    timings = {}
+    # Steps can only depend on steps added before them, so self.steps is
+    # already in topological order.
+    for step in self.steps:
+      start = max([timings[d][1] for d in step.deps], default=0.0)
+      timings[step] = (start, start + step.cost)
+    return timings
+
+  def print_plan(self, out=sys.stdout):
+    timings = self.estimate()
+    total = max([t[1] for t in timings.values()], default=0.0)
+    print('Execution plan (estimated %.1f sec):' % total, file=out)
+    for step in self.steps:
+      start, finish = timings[step]
+      details = ['cpus=%d' % step.cpus]
+      if step.memory_mb:
+        details.append('mem=%dMB' % step.memory_mb)
+      if step.exclusive:
+        details.append('holds=%s' % ','.join(step.exclusive))
+      if step.deps:
+        details.append('after=%s' % ','.join(d.name for d in step.deps))
+      print('  [%7.1fs - %7.1fs] %-32s %s' % (start, finish, step.name,
+                                               ' '.join(details)), file=out)
+      for path in step.inputs:
+        print('      in:  %s' % path, file=out)
+      for path in step.outputs:
+        print('      out: %s' % path, file=out)
+
+  def _can_start(self, step, running):
+    if any(d.exceptions is None for d in step.deps):
+      return False
+    cpus = sum(s.cpus for s in running)
+    if running and cpus + step.cpus > self.num_cpus:
+      return False
+    if self.memory_mb is not None:
+      memory = sum(s.memory_mb for s in running)
+      if running and memory + step.memory_mb > self.memory_mb:
+        return False
+    held = set()
+    for s in running:
+      held.update(s.exclusive)
+    return not held.intersection(step.exclusive)
+
+  @staticmethod
+  def _run_step(step):
+    start = time.time()
+    try:
+      with tracer.span(step.name, 'step'):
+        return step.func() or []
+    finally:
+      step.duration = time.time() - start
+
+  def execute(self):
+    '''Execute all steps returning the list of exceptions from failed steps.
+
+    Exceptions are returned in step order (not completion order).'''
+    pending = list(self.steps)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, len(self.steps))) as executor:
+      while pending or running:
+        for step in list(pending):
+          if any(d.skipped or d.exceptions for d in step.deps):
+            step.skipped = True
+            step.exceptions = []
+            pending.remove(step)
+          elif self._can_start(step, running.values()):
+            pending.remove(step)
+            running[executor.submit(Plan._run_step, step)] = step
+        if not running:
+          if pending:
+            raise PlanError('Unable to schedule: %s' % pending)
+          break
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          step = running.pop(future)
+          step.exceptions = future.result()
+    self._write_timings()
+    exceptions = []
+    for step in self.steps:
+      exceptions.extend(step.exceptions)
+    return exceptions
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import shlex
+import threading
+import time
+
+from .file_hash import FileHasher
+
+class ResultCache(object):
+  '''Remembers run commands which passed so they need not be run again.
+
+  The cache key is built from everything which could change the result of
+  a deterministic run command:
+
+    * The fully expanded command line.
+    * The environment variable set by the run command.
+    * The contents of every file named on the command line (the executable,
+      scripts, etc.).
+    * The contents of every shared library in the build directory.
+    * The contents of the declared data dependencies.
+
+  The cache (and the file digest memo) is stored in the build directory so
+  a clobber also clears it.
+  '''
+
+  shared_lib_extensions = ('.so', '.dll', '.dylib')
+
+  def __init__(self, build_dir):
+    self.build_dir = build_dir
+    self.path = os.path.join(build_dir, '.crbuild_results.json')
+    self._lock = threading.Lock()
+    self._results = {}
+    memo = {}
+    try:
+      with open(self.path, 'r') as f:
+        data = json.load(f)
+        self._results = data['results']
+        memo = data['hashes']
+    except (IOError, ValueError, KeyError):
+      pass
+    self._hasher = FileHasher(memo)
+
+  def _shared_libs(self):
+    if not os.path.isdir(self.build_dir):
+      return []
+    return [os.path.join(self.build_dir, name)
+            for name in sorted(os.listdir(self.build_dir))
+            if name.endswith(ResultCache.shared_lib_extensions)]
+
+  @staticmethod
+  def _cmd_files(cmd):
+    items = shlex.split(cmd) if isinstance(cmd, str) else cmd
+    files = []
+    for item in items:
+      # Also catch files given as flag values (e.g. --data-path=foo).
+      for candidate in (item, item.split('=', 1)[-1]):
+        if os.path.isfile(candidate) and candidate not in files:
+          files.append(candidate)
+    return files
+
+  def key(self, cmd, env_var, data_deps):
+    '''Return the cache key for an (expanded) run command.
+
+    |env_var| is the EnvVar (or None) and |data_deps| a list of (expanded)
+    paths of files or directories the command reads.'''
+    h = hashlib.sha256()
+    h.update(json.dumps(cmd).encode('utf-8'))
+    if env_var:
+      h.update(('%s=%s' % (env_var.name, env_var.values_str())).encode('utf-8'))
+    paths = ResultCache._cmd_files(cmd) + self._shared_libs() + \
+        list(data_deps or [])
+    for path in paths:
+      h.update(path.encode('utf-8'))
+      h.update(str(self._hasher.hash_path(path)).encode('utf-8'))
+    return h.hexdigest()
+
+  def has_pass(self, key):
+    with self._lock:
+      return key in self._results
+
+  def add_pass(self, key, cmd):
+    with self._lock:
+      self._results[key] = {'time': time.time(), 'cmd': cmd}
+      self._save()
+
+  def _save(self):
+    if not os.path.isdir(self.build_dir):
+      return
+    tmp_path = self.path + '.tmp'
+    with open(tmp_path, 'w') as f:
+      json.dump({'results': self._results, 'hashes': self._hasher.memo}, f)
+    os.replace(tmp_path, self.path)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import collections
+import gzip
+import os
+import re
+import threading
+import time
+
+class RunLog(object):
+  '''Captures the output of one run command.
+
+  All output is written, with a timestamp and stream name on every line, to
+  a gzip compressed log file. The most recent output (at most |tail_bytes|)
+  is also kept in memory so the tail can be shown if the command fails.
+  Memory use is therefore constant regardless of how much is written.
+
+  Old logs are deleted whenever a new one is created, oldest first, to keep
+  the log directory under |max_dir_bytes|.
+  '''
+
+  tail_bytes = 256 * 1024
+  max_dir_bytes = 512 * 1024 * 1024
+  suffix = '.log.gz'
+
+  def __init__(self, log_dir, name, stream_names=('out', 'err')):
+    RunLog.rotate(log_dir, RunLog.max_dir_bytes)
+    safe_name = re.sub(r'[^\w.-]', '_', name)[:64]
+    self.path = os.path.join(log_dir, '%s-%d-%s%s' % (
+        time.strftime('%Y%m%d-%H%M%S'), os.getpid(), safe_name, RunLog.suffix))
+    self._stream_names = [s.encode('utf-8') for s in stream_names]
+    # Fastest compression level - logs can be very large.
+    self._file = gzip.open(self.path, 'wb', compresslevel=1)
+    self._lock = threading.Lock()
+    self._tail = collections.deque()
+    self._tail_size = 0
+    self._last_stream = None
+    self._at_line_start = True
+
+  @staticmethod
+  def rotate(log_dir, max_bytes):
+    '''Delete the oldest logs in |log_dir| until they total < |max_bytes|.'''
+    os.makedirs(log_dir, exist_ok=True)
+    logs = []
+    for name in os.listdir(log_dir):
+      if name.endswith(RunLog.suffix):
+        st = os.stat(os.path.join(log_dir, name))
+        logs.append((st.st_mtime, st.st_size, name))
+    total = sum(log[1] for log in logs)
+    for _, size, name in sorted(logs):
+      if total < max_bytes:
+        break
+      os.remove(os.path.join(log_dir, name))
+      total -= size
+
+  def write(self, stream_index, data):
+    '''Write |data| (bytes) read from the given stream.'''
+    if not data:
+      return
+    now = time.time()
+    prefix = b'[%s.%03d %s] ' % (
+        time.strftime('%H:%M:%S', time.localtime(now)).encode('utf-8'),
+        int(now * 1000) % 1000, self._stream_names[stream_index])
+    ends_line = data.endswith(b'\n')
+    # One replace per chunk rather than splitting into lines.
+    body = data[:-1] if ends_line else data
+    body = body.replace(b'\n', b'\n' + prefix)
+    with self._lock:
+      if not self._at_line_start and self._last_stream != stream_index:
+        # Don't join a partial line from another stream with this one.
+        self._file.write(b'\n')
+        self._at_line_start = True
+      if self._at_line_start:
+        self._file.write(prefix)
+      self._file.write(body)
+      if ends_line:
+        self._file.write(b'\n')
+      self._at_line_start = ends_line
+      self._last_stream = stream_index
+
+      self._tail.append(data)
+      self._tail_size += len(data)
+      while self._tail_size - len(self._tail[0]) >= RunLog.tail_bytes:
+        self._tail_size -= len(self._tail.popleft())
+
+  def tail(self, num_lines):
+    '''Return the last |num_lines| lines of output as a list of strings.'''
+    with self._lock:
+      data = b''.join(self._tail)
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[-num_lines:]
+
+  def close(self):
+    with self._lock:
+      self._file.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+
+class SelfProfiler(object):
+  '''Profiles crbuild itself with cProfile.
+
+  cProfile only sees the thread that enabled it, and much of crbuild's work
+  (plan steps, output readers) happens on other threads, so each thread
+  started while profiling gets its own profiler. They are all merged into a
+  single set of stats when written.
+
+  From Python 3.12 cProfile uses sys.monitoring, which sees every thread
+  but allows only one active profiler, so then only the main one is used.
+  '''
+
+  flag = '--profile-self'
+  num_functions = 30
+  per_thread = sys.version_info < (3, 12)
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._main = cProfile.Profile()
+    self._thread_profiles = []
+
+  @staticmethod
+  def requested(argv):
+    '''Was profiling requested on the command-line? This is checked before
+    the command-line is parsed so that parsing is also profiled. Arguments
+    after "--" (passed to the run commands) aren't crbuild's.'''
+    if '--' in argv:
+      argv = argv[:argv.index('--')]
+    return SelfProfiler.flag in argv
+
+  @staticmethod
+  def default_path():
+    from .env import Env
+    return os.path.join(Env.get_cache_dir(), 'crbuild.pstats')
+
+  def _start_thread(self, frame, event, arg):
+    # Called for the first profiler event in each new thread; replaces itself
+    # with a profiler for that thread.
+    sys.setprofile(None)
+    profile = cProfile.Profile()
+    try:
+      profile.enable()
+    except ValueError:
+      return  # Another profiler is active (sys.monitoring allows only one).
+    with self._lock:
+      self._thread_profiles.append(profile)
+
+  def start(self):
+    if SelfProfiler.per_thread:
+      threading.setprofile(self._start_thread)
+    self._main.enable()
+
+  def stop(self):
+    self._main.disable()
+    if SelfProfiler.per_thread:
+      threading.setprofile(None)
+
+  def stats(self):
+    '''Return the merged pstats.Stats of all threads.'''
+    stats = pstats.Stats(self._main)
+    with self._lock:
+      profiles = list(self._thread_profiles)
+    for profile in profiles:
+      profile.disable()
+      try:
+        stats.add(profile)
+      except TypeError:
+        pass  # Thread never made a call after its profiler was enabled.
+    return stats
+
+  def write(self, path, out=sys.stdout):
+    '''Write the stats to |path| (for pstats/snakeviz etc.) and print the
+    functions with the largest cumulative time to |out|.'''
+    stats = self.stats()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    stats.dump_stats(path)
+    summary = io.StringIO()
+    stats.stream = summary
+    stats.sort_stats('cumulative').print_stats(SelfProfiler.num_functions)
+    print(summary.getvalue(), file=out)
+    print('Profile written to %s' % path, file=out)
@@ -1,56 +1,226 @@
 #!/usr/bin/env python3
 
 import os
+import queue
+import re
+import selectors
 import sys
-from threading import Thread
+from threading import (Lock, Thread)
 
-class StreamReader:
+from .symbolizer import Symbolizer
 
-  def __init__(self, in_stream, out_stream, src_root_dir, symbolize):
+class StreamReader(object):
+  '''Copies the output pipes of a child process to output streams.
+
+  A single thread multiplexes all pipes, reading large chunks as they become
+  available and writing them in arrival order, so stdout/stderr ordering is
+  preserved. When not symbolizing, bytes are passed straight through without
+  being decoded or split into lines. When symbolizing, only complete lines
+  that look like stack frames are decoded and symbolized; all other output
+  is written through unchanged. All frames within a chunk are symbolized as
+  one batch by the (cached, parallel) Symbolizer if llvm-symbolizer is
+  available, and otherwise by asan_symbolize.
+
+  Memory use is bounded: at most one chunk, plus one partial line (capped at
+  |max_line_length|) per pipe is buffered.
+  '''
+
+  read_size = 64 * 1024
+  max_line_length = 64 * 1024
+  frame_re = re.compile(Symbolizer.frame_pattern.encode('ascii'),
+                        re.MULTILINE)
+
+  def __init__(self, streams, src_root_dir, symbolize, sinks=None,
+               matcher=None):
     """
-    in_stream: the stream to read (e.g. p.stderr, etc.)
-    out_stream: the stream to write (e.g. sys.stderr, etc.)
+    streams: list of (in_stream, out_stream) tuples - e.g.
+             [(p.stdout, sys.stdout), (p.stderr, sys.stderr)].
+    sinks: list of callables which are also given everything written, as
+           sink(stream_index, data) - e.g. RunLog.write.
+    matcher: optional FailureMatcher, which scans (and may highlight)
+             everything written to the output streams.
     """
     self._continue = True
+    self._streams = streams
+    self._sinks = sinks or []
+    self._matcher = matcher
+    self._partial = [b''] * len(streams)
+    self._symbolize = symbolize
     if symbolize:
-      cmd_subfolder = os.path.realpath(
-          os.path.abspath(os.path.join(src_root_dir,
-                                       'tools', 'valgrind', 'asan')))
-      if cmd_subfolder not in sys.path:
-        sys.path.insert(0, cmd_subfolder)
-      from third_party import asan_symbolize
-
-    def _run(in_stream, out_stream, symbolize):
-      """
-      Demangle lines from |in_stream| and write to |out_stream|.
-      """
-
-      if symbolize:
-        asan_symbolize.demangle = True
-        loop = asan_symbolize.SymbolizationLoop(
-            binary_name_filter=asan_symbolize.fix_filename)
-      while self._continue:
-        line = in_stream.readline()
-        if not line:
-          return
-        line = line.rstrip()
-        if not isinstance(line, str):
-          try:
-            line = line.decode('utf-8')
-          except:
-            out_stream.buffer.write(line)
-            continue
-        if symbolize:
-          line = ''.join(loop.process_line(line))
-        print(line, file=out_stream)
-
-    self._thread = Thread(target=_run, args=(in_stream, out_stream, symbolize))
+      symbolizer = Symbolizer.get(src_root_dir)
+      if symbolizer:
+        self._symbolize_frames = symbolizer.symbolize_lines
+      else:
+        self._symbolize_frames = \
+            StreamReader._create_symbolization_loop(src_root_dir)
+
+    if os.name != 'nt':
+      target = self._run_selector
+    else:
+      # Windows can't select() on pipes.
+      target = self._run_threads
+    self._thread = Thread(target=target)
     self._thread.daemon = True
     self._thread.start()
 
+  @staticmethod
+  def _create_symbolization_loop(src_root_dir):
+    cmd_subfolder = os.path.realpath(
+        os.path.abspath(os.path.join(src_root_dir,
+                                     'tools', 'valgrind', 'asan')))
+    if cmd_subfolder not in sys.path:
+      sys.path.insert(0, cmd_subfolder)
+    from third_party import asan_symbolize
+    asan_symbolize.demangle = True
+    loop = asan_symbolize.SymbolizationLoop(
+        binary_name_filter=asan_symbolize.fix_filename)
+    def symbolize_frames(lines):
+      return ['\n'.join(f.rstrip('\n') for f in loop.process_line(line))
+              for line in lines]
+    return symbolize_frames
+
+  def _write(self, index, data):
+    for sink in self._sinks:
+      sink(index, data)
+    if self._matcher:
+      data = self._matcher.process(index, data)
+    out_stream = self._streams[index][1]
+    if hasattr(out_stream, 'buffer'):
+      out_stream.buffer.write(data)
+      out_stream.buffer.flush()
+    else:
+      out_stream.write(data.decode('utf-8', errors='replace'))
+
+  def _symbolize_lines(self, data):
+    '''Symbolize the frame lines in |data| (which contains only complete
+    lines) returning the result.'''
+    spans = []
+    lines = []
+    for m in StreamReader.frame_re.finditer(data):
+      end = data.find(b'\n', m.end())
+      if end == -1:
+        end = len(data)
+      try:
+        lines.append(data[m.start():end].decode('utf-8'))
+        spans.append((m.start(), end))
+      except UnicodeDecodeError:
+        pass
+    if not spans:
+      return data
+    out = []
+    pos = 0
+    for (start, end), frames in zip(spans, self._symbolize_frames(lines)):
+      out.append(data[pos:start])
+      out.append(frames.encode('utf-8'))
+      pos = end
+    out.append(data[pos:])
+    return b''.join(out)
+
+  def _process(self, index, data):
+    '''Handle a chunk of |data| read from stream |index|. Empty data means
+    the stream has closed.'''
+    if not self._symbolize:
+      if data:
+        self._write(index, data)
+      return
+    if not data:
+      data = self._partial[index]
+      self._partial[index] = b''
+    else:
+      data = self._partial[index] + data
+      cut = data.rfind(b'\n') + 1
+      if len(data) - cut <= StreamReader.max_line_length:
+        self._partial[index] = data[cut:]
+        data = data[:cut]
+      else:
+        self._partial[index] = b''
+    if data:
+      self._write(index, self._symbolize_lines(data))
+
+  def _run_selector(self):
+    with selectors.DefaultSelector() as selector:
+      for index, (in_stream, _) in enumerate(self._streams):
+        selector.register(in_stream, selectors.EVENT_READ, index)
+      while self._continue and selector.get_map():
+        for key, _ in selector.select(timeout=0.1):
+          data = os.read(key.fd, StreamReader.read_size)
+          if not data:
+            selector.unregister(key.fileobj)
+          self._process(key.data, data)
+
+  def _run_threads(self):
+    # Bounded so a slow console applies back-pressure to the readers.
+    chunks = queue.Queue(maxsize=16)
+    def read(index, in_stream):
+      while True:
+        data = in_stream.read1(StreamReader.read_size)
+        chunks.put((index, data))
+        if not data:
+          return
+    for index, (in_stream, _) in enumerate(self._streams):
+      reader = Thread(target=read, args=(index, in_stream))
+      reader.daemon = True
+      reader.start()
+    open_streams = len(self._streams)
+    while self._continue and open_streams:
+      index, data = chunks.get()
+      if not data:
+        open_streams -= 1
+      self._process(index, data)
+
   def join(self):
     self._thread.join()
 
   def stop(self):
     self._continue = False
     self.join()
+
+class PrefixedOutput(object):
+  '''An output stream for StreamReader which prefixes every line - e.g. with
+  a device serial - so that the output of commands running concurrently can
+  be told apart.
+
+  Only whole lines are written (partial lines are held until completed or
+  |close| is called) so lines from different commands are never mixed.
+  '''
+
+  _lock = Lock()  # Shared: all instances write to one console.
+
+  def __init__(self, out_stream, prefix):
+    self._out = out_stream
+    self._prefix = prefix.encode('utf-8')
+    self._partial = b''
+    # StreamReader writes bytes to out_stream.buffer when present.
+    self.buffer = self
+
+  def _write_out(self, data):
+    if hasattr(self._out, 'buffer'):
+      self._out.buffer.write(data)
+      self._out.buffer.flush()
+    else:
+      self._out.write(data.decode('utf-8', errors='replace'))
+
+  def write(self, data):
+    data = self._partial + data
+    cut = data.rfind(b'\n') + 1
+    if len(data) - cut > StreamReader.max_line_length:
+      cut = len(data)
+    self._partial = data[cut:]
+    if cut:
+      lines = data[:cut]
+      ends_line = lines.endswith(b'\n')
+      body = lines[:-1] if ends_line else lines
+      with PrefixedOutput._lock:
+        self._write_out(self._prefix +
+                        body.replace(b'\n', b'\n' + self._prefix) +
+                        (b'\n' if ends_line else b''))
+
+  def flush(self):
+    pass
+
+  def close(self):
+    '''Write any incomplete last line.'''
+    if self._partial:
+      self._partial, data = b'', self._partial
+      with PrefixedOutput._lock:
+        self._write_out(self._prefix + data + b'\n')
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import struct
+import subprocess
+import threading
+
+from .env import Env
+
+def _align4(n):
+  return (n + 3) & ~3
+
+def elf_build_id(path):
+  '''Return the GNU build ID (hex string) of an ELF file, or None.
+
+  Only the ELF header, program headers and note segments are read, so this
+  is cheap even for very large (unstripped) binaries.'''
+  try:
+    with open(path, 'rb') as f:
+      header = f.read(64)
+      if len(header) < 52 or header[:4] != b'\x7fELF':
+        return None
+      is_64 = header[4] == 2
+      endian = '<' if header[5] == 1 else '>'
+      if is_64:
+        phoff = struct.unpack_from(endian + 'Q', header, 32)[0]
+        phentsize, phnum = struct.unpack_from(endian + 'HH', header, 54)
+      else:
+        phoff = struct.unpack_from(endian + 'I', header, 28)[0]
+        phentsize, phnum = struct.unpack_from(endian + 'HH', header, 42)
+      f.seek(phoff)
+      phdrs = f.read(phentsize * phnum)
+      for i in range(phnum):
+        off = i * phentsize
+        if struct.unpack_from(endian + 'I', phdrs, off)[0] != 4:  # PT_NOTE
+          continue
+        if is_64:
+          p_offset = struct.unpack_from(endian + 'Q', phdrs, off + 8)[0]
+          p_filesz = struct.unpack_from(endian + 'Q', phdrs, off + 32)[0]
+        else:
+          p_offset = struct.unpack_from(endian + 'I', phdrs, off + 4)[0]
+          p_filesz = struct.unpack_from(endian + 'I', phdrs, off + 16)[0]
+        f.seek(p_offset)
+        notes = f.read(p_filesz)
+        pos = 0
+        while pos + 12 <= len(notes):
+          namesz, descsz, note_type = struct.unpack_from(endian + 'III', notes,
+                                                         pos)
+          name = notes[pos + 12:pos + 12 + namesz].rstrip(b'\0')
+          desc_start = pos + 12 + _align4(namesz)
+          if note_type == 3 and name == b'GNU':  # NT_GNU_BUILD_ID
+            return notes[desc_start:desc_start + descsz].hex()
+          pos = desc_start + _align4(descsz)
+  except (IOError, struct.error):
+    pass
+  return None
+
+class SymbolCache(object):
+  '''Cache of (module, offset) -> symbolized frames.
+
+  Kept in memory and on disk, one JSON file per module. Modules are keyed
+  by their build ID (or, failing that, by path, size and mtime) so a
+  rebuilt module never uses stale symbols.
+  '''
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self._lock = threading.Lock()
+    self._module_keys = {}  # path -> (size, mtime, key)
+    self._symbols = {}      # key -> {offset: [[function, location], ...]}
+    self._dirty = set()
+
+  def module_key(self, module):
+    try:
+      st = os.stat(module)
+    except OSError:
+      return None
+    entry = self._module_keys.get(module)
+    if entry and entry[:2] == (st.st_size, st.st_mtime_ns):
+      return entry[2]
+    key = elf_build_id(module)
+    if not key:
+      key = hashlib.sha1(('%s:%d:%d' % (os.path.realpath(module), st.st_size,
+                                        st.st_mtime_ns))
+                         .encode('utf-8')).hexdigest()
+    self._module_keys[module] = (st.st_size, st.st_mtime_ns, key)
+    return key
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key + '.json')
+
+  def _symbols_for(self, key):
+    if key not in self._symbols:
+      try:
+        with open(self._path(key), 'r') as f:
+          self._symbols[key] = json.load(f)
+      except (IOError, ValueError):
+        self._symbols[key] = {}
+    return self._symbols[key]
+
+  def get(self, key, offset):
+    with self._lock:
+      return self._symbols_for(key).get('%x' % offset)
+
+  def put(self, key, offset, frames):
+    with self._lock:
+      self._symbols_for(key)['%x' % offset] = frames
+      self._dirty.add(key)
+
+  def flush(self):
+    '''Write all modified modules to disk.'''
+    with self._lock:
+      if not self._dirty:
+        return
+      os.makedirs(self.cache_dir, exist_ok=True)
+      for key in self._dirty:
+        tmp_path = self._path(key) + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'w') as f:
+          json.dump(self._symbols[key], f)
+        os.replace(tmp_path, self._path(key))
+      self._dirty = set()
+
+class LlvmSymbolizer(object):
+  '''A persistent llvm-symbolizer process.'''
+
+  # Requests written before reading replies. Small enough that the replies
+  # can't fill the pipe (and deadlock) before all requests are written.
+  batch_size = 64
+
+  def __init__(self, path):
+    self._lock = threading.Lock()
+    self._process = subprocess.Popen(
+        [path, '--functions=linkage', '--demangle'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        universal_newlines=True, bufsize=1)
+
+  def symbolize(self, requests):
+    '''Symbolize a list of (module, offset) returning a list (one per
+    request) of lists of [function, location] (more than one when the
+    address is within inlined code).'''
+    results = []
+    with self._lock:
+      for start in range(0, len(requests), LlvmSymbolizer.batch_size):
+        batch = requests[start:start + LlvmSymbolizer.batch_size]
+        for module, offset in batch:
+          self._process.stdin.write('"%s" 0x%x\n' % (module, offset))
+        self._process.stdin.flush()
+        for _ in batch:
+          frames = []
+          while True:
+            function = self._process.stdout.readline()
+            if not function or function == '\n':
+              break
+            location = self._process.stdout.readline()
+            frames.append([function.rstrip('\n'), location.rstrip('\n')])
+          results.append(frames)
+    return results
+
+  def close(self):
+    self._process.stdin.close()
+    self._process.stdout.close()
+    self._process.wait()
+
+class Symbolizer(object):
+  '''Symbolizes sanitizer stack frames using a pool of llvm-symbolizer
+  processes and a persistent SymbolCache.'''
+
+  # A sanitizer stack frame, as asan_symbolize.py, including partially
+  # symbolized frames ("#0 0x7f.. in operator new(unsigned long)
+  # (/lib/libasan.so+0x..)"): the module is the last parenthesised
+  # (module+offset) on the line (optionally followed by the BuildId).
+  frame_pattern = (r'^( *#[0-9]+ *)(0x[0-9a-f]+)(?: *in .+)? *'
+                   r'\(([^()]*)\+(0x[0-9a-f]+)\)'
+                   r'(?: *\(BuildId: [0-9a-f]+\))?[ \t\r]*$')
+  frame_re = re.compile(frame_pattern)
+  pool_size = min(8, os.cpu_count() or 1)
+  _instances = {}
+  _instances_lock = threading.Lock()
+
+  def __init__(self, symbolizer_path, cache_dir, pool_size=None):
+    self._path = symbolizer_path
+    self._pool = [None] * (pool_size or Symbolizer.pool_size)
+    self._pool_lock = threading.Lock()
+    self.cache = SymbolCache(cache_dir)
+
+  @staticmethod
+  def get(src_root_dir):
+    '''Return the shared Symbolizer for the given checkout, or None if there
+    is no llvm-symbolizer. Sharing it keeps the processes (and their parsed
+    debug info) alive between run commands.'''
+    path = os.path.join(src_root_dir, 'third_party', 'llvm-build',
+                        'Release+Asserts', 'bin', 'llvm-symbolizer')
+    if os.name == 'nt':
+      path += '.exe'
+    if not os.path.exists(path):
+      return None
+    with Symbolizer._instances_lock:
+      if path not in Symbolizer._instances:
+        Symbolizer._instances[path] = Symbolizer(
+            path, os.path.join(Env.get_cache_dir(), 'symbols'))
+      return Symbolizer._instances[path]
+
+  def _process(self, index):
+    with self._pool_lock:
+      if self._pool[index] is None:
+        self._pool[index] = LlvmSymbolizer(self._path)
+      return self._pool[index]
+
+  def close(self):
+    '''Stop all llvm-symbolizer processes.'''
+    with self._pool_lock:
+      for process in self._pool:
+        if process:
+          process.close()
+      self._pool = [None] * len(self._pool)
+
+  @staticmethod
+  def close_all():
+    '''Close (see close()) every shared Symbolizer, once nothing will
+    symbolize any more.'''
+    with Symbolizer._instances_lock:
+      instances = list(Symbolizer._instances.values())
+      Symbolizer._instances = {}
+    for symbolizer in instances:
+      symbolizer.close()
+
+  def resolve(self, addresses):
+    '''Return a dictionary of (module, offset) -> frames for all of the
+    given |addresses| (an iterable of (module, offset)).'''
+    resolved = {}
+    uncached = {}  # module key -> list of (module, offset)
+    for module, offset in set(addresses):
+      key = self.cache.module_key(module)
+      frames = self.cache.get(key, offset) if key else None
+      if frames is not None:
+        resolved[(module, offset)] = frames
+      elif key:
+        uncached.setdefault(key, []).append((module, offset))
+    if not uncached:
+      return resolved
+
+    # Each module always goes to the same process, which then only needs to
+    # load that module's debug info once.
+    batches = {}
+    for key, requests in uncached.items():
+      index = int(key[:8], 16) % len(self._pool)
+      batches.setdefault(index, []).extend(requests)
+    with concurrent.futures.ThreadPoolExecutor(len(batches)) as executor:
+      futures = {executor.submit(self._process(index).symbolize, requests):
+                 requests for index, requests in batches.items()}
+      for future in concurrent.futures.as_completed(futures):
+        for request, frames in zip(futures[future], future.result()):
+          resolved[request] = frames
+          self.cache.put(self.cache.module_key(request[0]), request[1],
+                         frames)
+    self.cache.flush()
+    return resolved
+
+  def symbolize_lines(self, lines):
+    '''Symbolize a list of frame lines returning a list with the result for
+    each line. A result may contain several lines (one per inlined frame).
+
+    Lines which are not frames, or can't be symbolized, are unchanged.'''
+    matches = [Symbolizer.frame_re.match(line) for line in lines]
+    resolved = self.resolve((m.group(3), int(m.group(4), 16))
+                            for m in matches if m)
+    out = []
+    for line, m in zip(lines, matches):
+      frames = resolved.get((m.group(3), int(m.group(4), 16))) if m else None
+      if not frames or frames[0][0] == '??':
+        out.append(line)
+        continue
+      out.append('\n'.join('%s%s in %s %s' % (m.group(1), m.group(2),
+                                               function, location)
+                            for function, location in frames))
+    return out
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+class Tracer(object):
+  '''Records a timeline of crbuild's work in the Chrome trace-event format.
+
+  Events are always recorded (it's cheap) and only written if requested,
+  so that work done before the command-line is parsed is included. The
+  written file can be loaded in chrome://tracing or https://ui.perfetto.dev.
+  '''
+
+  crbuild_pid = 1
+  ninja_pid = 2
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._events = []
+    self._thread_ids = {}
+    self._start = time.time()
+
+  def _us(self, seconds):
+    '''Convert a time.time() value to trace microseconds.'''
+    return int(round((seconds - self._start) * 1000000))
+
+  def _tid(self):
+    ident = threading.get_ident()
+    if ident not in self._thread_ids:
+      self._thread_ids[ident] = len(self._thread_ids) + 1
+    return self._thread_ids[ident]
+
+  def add_event(self, name, category, start, duration, pid=None, tid=None,
+                args=None):
+    '''Add a complete event. |start| is a time.time() value and |duration|
+    in seconds.'''
+    event = {
+      'name': name,
+      'cat': category,
+      'ph': 'X',
+      'ts': self._us(start),
+      'dur': int(round(duration * 1000000)),
+      'pid': pid or Tracer.crbuild_pid,
+    }
+    if args:
+      event['args'] = args
+    with self._lock:
+      event['tid'] = tid or self._tid()
+      self._events.append(event)
+
+  @contextlib.contextmanager
+  def span(self, name, category='crbuild', args=None):
+    '''Record the duration of the enclosed block.'''
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.add_event(name, category, start, time.time() - start, args=args)
+
+  @staticmethod
+  def ninja_log_size(build_dir):
+    '''Return the current size of .ninja_log (0 if none).'''
+    try:
+      return os.path.getsize(os.path.join(build_dir, '.ninja_log'))
+    except OSError:
+      return 0
+
+  def import_ninja_log(self, build_dir, offset, build_start):
+    '''Add an event for every edge ninja logged (after |offset|) during a
+    build started at |build_start|.
+
+    Outputs of the same edge are merged, and edges are laid out on as few
+    rows ("threads") as possible.'''
+    path = os.path.join(build_dir, '.ninja_log')
+    if not os.path.exists(path):
+      return  # E.g. ninja failed before writing it.
+    if Tracer.ninja_log_size(build_dir) < offset:
+      # Ninja recompacted the log, so we can't tell which entries are new.
+      return
+    edges = {}
+    try:
+      with open(path, 'r', errors='replace') as f:
+        f.seek(offset)
+        for line in f:
+          if line.startswith('#'):
+            continue
+          fields = line.rstrip('\n').split('\t')
+          if len(fields) < 4:
+            continue
+          key = (int(fields[0]), int(fields[1]))
+          edges.setdefault(key, []).append(fields[3])
+    except IOError:
+      return
+    lanes = []  # End time (ms) of the last edge in each lane.
+    for (start_ms, end_ms), outputs in sorted(edges.items()):
+      for lane, lane_end in enumerate(lanes):
+        if lane_end <= start_ms:
+          break
+      else:
+        lane = len(lanes)
+        lanes.append(0)
+      lanes[lane] = end_ms
+      self.add_event(os.path.basename(outputs[0]), 'ninja',
+                     build_start + start_ms / 1000.0,
+                     (end_ms - start_ms) / 1000.0, pid=Tracer.ninja_pid,
+                     tid=lane + 1, args={'outputs': outputs})
+
+  def write(self, path):
+    with self._lock:
+      events = list(self._events)
+    metadata = [
+      {'name': 'process_name', 'ph': 'M', 'pid': Tracer.crbuild_pid,
+       'args': {'name': 'crbuild'}},
+      {'name': 'process_name', 'ph': 'M', 'pid': Tracer.ninja_pid,
+       'args': {'name': 'ninja'}},
+    ]
+    with open(path, 'w') as f:
+      json.dump({'traceEvents': metadata + events,
+                 'displayTimeUnit': 'ms'}, f)
+
+# The timeline of this crbuild invocation.
+tracer = Tracer()
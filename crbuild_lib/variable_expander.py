@@ -9,8 +9,22 @@ class UnknownVariable(Exception):
 class VariableExpander(object):
   var_re = re.compile(r'\${([^}]+)}')
 
-  def __init__(self, options):
+  # Variables making a run command shardable (see DevicePool).
+  shard_variables = ('shard_index', 'total_shards')
+
+  def __init__(self, options, android_device=None, shard=None, display=None):
+    """
+    android_device: the device ${android_device} expands to, when not the
+                    default (options.target_android_device_serial).
+    shard: the Shard ${shard_index} and ${total_shards} expand to, when
+           running a shard of a run command.
+    display: the X display (see XvfbPool) the command is run on, in which
+             case ${xvfb} expands to nothing.
+    """
     self.options = options
+    self.android_device = android_device
+    self.shard = shard
+    self.display = display
 
   def _get_base_build_dir(self):
     '''Return the relative path to the build dir - e.g. out/Debug.'''
@@ -68,7 +82,11 @@ class VariableExpander(object):
     if variable_name == 'root_dir':
       return self.options.env.src_root_dir
     if variable_name == 'android_device':
-      return self.options.target_android_device_serial
+      return self.android_device or self.options.target_android_device_serial
+    if variable_name == 'shard_index':
+      return str(self.shard.index if self.shard else 0)
+    if variable_name == 'total_shards':
+      return str(self.shard.total if self.shard else 1)
     if variable_name == 'layout_dir':
       return self.options.layout_dir
     if variable_name == 'python2':
@@ -80,7 +98,7 @@ class VariableExpander(object):
     if variable_name == 'run_args':
       return self.options.run_args
     if variable_name == 'xvfb':
-      if self.options.env.build_platform == 'linux':
+      if self.options.env.build_platform == 'linux' and not self.display:
         return ['python', 'testing/xvfb.py']
       else:
         return None
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import contextlib
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import time
+
+from .file_lock import FileLock
+
+class XvfbError(Exception):
+  pass
+
+class XvfbPool(object):
+  '''A pool of long lived Xvfb displays which run commands lease (setting
+  DISPLAY) instead of wrapping each run in testing/xvfb.py, which starts and
+  stops an X server (and window manager) every time.
+
+  Display :N is leased by holding the file lock <lock_dir>/display-N.lock,
+  so concurrent runs, in this or other crbuild processes, each get their
+  own display. The Xvfb (and openbox, if installed) serving a display is
+  left running when released, for the next lease, and its PIDs are kept in
+  <lock_dir>/display-N.pid. Each lease first checks the display still
+  accepts connections, restarting its Xvfb if not.
+  '''
+
+  first_display = 99
+  socket_dir = '/tmp/.X11-unix'
+  # The arguments testing/xvfb.py starts Xvfb with.
+  xvfb_args = ['-screen', '0', '1280x800x24', '-ac', '-nolisten', 'tcp',
+               '-dpi', '96', '+extension', 'RANDR']
+  start_timeout = 10.0
+  poll_interval = 0.1
+
+  def __init__(self, lock_dir, max_displays, xvfb='Xvfb'):
+    self.lock_dir = lock_dir
+    self.max_displays = max_displays
+    self.xvfb = xvfb
+    # Display -> the Popen of the processes this pool started, to reap them.
+    self._processes = {}
+
+  @staticmethod
+  def find_xvfb():
+    '''Return the path to Xvfb, or None if it isn't installed.'''
+    return shutil.which('Xvfb')
+
+  def _path(self, display, ext):
+    return os.path.join(self.lock_dir, 'display-%d.%s' % (display, ext))
+
+  def _read_pids(self, display):
+    try:
+      with open(self._path(display, 'pid'), 'r') as f:
+        return [int(pid) for pid in f.read().split()]
+    except (IOError, ValueError):
+      return []
+
+  def _owns(self, pid):
+    '''Is |pid| an Xvfb or openbox this pool started? The pid file outlives
+    them (e.g. over a reboot), so a PID in it may now be another process.
+    Ours lead their own session (start_new_session) and run Xvfb or
+    openbox (directly, or as the script an interpreter runs).'''
+    try:
+      if os.getsid(pid) != pid:
+        return False
+      with open('/proc/%d/cmdline' % pid, 'rb') as f:
+        args = f.read().decode('utf-8', errors='replace').split('\0')
+    except (IOError, OSError):
+      return False
+    names = (os.path.basename(self.xvfb), 'openbox')
+    return any(os.path.basename(arg) in names for arg in args[:2])
+
+  def _accepts_connections(self, display):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(os.path.join(XvfbPool.socket_dir, 'X%d' % display))
+      return True
+    except OSError:
+      return False
+    finally:
+      sock.close()
+
+  def _is_healthy(self, display):
+    pids = self._read_pids(display)
+    return bool(pids) and self._owns(pids[0]) and \
+        self._accepts_connections(display)
+
+  def _stop(self, display):
+    '''Kill the processes serving |display|, only those this pool started,
+    and remove its pid file.'''
+    processes = self._processes.pop(display, [])
+    started = set(p.pid for p in processes)
+    for pid in self._read_pids(display):
+      # Popen.kill (below) doesn't signal a PID reused once it is reaped.
+      if pid not in started and self._owns(pid):
+        try:
+          os.kill(pid, signal.SIGKILL)
+        except OSError:
+          pass
+    for p in processes:
+      p.kill()
+      p.wait()
+    try:
+      os.remove(self._path(display, 'pid'))
+    except OSError:
+      pass
+
+  def _start(self, display):
+    try:
+      p = subprocess.Popen([self.xvfb, ':%d' % display] + XvfbPool.xvfb_args,
+                           stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError as e:
+      raise XvfbError('Xvfb failed to start on :%d: %s' % (display, e))
+    processes = [p]
+    deadline = time.time() + XvfbPool.start_timeout
+    while not self._accepts_connections(display):
+      if p.poll() is not None or time.time() > deadline:
+        if p.returncode is None:
+          p.kill()
+          p.wait()
+        raise XvfbError('Xvfb failed to start on :%d' % display)
+      time.sleep(XvfbPool.poll_interval)
+    openbox = shutil.which('openbox')
+    if openbox:
+      env = dict(os.environ, DISPLAY=':%d' % display)
+      processes.append(subprocess.Popen(
+          [openbox, '--sm-disable'], env=env, stdin=subprocess.DEVNULL,
+          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+          start_new_session=True))
+    self._processes[display] = processes
+    with open(self._path(display, 'pid'), 'w') as f:
+      f.write(' '.join(str(p.pid) for p in processes))
+
+  def _try_lease(self, display):
+    '''Return (the FileLock of |display| if it could be leased (its Xvfb
+    started if need be) else None, whether it is leased by another run).'''
+    lock = FileLock(self._path(display, 'lock'))
+    if not lock.acquire(blocking=False):
+      return None, True
+    try:
+      if not self._is_healthy(display):
+        self._stop(display)
+        if self._accepts_connections(display):
+          # Another X server (not ours) has this display.
+          lock.release()
+          return None, False
+        self._start(display)
+      return lock, False
+    except (OSError, XvfbError):
+      lock.release()
+      raise
+
+  @contextlib.contextmanager
+  def lease(self):
+    '''Yield the DISPLAY (e.g. ":99") of a display held until exit, waiting
+    while all are leased. Raises XvfbError if Xvfb can't be started, or
+    every display is used by other X servers.'''
+    os.makedirs(self.lock_dir, exist_ok=True)
+    displays = range(XvfbPool.first_display,
+                     XvfbPool.first_display + self.max_displays)
+    while True:
+      any_leased = False
+      for display in displays:
+        lock, leased = self._try_lease(display)
+        if lock:
+          try:
+            yield ':%d' % display
+          finally:
+            lock.release()
+          return
+        any_leased = any_leased or leased
+      if not any_leased:
+        # None will be released, so waiting would never end.
+        raise XvfbError('Displays :%d to :%d are used by other X servers' %
+                        (displays[0], displays[-1]))
+      time.sleep(XvfbPool.poll_interval)
+
+  def stop(self):
+    '''Stop every display which isn't leased.'''
+    for display in range(XvfbPool.first_display,
+                         XvfbPool.first_display + self.max_displays):
+      lock = FileLock(self._path(display, 'lock'))
+      if lock.acquire(blocking=False):
+        self._stop(display)
+        lock.release()
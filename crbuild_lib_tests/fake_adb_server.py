@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+'''A fake adb server speaking the adb host protocol, for testing AdbClient
+(and everything using it) without devices.
+
+Device shell commands are run by the local sh, with getprop, pm, pidof,
+logcat and settings defined as shell functions answering from the
+FakeDevice's props, packages, pids, logcat and settings.
+'''
+
+import shlex
+import socketserver
+import struct
+import subprocess
+import threading
+
+class FakeDevice(object):
+  def __init__(self, serial, props=None, packages=None, shell_v2=True):
+    self.serial = serial
+    self.props = props or {}
+    self.packages = packages or []
+    self.pids = {}      # Running packages: name -> pid.
+    self.logcat = ''    # Output of logcat (after echoing its arguments).
+    self.settings = {}  # Global settings: name -> value (put is ignored).
+    self.features = ['cmd', 'stat_v2'] + (['shell_v2'] if shell_v2 else [])
+    self.commands = []  # Every shell/exec command run.
+    self.reverses = {}
+    self.files = {}     # Files pushed: path -> data.
+    self.installed = [] # Data of every APK installed.
+
+  def _preamble(self):
+    props = ''.join('%s) echo %s;; ' % (name, shlex.quote(value))
+                    for name, value in self.props.items())
+    packages = ''.join('%s) echo package:/data/app/%s/base.apk;; ' % (p, p)
+                       for p in self.packages)
+    listing = ''.join('echo package:/data/app/%s/base.apk=%s; ' % (p, p)
+                      for p in self.packages)
+    pids = ''.join('%s) echo %d;; ' % (name, pid)
+                   for name, pid in self.pids.items())
+    settings = ''.join('%s=%s\n' % item for item in self.settings.items())
+    return ('getprop() { case "$1" in %s esac; }; '
+            'pm() { if [ "$1" = install ]; then echo Success; '
+            'elif [ "$1" = list ]; then %s true; else '
+            'case "$2" in %s *) return 1;; esac; fi; }; '
+            'pidof() { case "$2" in %s *) return 1;; esac; }; '
+            'logcat() { echo "logcat $*"; printf %%s %s; }; '
+            'settings() { case "$1" in list) printf %%s %s;; put) ;; '
+            '*) return 1;; esac; }; ' % (
+                props, listing, packages, pids, shlex.quote(self.logcat),
+                shlex.quote(settings)))
+
+  def run(self, command, stdin=b''):
+    self.commands.append(command)
+    p = subprocess.run(['sh', '-c', self._preamble() + command], input=stdin,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return p.returncode, p.stdout, p.stderr
+
+class _Handler(socketserver.BaseRequestHandler):
+  def _recv_exactly(self, size):
+    data = b''
+    while len(data) < size:
+      chunk = self.request.recv(size - len(data))
+      if not chunk:
+        return None
+      data += chunk
+    return data
+
+  def _read_request(self):
+    size = self._recv_exactly(4)
+    return self._recv_exactly(int(size, 16)).decode('utf-8') if size else None
+
+  def _okay(self, reply=None):
+    self.request.sendall(b'OKAY')
+    if reply is not None:
+      self._string(reply)
+
+  def _string(self, reply):
+    data = reply.encode('utf-8')
+    self.request.sendall(b'%04x' % len(data) + data)
+
+  def _fail(self, message):
+    self.request.sendall(b'FAIL')
+    self._string(message)
+
+  def handle(self):
+    server = self.server.fake
+    request = self._read_request()
+    server.requests.append(request)
+    if request == 'host:version':
+      self._okay('%04x' % 41)
+    elif request == 'host:devices':
+      self._okay(''.join('%s\tdevice\n' % s for s in server.devices))
+    elif request.endswith(':features'):
+      device = server.device(request)
+      if device:
+        self._okay(','.join(device.features))
+      else:
+        self._fail('device not found')
+    elif ':forward:' in request and request.startswith('host-serial:'):
+      local, remote = request.split(':forward:', 1)[1].split(';')
+      server.forwards[local] = remote
+      self._okay()
+      self._okay('12345' if local == 'tcp:0' else None)
+    elif ':killforward:' in request:
+      server.forwards.pop(request.split(':killforward:', 1)[1], None)
+      self._okay()
+    elif request.startswith('host:transport'):
+      device = server.device(request)
+      if not device:
+        self._fail('device not found')
+        return
+      self._okay()
+      self._device_service(device, self._read_request())
+    else:
+      self._fail('unknown host service')
+
+  def _device_service(self, device, service):
+    if service.startswith('shell,v2,raw:'):
+      self._okay()
+      stdin = b''
+      while True:
+        packet_id, size = struct.unpack('<BI', self._recv_exactly(5))
+        if packet_id == 4:  # Close stdin.
+          break
+        stdin += self._recv_exactly(size)
+      returncode, out, err = device.run(service.split(':', 1)[1], stdin)
+      for packet_id, data in ((1, out), (2, err), (3, bytes([returncode]))):
+        if data:
+          self.request.sendall(struct.pack('<BI', packet_id, len(data)) + data)
+    elif service.startswith('shell:'):
+      self._okay()
+      # Like a pty, stderr is mixed into stdout.
+      _, out, _ = device.run('exec 2>&1; ' + service.split(':', 1)[1])
+      self.request.sendall(out)
+    elif service.startswith('exec:cmd package install -S '):
+      self._okay()
+      size = int(service.split()[4])
+      device.installed.append(self._recv_exactly(size))
+      self.request.sendall(b'Success\n')
+    elif service == 'sync:':
+      self._okay()
+      self._sync(device)
+    elif service.startswith('exec:'):
+      self._okay()
+      command = service.split(':', 1)[1]
+      stdin = b''
+      if 'crbuild-exit:' in command:
+        # ShellSession input, ended by shutting down the socket.
+        while True:
+          chunk = self.request.recv(65536)
+          if not chunk:
+            break
+          stdin += chunk
+      self.request.sendall(device.run(command, stdin)[1])
+    elif service.startswith('reverse:forward:'):
+      remote, local = service[len('reverse:forward:'):].split(';')
+      device.reverses[remote] = local
+      self._okay()
+      self._okay('23456' if remote == 'tcp:0' else None)
+    elif service.startswith('reverse:killforward:'):
+      device.reverses.pop(service[len('reverse:killforward:'):], None)
+      self._okay()
+      self._okay()
+    else:
+      self._fail('unknown device service')
+
+  def _sync(self, device):
+    while True:
+      header = self._recv_exactly(8)
+      if not header or header[:4] == b'QUIT':
+        return
+      size = struct.unpack('<I', header[4:])[0]
+      assert header[:4] == b'SEND'
+      path = self._recv_exactly(size).decode('utf-8').rsplit(',', 1)[0]
+      data = b''
+      while True:
+        header = self._recv_exactly(8)
+        size = struct.unpack('<I', header[4:])[0]
+        if header[:4] == b'DONE':
+          break
+        data += self._recv_exactly(size)
+      device.files[path] = data
+      self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+class FakeAdbServer(object):
+  def __init__(self, devices):
+    self.devices = {d.serial: d for d in devices}
+    self.requests = []
+    self.forwards = {}
+    self._server = _Server(('127.0.0.1', 0), _Handler)
+    self._server.fake = self
+    self.port = self._server.server_address[1]
+    self._thread = threading.Thread(target=self._server.serve_forever,
+                                    args=(0.05,))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def device(self, request):
+    '''Return the device a host request is for.'''
+    if request.startswith('host-serial:'):
+      return self.devices.get(request.split(':')[1])
+    if request.startswith('host:transport:'):
+      return self.devices.get(request[len('host:transport:'):])
+    if len(self.devices) == 1:
+      return next(iter(self.devices.values()))
+    return None
+
+  def close(self):
+    self._server.shutdown()
+    self._server.server_close()
@@ -25,5 +25,34 @@ class TestAdb(unittest.TestCase):
     device_info = adb.DeviceInfo('serial', 27, 'arm64-v8', [])
     self.assertEqual('arm64', device_info.cpu())
 
+  def test_parse_device_info(self):
+    device_info = adb.Adb.parse_device_info(
+        'serial', '28\r\narm64-v8a\r\ncom.google.android.gms\r\n')
+    self.assertEqual(28, device_info.api_level)
+    self.assertEqual('arm64-v8a', device_info.cpu_abi)
+    self.assertTrue(device_info.has_gms())
+    device_info = adb.Adb.parse_device_info('serial', '27\nx86\n')
+    self.assertEqual('x86', device_info.cpu_abi)
+    self.assertFalse(device_info.has_gms())
+
+class TestDeviceInfoMap(unittest.TestCase):
+
+  def test_lazy(self):
+    queried = []
+    def query(serial):
+      queried.append(serial)
+      return adb.DeviceInfo(serial, 28, 'x86', [])
+    devices = adb.DeviceInfoMap(['emulator-5554', 'emulator-5556'], query)
+    self.assertEqual(2, len(devices))
+    self.assertIn('emulator-5556', devices)
+    self.assertListEqual([], queried)
+    self.assertEqual('emulator-5556', devices['emulator-5556'].serial)
+    self.assertListEqual(['emulator-5556'], queried)
+    self.assertListEqual(['emulator-5554', 'emulator-5556'],
+                         [info.serial for info in devices.values()])
+    self.assertListEqual(['emulator-5556', 'emulator-5554'], queried)
+    with self.assertRaises(KeyError):
+      devices['missing']
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (adb, adb_client)
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+
+class TestAdbClient(unittest.TestCase):
+
+  def setUp(self):
+    self.phone = FakeDevice('phone', props={'ro.build.version.sdk': '28',
+                                            'ro.product.cpu.abi': 'arm64-v8a'},
+                            packages=['com.google.android.gms'])
+    self.old_phone = FakeDevice('old_phone', shell_v2=False)
+    self.server = FakeAdbServer([self.phone, self.old_phone])
+    self.client = adb_client.AdbClient(port=self.server.port,
+                                       start_server=False)
+
+  def tearDown(self):
+    self.server.close()
+
+  def test_host_services(self):
+    self.assertEqual(41, self.client.version())
+    self.assertDictEqual({'phone': 'device', 'old_phone': 'device'},
+                         self.client.devices())
+
+  def test_shell(self):
+    self.assertEqual((3, b'out\n', b'err\n'), self.client.shell(
+        'phone', 'echo out; echo err >&2; exit 3'))
+    self.assertEqual('arm64-v8a',
+                     self.client.getprop('phone', 'ro.product.cpu.abi'))
+    with self.assertRaises(subprocess.CalledProcessError) as cm:
+      self.client.check_shell('phone', ['sh', '-c', 'exit 2'])
+    self.assertEqual(2, cm.exception.returncode)
+
+  def test_legacy_shell(self):
+    self.assertEqual((3, b'out\nerr\n', b''), self.client.shell(
+        'old_phone', 'echo out; echo err >&2; exit 3'))
+
+  def test_open_shell(self):
+    for serial in ('phone', 'old_phone'):
+      session = self.client.open_shell(serial, 'cat; exit 4')
+      session.write(b'x' * (adb_client.ShellSession.max_packet_size + 1))
+      session.close_stdin()
+      returncode, out, _ = session.wait()
+      self.assertEqual(4, returncode)
+      self.assertEqual(adb_client.ShellSession.max_packet_size + 1, len(out))
+
+  def test_exec_out(self):
+    self.assertEqual(b'\x00\x01', self.client.exec_out(
+        'phone', "printf '\\000\\001'"))
+
+  def test_unknown_device(self):
+    with self.assertRaises(adb_client.AdbError):
+      self.client.exec_out('missing', 'true')
+
+  def test_forward(self):
+    self.assertIsNone(self.client.forward('phone', 'tcp:8000', 'tcp:8001'))
+    self.assertEqual('tcp:8001', self.server.forwards['tcp:8000'])
+    self.assertEqual(12345, self.client.forward('phone', 'tcp:0', 'tcp:8001'))
+    self.client.forward_remove('phone', 'tcp:8000')
+    self.assertNotIn('tcp:8000', self.server.forwards)
+    self.assertIsNone(self.client.reverse('phone', 'tcp:8000', 'tcp:9000'))
+    self.assertEqual('tcp:9000', self.phone.reverses['tcp:8000'])
+    self.client.reverse_remove('phone', 'tcp:8000')
+    self.assertDictEqual({}, self.phone.reverses)
+
+  def test_query_device_info(self):
+    adb_client.AdbClient._instance = self.client
+    try:
+      info = adb.Adb.query_device_info('phone')
+    finally:
+      adb_client.AdbClient._instance = None
+    self.assertEqual(28, info.api_level)
+    self.assertEqual('arm64-v8a', info.cpu_abi)
+    self.assertTrue(info.has_gms())
+    self.assertEqual(1, len(self.phone.commands))
+
+if __name__ == '__main__':
+    unittest.main()
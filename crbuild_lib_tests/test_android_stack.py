@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (adb_client, android_stack, symbolizer)
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+from test_symbolizer import (FAKE_LLVM_SYMBOLIZER, create_elf64)
+
+LOGCAT = b'''\
+01-02 03:04:05.678  1234  1234 F DEBUG   : signal 11 (SIGSEGV), code 1
+01-02 03:04:05.679  1234  1234 F DEBUG   :       #00 pc 00000000000012ab  /data/app/org.chromium.chrome-1/base.apk!libchrome.so (offset 0x1000) (BuildId: 0123456789abcdef)
+01-02 03:04:05.679  1234  1234 F DEBUG   :       #01 pc 0000000000000abc  /system/lib64/libc.so (abort+160) (BuildId: 99)
+01-02 03:04:05.680  1234  1234 I chromium: after the crash
+'''
+
+TOMBSTONE = '''\
+*** *** *** *** *** *** *** *** *** *** *** *** *** *** *** ***
+pid: 1234, tid: 1234, name: chrome  >>> org.chromium.chrome <<<
+signal 6 (SIGABRT), code -1 (SI_QUEUE), fault addr --------
+Abort message: 'Check failed: false'
+backtrace:
+      #00 pc 0000000000000010  /data/app/lib/arm64/libchrome.so (BuildId: 0123456789abcdef)
+
+backtrace of another thread:
+      #00 pc 0000000000000020  /data/app/lib/arm64/libchrome.so (BuildId: 0123456789abcdef)
+'''
+
+class TestAndroidStackSymbolizer(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    tool = os.path.join(self.tmp_dir.name, 'llvm-symbolizer')
+    with open(tool, 'w') as f:
+      f.write(FAKE_LLVM_SYMBOLIZER % (
+          sys.executable, os.path.join(self.tmp_dir.name, 'requests.txt')))
+    os.chmod(tool, stat.S_IRWXU)
+    build_dir = os.path.join(self.tmp_dir.name, 'out')
+    os.makedirs(os.path.join(build_dir, 'lib.unstripped'))
+    with open(os.path.join(build_dir, 'lib.unstripped', 'libchrome.so'),
+              'wb') as f:
+      f.write(create_elf64(bytes.fromhex('0123456789abcdef')))
+    self.symbolizer = symbolizer.Symbolizer(
+        tool, os.path.join(self.tmp_dir.name, 'cache'), pool_size=1)
+    self.output = []
+    self.stack_symbolizer = android_stack.AndroidStackSymbolizer(
+        build_dir, self.symbolizer, self.output.append)
+
+  def tearDown(self):
+    self.symbolizer.close()
+    self.tmp_dir.cleanup()
+
+  def test_logcat(self):
+    # Split mid-line, as read from the stream.
+    self.stack_symbolizer.process(LOGCAT[:200])
+    self.assertListEqual([], self.output)
+    self.stack_symbolizer.process(LOGCAT[200:])
+    self.assertEqual(1, len(self.output))
+    self.assertListEqual([
+        'Symbolized crash stack:',
+        '#00 pc 00000000000012ab  libchrome.so func_0x12ab file.cc:4779:0',
+        # Not from the build (and a different build ID): unchanged.
+        '#01 pc 0000000000000abc  /system/lib64/libc.so (abort+160) '
+        '(BuildId: 99)'],
+        self.output[0].splitlines())
+
+  def test_flush(self):
+    self.stack_symbolizer.process(LOGCAT.splitlines(True)[1])
+    self.assertListEqual([], self.output)
+    self.stack_symbolizer.flush()
+    self.assertEqual(1, len(self.output))
+
+  def test_no_symbols(self):
+    self.stack_symbolizer.process(LOGCAT.splitlines(True)[2] + b'end\n')
+    self.assertListEqual([], self.output)
+
+  def test_build_id_mismatch(self):
+    self.stack_symbolizer.process(
+        LOGCAT.splitlines(True)[1].replace(b'0123456789abcdef', b'fedcba')
+        + b'end\n')
+    self.assertListEqual([], self.output)
+
+  def test_read_tombstones(self):
+    phone = FakeDevice('phone')
+    tombstone_dir = os.path.join(self.tmp_dir.name, 'tombstones')
+    os.makedirs(tombstone_dir)
+    with open(os.path.join(tombstone_dir, 'tombstone_01'), 'w') as f:
+      f.write(TOMBSTONE)
+    server = FakeAdbServer([phone])
+    try:
+      client = adb_client.AdbClient(port=server.port, start_server=False)
+      android_stack.AndroidStackSymbolizer.tombstone_dir = tombstone_dir
+      self.stack_symbolizer.read_tombstones(client, 'phone', 60)
+    finally:
+      android_stack.AndroidStackSymbolizer.tombstone_dir = '/data/tombstones'
+      server.close()
+    self.assertEqual(1, len(self.output))
+    self.assertListEqual([
+        'Symbolized crash stack (%s/tombstone_01):' % tombstone_dir,
+        'pid: 1234, tid: 1234, name: chrome  >>> org.chromium.chrome <<<',
+        'signal 6 (SIGABRT), code -1 (SI_QUEUE), fault addr --------',
+        "Abort message: 'Check failed: false'",
+        '#00 pc 0000000000000010  libchrome.so func_0x10 file.cc:16:0'],
+        self.output[0].splitlines())
+
+if __name__ == '__main__':
+    unittest.main()
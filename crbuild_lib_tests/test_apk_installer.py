@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (adb_client, apk_installer)
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+
+class TestApkInstaller(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.build_dir = self.tmp_dir.name
+    os.makedirs(os.path.join(self.build_dir, 'bin'))
+    os.makedirs(os.path.join(self.build_dir, 'apks'))
+    self.apk_path = os.path.join(self.build_dir, 'apks', 'ChromePublic.apk')
+    with open(self.apk_path, 'wb') as f:
+      f.write(os.urandom(200 * 1024))
+    # Devices supporting (and not supporting) streamed installs.
+    self.new_device = FakeDevice('new')
+    self.old_device = FakeDevice('old')
+    self.old_device.features.remove('cmd')
+    self.server = FakeAdbServer([self.new_device, self.old_device])
+    self.installer = apk_installer.ApkInstaller(adb_client.AdbClient(
+        port=self.server.port, start_server=False))
+
+  def tearDown(self):
+    self.installer.close()
+    self.server.close()
+    self.tmp_dir.cleanup()
+
+  def test_find_apks(self):
+    wrapper = os.path.join(self.build_dir, 'bin', 'chrome_public_apk')
+    with open(wrapper, 'w') as f:
+      f.write("  apk_operations.Run(\n"
+              "      output_dir,\n"
+              "      resolve('../apks/ChromePublic.apk'),\n"
+              "      [resolve(p) for p in ['../apks/Extra.apk']],\n")
+    self.assertListEqual([self.apk_path,
+                          os.path.join(self.build_dir, 'apks', 'Extra.apk')],
+                         apk_installer.ApkInstaller.find_apks(wrapper))
+    self.assertListEqual([], apk_installer.ApkInstaller.find_apks(
+        os.path.join(self.build_dir, 'bin', 'missing')))
+
+  def test_install(self):
+    with open(self.apk_path, 'rb') as f:
+      data = f.read()
+    self.installer.install('new', self.apk_path)
+    self.installer.install('old', self.apk_path)
+    self.assertListEqual([data], self.new_device.installed)
+    self.assertEqual(1, len(self.old_device.files))
+    self.assertEqual(data, list(self.old_device.files.values())[0])
+
+  def test_install_failure(self):
+    with self.assertRaises(subprocess.CalledProcessError):
+      self.installer.install('missing', self.apk_path)
+
+if __name__ == '__main__':
+    unittest.main()
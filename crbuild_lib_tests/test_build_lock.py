@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (build_lock)
+
+class TestBuildLock(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.build_dir = os.path.join(self.tmp_dir.name, 'Debug')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_single_build(self):
+    lock = build_lock.BuildLock(self.build_dir)
+    built = []
+    result = lock.build(['b', 'a', 'a'], lambda t: built.append(t) or [])
+    self.assertListEqual([], result)
+    self.assertListEqual([['a', 'b']], built)
+
+  def test_attach_and_coalesce(self):
+    first_started = threading.Event()
+    finish_first = threading.Event()
+    built = []
+    results = {}
+    error = subprocess.CalledProcessError(returncode=1, cmd=['ninja'])
+
+    def build_func(targets):
+      built.append(targets)
+      if len(built) == 1:
+        first_started.set()
+        finish_first.wait(5)
+        return [error]
+      return []
+
+    def request(name, targets):
+      # Each request uses its own instance, as separate processes would.
+      lock = build_lock.BuildLock(self.build_dir)
+      results[name] = lock.build(targets, build_func)
+
+    first = threading.Thread(target=request, args=('first', ['a', 'b']))
+    first.start()
+    first_started.wait(5)
+    waiters = [threading.Thread(target=request, args=('attach', ['a'])),
+               threading.Thread(target=request, args=('queue1', ['c'])),
+               threading.Thread(target=request, args=('queue2', ['a', 'd']))]
+    for t in waiters:
+      t.start()
+    # Give the waiters time to register before the first build finishes.
+    threading.Event().wait(0.5)
+    finish_first.set()
+    for t in [first] + waiters:
+      t.join(10)
+
+    # One build for the first request, one for both queued requests.
+    self.assertListEqual([['a', 'b'], ['a', 'c', 'd']], built)
+    self.assertEqual(1, results['first'][0].returncode)
+    self.assertEqual(1, results['attach'][0].returncode)
+    self.assertListEqual(['ninja'], results['attach'][0].cmd)
+    self.assertListEqual([], results['queue1'])
+    self.assertListEqual([], results['queue2'])
+
+if __name__ == '__main__':
+    unittest.main()
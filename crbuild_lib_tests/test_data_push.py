@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (adb_client, data_push)
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+
+class TestDataPusher(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.src_root = os.path.join(self.tmp_dir.name, 'src')
+    # The fake devices run commands locally, so this is their data root.
+    self.device_root = os.path.join(self.tmp_dir.name, 'device')
+    for name in ('a.txt', os.path.join('sub', 'b.bin')):
+      self._write(name, name.encode('utf-8'))
+    self.phone = FakeDevice('phone')
+    self.old_phone = FakeDevice('old_phone', shell_v2=False)
+    self.server = FakeAdbServer([self.phone, self.old_phone])
+    self.client = adb_client.AdbClient(port=self.server.port,
+                                       start_server=False)
+
+  def tearDown(self):
+    self.server.close()
+    self.tmp_dir.cleanup()
+
+  def _write(self, name, data):
+    path = os.path.join(self.src_root, 'data', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+      f.write(data)
+    # Digests are memoized by mtime so make every write look different.
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000000000))
+
+  def _pusher(self):
+    return data_push.DataPusher(self.src_root,
+                                os.path.join(self.tmp_dir.name, 'manifests'),
+                                client=self.client,
+                                device_root=self.device_root)
+
+  def _device_file(self, name):
+    with open(os.path.join(self.device_root, 'data', name), 'rb') as f:
+      return f.read()
+
+  def test_host_files(self):
+    self.assertDictEqual(
+        {'data/a.txt': os.path.join(self.src_root, 'data', 'a.txt'),
+         'data/sub/b.bin': os.path.join(self.src_root, 'data', 'sub',
+                                        'b.bin')},
+        self._pusher().host_files(['data']))
+
+  def test_push_delta(self):
+    pusher = self._pusher()
+    self.assertEqual(2, pusher.push('phone', ['data']))
+    self.assertEqual(b'sub/b.bin', self._device_file('sub/b.bin'))
+    # Nothing changed: only the manifest id is read from the device.
+    self.phone.commands = []
+    self.assertEqual(0, pusher.push('phone', ['data']))
+    self.assertEqual(1, len(self.phone.commands))
+    self._write('a.txt', b'changed')
+    self.assertEqual(1, self._pusher().push('phone', ['data']))
+    self.assertEqual(b'changed', self._device_file('a.txt'))
+
+  def test_push_legacy_shell(self):
+    self.assertEqual(2, self._pusher().push('old_phone', ['data']))
+    self.assertEqual(b'a.txt', self._device_file('a.txt'))
+
+  def test_manifest_id_mismatch(self):
+    pusher = self._pusher()
+    self.assertEqual(2, pusher.push('phone', ['data']))
+    # E.g. the device was wiped: everything is pushed again.
+    os.remove(os.path.join(self.device_root,
+                           data_push.DataPusher.id_file))
+    self.assertEqual(2, pusher.push('phone', ['data']))
+
+  def test_push_failure(self):
+    pusher = self._pusher()
+    with open(os.path.join(self.tmp_dir.name, 'device'), 'w') as f:
+      f.write('Not a directory')
+    with self.assertRaises(subprocess.CalledProcessError):
+      pusher.push('phone', ['data'])
+    os.remove(os.path.join(self.tmp_dir.name, 'device'))
+    # The failed push wasn't recorded.
+    self.assertEqual(2, pusher.push('phone', ['data']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (device_pool)
+
+class TestDevicePool(unittest.TestCase):
+
+  def test_work_stealing(self):
+    pool = device_pool.DevicePool(['fast', 'slow'], is_online=lambda d: True)
+    def run_shard(device, shard):
+      time.sleep(0.001 if device == 'fast' else 0.2)
+      return []
+    shards = pool.run(6, run_shard)
+    self.assertTrue(all(s.passed() for s in shards))
+    ran_on = [s.devices[0] for s in shards]
+    self.assertGreater(ran_on.count('fast'), ran_on.count('slow'))
+    self.assertEqual('6 of 6 shards passed',
+                     device_pool.DevicePool.summary(shards)[0])
+
+  def test_offline_requeued(self):
+    online = {'flaky': True, 'good': True, 'gone': False}
+    pool = device_pool.DevicePool(['flaky', 'good', 'gone'],
+                                  is_online=lambda d: online[d])
+    self.assertListEqual(['flaky', 'good'], pool.devices)
+    lock = threading.Lock()
+    def run_shard(device, shard):
+      if device == 'flaky':
+        with lock:
+          online['flaky'] = False
+        return [Exception('device offline')]
+      if shard.index == 2:
+        return [Exception('test failed')]
+      time.sleep(0.01)
+      return []
+    shards = pool.run(4, run_shard)
+    self.assertListEqual([[], [], ['test failed'], []],
+                         [[str(e) for e in s.exceptions] for s in shards])
+    self.assertTrue(all(s.devices[-1] == 'good' for s in shards))
+    self.assertEqual('3 of 4 shards passed',
+                     device_pool.DevicePool.summary(shards)[0])
+
+  def test_retry_failures(self):
+    pool = device_pool.DevicePool(['bad', 'good'], is_online=lambda d: True,
+                                  retry_failures=True)
+    def run_shard(device, shard):
+      time.sleep(0.01)
+      if device == 'bad' or shard.index == 3:
+        return [Exception('failed on %s' % device)]
+      return []
+    shards = pool.run(4, run_shard)
+    self.assertListEqual([True, True, True, False],
+                         [s.passed() for s in shards])
+    self.assertTrue(all(s.devices[-1] == 'good' for s in shards[:3]))
+    # Never run twice on one device.
+    self.assertTrue(all(len(set(s.devices)) == len(s.devices)
+                        for s in shards))
+    self.assertIn(str(shards[3].exceptions[0]),
+                  ('failed on bad', 'failed on good'))
+
+  def test_setup_failure(self):
+    pool = device_pool.DevicePool(['bad'], is_online=lambda d: True)
+    shards = pool.run(2, lambda device, shard: [],
+                      setup=lambda device: [Exception('install failed')])
+    self.assertTrue(all(s.exceptions is None for s in shards))
+    self.assertIn('not run', device_pool.DevicePool.summary(shards)[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (command, failure_matcher)
+
+class TestFailureMatcher(unittest.TestCase):
+
+  def test_matches_and_line_numbers(self):
+    matcher = failure_matcher.FailureMatcher()
+    self.assertEqual(b'ok\n', matcher.process(0, b'ok\n'))
+    matcher.process(0, b'[ RUN      ] Foo.Bar\n[  FAILED  ] Foo.Bar\n')
+    matcher.process(1, b'==1==ERROR: AddressSanitizer: heap-use-after-free\n')
+    self.assertEqual(2, matcher.num_matches)
+    self.assertListEqual(['stdout:3: [  FAILED  ] Foo.Bar',
+                          'stderr:1: ==1==ERROR: AddressSanitizer: '
+                          'heap-use-after-free'],
+                         [str(m) for m in matcher.matches])
+
+  def test_match_split_across_chunks(self):
+    matcher = failure_matcher.FailureMatcher()
+    matcher.process(0, b'line one\n[FATAL:foo.cc(12)] Check fa')
+    matcher.process(0, b'iled: x. \nline three\n')
+    self.assertEqual(1, matcher.num_matches)
+    self.assertEqual('stdout:2: [FATAL:foo.cc(12)] Check failed: x. ',
+                     str(matcher.matches[0]))
+
+  def test_custom_patterns(self):
+    matcher = failure_matcher.FailureMatcher(patterns=['Oh no'])
+    matcher.process(0, b'Oh no\n')
+    self.assertEqual(1, matcher.num_matches)
+
+  def test_highlight(self):
+    matcher = failure_matcher.FailureMatcher(highlight=True)
+    out = matcher.process(0, b'a Check failed: b\n')
+    self.assertEqual(b'a ' + command.bcolors.FAIL.encode() + b'Check failed:' +
+                     command.bcolors.ENDC.encode() + b' b\n', out)
+
+  def test_summary(self):
+    matcher = failure_matcher.FailureMatcher()
+    self.assertListEqual([], matcher.summary())
+    matcher.process(0, b'[  FAILED  ] A\n' * 150)
+    summary = matcher.summary()
+    self.assertEqual('150 failure line(s) found:', summary[0])
+    self.assertEqual('  ... and 50 more', summary[-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (install_index)
+
+class TestInstallIndex(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.index_path = os.path.join(self.tmp_dir.name, 'cache', 'index.json')
+    self.apk_path = self._write_apk('Debug', b'apk contents')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write_apk(self, build_name, contents):
+    apk_dir = os.path.join(self.tmp_dir.name, build_name, 'apks')
+    os.makedirs(apk_dir, exist_ok=True)
+    path = os.path.join(apk_dir, 'ChromePublic.apk')
+    with open(path, 'wb') as f:
+      f.write(contents)
+    return path
+
+  def test_installed(self):
+    index = install_index.InstallIndex(self.index_path)
+    digest = index.digest(self.apk_path)
+    self.assertFalse(index.is_installed('phone', self.apk_path, digest))
+    index.add('phone', self.apk_path, digest)
+    self.assertTrue(index.is_installed('phone', self.apk_path, digest))
+    self.assertFalse(index.is_installed('tablet', self.apk_path, digest))
+
+    # Persisted, and merged with other processes' devices.
+    other = install_index.InstallIndex(self.index_path)
+    other.add('tablet', self.apk_path, digest)
+    index.add('phone', self.apk_path, digest)
+    reloaded = install_index.InstallIndex(self.index_path)
+    self.assertTrue(reloaded.is_installed('phone', self.apk_path, digest))
+    self.assertTrue(reloaded.is_installed('tablet', self.apk_path, digest))
+
+    reloaded.remove('phone', self.apk_path)
+    self.assertFalse(reloaded.is_installed('phone', self.apk_path, digest))
+
+  def test_same_apk_other_build(self):
+    index = install_index.InstallIndex(self.index_path)
+    index.add('phone', self.apk_path, index.digest(self.apk_path))
+    release_apk = self._write_apk('Release', b'release contents')
+    self.assertFalse(index.is_installed('phone', release_apk,
+                                        index.digest(release_apk)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (adb_client, android_stack, logcat)
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+
+class TestLogcatCapture(unittest.TestCase):
+
+  def setUp(self):
+    self.phone = FakeDevice('phone')
+    self.phone.logcat = 'F DEBUG: Check failed: x\n'
+    self.server = FakeAdbServer([self.phone])
+    self.client = adb_client.AdbClient(port=self.server.port,
+                                       start_server=False)
+    self.output = []
+    # Set once the streams (each printing the logcat) have been read.
+    self.received = threading.Event()
+    self.num_streams = 1
+
+  def tearDown(self):
+    self.server.close()
+
+  def _sink(self, data):
+    self.output.append(data)
+    if b''.join(self.output).count(b'Check failed') >= self.num_streams:
+      self.received.set()
+
+  def _capture(self, package=None, tags=None):
+    capture = logcat.LogcatCapture('phone', [self._sink], package=package,
+                                   tags=tags, client=self.client)
+    capture.start()
+    self.assertTrue(self.received.wait(10))
+    capture.stop()
+    return b''.join(self.output).decode('utf-8').splitlines()
+
+  def test_command(self):
+    capture = logcat.LogcatCapture('phone', [], tags=['chromium', 'DEBUG'])
+    # Crashes are logged by another process, so read by crash_command.
+    self.assertEqual("logcat -v threadtime -T '01-02 03:04:05.000' "
+                     "--pid=42 chromium:V '*:S'",
+                     capture.command('01-02 03:04:05.000', 42))
+    self.assertEqual("logcat -v threadtime -T '01-02 03:04:05.000' "
+                     "chromium:V DEBUG:V libc:V '*:S'",
+                     capture.command('01-02 03:04:05.000'))
+    self.assertEqual("logcat -v threadtime -T '01-02 03:04:05.000' "
+                     "DEBUG:V libc:V '*:S'",
+                     capture.crash_command('01-02 03:04:05.000'))
+    capture = logcat.LogcatCapture('phone', [])
+    self.assertEqual("logcat -v threadtime -T '01-02 03:04:05.000' "
+                     "--pid=42 DEBUG:S libc:S",
+                     capture.command('01-02 03:04:05.000', 42))
+
+  def test_capture_all(self):
+    lines = self._capture()
+    self.assertTrue(lines[0].startswith('logcat -v threadtime -T '))
+    self.assertNotIn('--pid', lines[0])
+    self.assertEqual('F DEBUG: Check failed: x', lines[1])
+
+  def test_capture_package(self):
+    self.phone.pids['org.chromium.chrome'] = 1234
+    self.num_streams = 2
+    lines = self._capture(package='org.chromium.chrome', tags=['chromium'])
+    commands = [line for line in lines if line.startswith('logcat ')]
+    self.assertEqual(2, len(commands))
+    self.assertTrue(any(c.endswith('--pid=1234 chromium:V *:S')
+                        for c in commands))
+
+  def test_crash_frames(self):
+    # debuggerd logs the frames from crash_dump's PID, not the app's.
+    frame = ('01-02 03:04:05.678  4321  4321 F DEBUG   :       #00 pc '
+             '000000000123abcd  /data/app/org.chromium.chrome/lib/arm64/'
+             'libchrome.so (BuildId: 12ab)')
+    self.phone.logcat = frame + '\nF DEBUG: Check failed: x\n'
+    lines = self._capture(package='org.chromium.chrome', tags=['chromium'])
+    # The package isn't running, so only the crash stream is read.
+    self.assertTrue(lines[0].startswith('logcat -v threadtime -T '))
+    self.assertTrue(lines[0].endswith(' DEBUG:V libc:V *:S'))
+    self.assertNotIn('--pid', lines[0])
+    self.assertEqual(frame, lines[1])
+    self.assertEqual('#00', android_stack.AndroidStackSymbolizer.frame_re
+                     .search(lines[1]).group(1))
+
+  def test_package_not_running(self):
+    lines = self._capture(package='org.chromium.chrome')
+    # Only the crash stream.
+    self.assertEqual(1, len([l for l in lines if l.startswith('logcat ')]))
+    self.assertNotIn('--pid', lines[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -110,13 +110,25 @@ class TestOptions(unittest.TestCase):
     with self.assertRaises(Exception):
       opts.set_android_defaults()
 
-    # If no cpu/device is given then we can only use them if
-    # a device serial is provided.
+    # If no cpu/device is given then all devices are used if they all have
+    # the same CPU.
     opts = TestOptions._create_android_opts()
     opts.env.android_devices = {
         TestOptions.mock_arm_device1_info.serial: TestOptions.mock_arm_device1_info,
         TestOptions.mock_arm_device2_info.serial: TestOptions.mock_arm_device2_info
     }
+    opts.set_android_defaults()
+    self.assertEqual('arm64', opts.buildopts.target_cpu)
+    self.assertEqual('emulator-5554', opts.target_android_device_serial)
+    self.assertListEqual(['emulator-5554', 'emulator-5555'],
+                         opts.target_android_devices)
+
+    # ... but not if they have different CPUs.
+    opts = TestOptions._create_android_opts()
+    opts.env.android_devices = {
+        TestOptions.mock_arm_device1_info.serial: TestOptions.mock_arm_device1_info,
+        TestOptions.mock_x86_device1_info.serial: TestOptions.mock_x86_device1_info
+    }
     with self.assertRaises(Exception):
       opts.set_android_defaults()
 
@@ -141,6 +153,23 @@ class TestOptions(unittest.TestCase):
     with self.assertRaises(Exception):
       opts.set_android_defaults()
 
+  def test_select_android_devices(self):
+    devices = {
+        TestOptions.mock_arm_device1_info.serial:
+            TestOptions.mock_arm_device1_info,
+        TestOptions.mock_arm_device2_info.serial:
+            TestOptions.mock_arm_device2_info,
+    }
+    self.assertListEqual(['emulator-5554', 'emulator-5555'],
+                         options.Options.select_android_devices('all', devices))
+    self.assertListEqual(['emulator-5555'],
+                         options.Options.select_android_devices(
+                             'emulator-5555', devices))
+    with self.assertRaises(options.InvalidOption):
+      options.Options.select_android_devices('emulator-5554,unknown', devices)
+    with self.assertRaises(options.InvalidOption):
+      options.Options.select_android_devices('all', {})
+
   def test_invalid_os(self):
     opts = TestOptions._create_opts()
     with self.assertRaises(options.InvalidOption):
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (plan)
+
+class TestPlan(unittest.TestCase):
+
+  def test_dependency_order(self):
+    order = []
+    p = plan.Plan(num_cpus=4)
+    a = p.add_step('a', lambda: order.append('a'))
+    b = p.add_step('b', lambda: order.append('b'), deps=[a])
+    p.add_step('c', lambda: order.append('c'), deps=[b])
+    self.assertListEqual([], p.execute())
+    self.assertListEqual(['a', 'b', 'c'], order)
+
+  def test_failure_skips_dependents(self):
+    error = Exception('failed')
+    ran = []
+    p = plan.Plan(num_cpus=4)
+    a = p.add_step('a', lambda: [error])
+    b = p.add_step('b', lambda: ran.append('b'), deps=[a])
+    p.add_step('c', lambda: ran.append('c'), deps=[b])
+    p.add_step('d', lambda: ran.append('d'))
+    self.assertListEqual([error], p.execute())
+    self.assertListEqual(['d'], ran)
+    self.assertTrue(p.steps[1].skipped)
+    self.assertTrue(p.steps[2].skipped)
+
+  def test_independent_steps_overlap(self):
+    # Each step waits for the other to start, which can only succeed if they
+    # are run concurrently.
+    barrier = threading.Barrier(2, timeout=5)
+    p = plan.Plan(num_cpus=2)
+    p.add_step('a', lambda: barrier.wait() and None)
+    p.add_step('b', lambda: barrier.wait() and None)
+    self.assertListEqual([], p.execute())
+
+  def test_exclusive_resources(self):
+    active = []
+    overlapped = []
+    def step():
+      if active:
+        overlapped.append(True)
+      active.append(True)
+      threading.Event().wait(0.05)
+      active.pop()
+    p = plan.Plan(num_cpus=4)
+    p.add_step('a', step, exclusive=['console'])
+    p.add_step('b', step, exclusive=['console'])
+    self.assertListEqual([], p.execute())
+    self.assertListEqual([], overlapped)
+
+  def test_unknown_dependency(self):
+    p = plan.Plan(num_cpus=1)
+    other = plan.Plan(num_cpus=1).add_step('a', lambda: None)
+    with self.assertRaises(plan.PlanError):
+      p.add_step('b', lambda: None, deps=[other])
+
+  def test_estimate(self):
+    p = plan.Plan(num_cpus=4)
+    a = p.add_step('a', lambda: None, cost=2.0)
+    b = p.add_step('b', lambda: None, cost=5.0)
+    c = p.add_step('c', lambda: None, deps=[a, b], cost=1.0)
+    timings = p.estimate()
+    self.assertEqual((0.0, 2.0), timings[a])
+    self.assertEqual((5.0, 6.0), timings[c])
+
+if __name__ == '__main__':
+    unittest.main()
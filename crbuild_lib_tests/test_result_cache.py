@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (models, result_cache)
+
+class TestResultCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.build_dir = self.tmp_dir.name
+    self.exe = self._write('base_unittests', b'exe')
+    self.lib = self._write('libbase.so', b'lib')
+    self.data = self._write('data.txt', b'data')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write(self, name, contents):
+    path = os.path.join(self.build_dir, name)
+    with open(path, 'wb') as f:
+      f.write(contents)
+    return path
+
+  def _key(self, cache, args=None, env_var=None):
+    return cache.key([self.exe] + (args or []), env_var, [self.data])
+
+  def test_pass_is_remembered(self):
+    cache = result_cache.ResultCache(self.build_dir)
+    key = self._key(cache)
+    self.assertFalse(cache.has_pass(key))
+    cache.add_pass(key, [self.exe])
+    self.assertTrue(cache.has_pass(key))
+    # And persisted.
+    cache = result_cache.ResultCache(self.build_dir)
+    self.assertTrue(cache.has_pass(self._key(cache)))
+
+  def test_key_inputs(self):
+    cache = result_cache.ResultCache(self.build_dir)
+    key = self._key(cache)
+    self.assertEqual(key, self._key(cache))
+    self.assertNotEqual(key, self._key(cache, args=['--gtest_filter=Foo']))
+    env_var = models.EnvVar('ASAN_OPTIONS')
+    env_var.values = ['detect_leaks=1']
+    self.assertNotEqual(key, self._key(cache, env_var=env_var))
+    for path in (self.exe, self.lib, self.data):
+      self._write(os.path.basename(path), b'changed')
+      new_key = self._key(cache)
+      self.assertNotEqual(key, new_key)
+      key = new_key
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (run_log)
+
+class TestRunLog(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.log_dir = os.path.join(self.tmp_dir.name, 'logs')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_log_contents(self):
+    log = run_log.RunLog(self.log_dir, 'base_unittests')
+    log.write(0, b'one\ntw')
+    log.write(0, b'o\n')
+    log.write(1, b'partial')
+    log.write(0, b'three\n')
+    log.close()
+    self.assertTrue(log.path.endswith('base_unittests.log.gz'))
+    with gzip.open(log.path, 'rb') as f:
+      lines = f.read().decode('utf-8').splitlines()
+    stripped = [re.sub(r'^\[[0-9:.]+ ', '[', line) for line in lines]
+    self.assertListEqual(['[out] one', '[out] two', '[err] partial',
+                          '[out] three'], stripped)
+
+  def test_tail_is_bounded(self):
+    log = run_log.RunLog(self.log_dir, 'test')
+    for i in range(100000):
+      log.write(0, b'line %d\n' % i)
+    log.close()
+    self.assertListEqual(['line 99998', 'line 99999'], log.tail(2))
+    self.assertLess(log._tail_size,
+                    run_log.RunLog.tail_bytes + len(b'line 99999\n'))
+
+  def test_rotate(self):
+    os.makedirs(self.log_dir)
+    for i in range(5):
+      path = os.path.join(self.log_dir, '%d.log.gz' % i)
+      with open(path, 'wb') as f:
+        f.write(b'x' * 100)
+      os.utime(path, (i, i))
+    run_log.RunLog.rotate(self.log_dir, 250)
+    self.assertListEqual(['3.log.gz', '4.log.gz'],
+                         sorted(os.listdir(self.log_dir)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (self_profile)
+
+def profiled_in_thread():
+  return sum(range(1000))
+
+class TestSelfProfiler(unittest.TestCase):
+
+  def test_requested(self):
+    self.assertTrue(self_profile.SelfProfiler.requested(
+        ['-r', '--profile-self', 'base_unittests']))
+    self.assertFalse(self_profile.SelfProfiler.requested(['base_unittests']))
+    # A run argument, not crbuild's.
+    self.assertFalse(self_profile.SelfProfiler.requested(
+        ['-r', 'base_unittests', '--', '--profile-self']))
+
+  def test_threads_merged(self):
+    profiler = self_profile.SelfProfiler()
+    profiler.start()
+    thread = threading.Thread(target=profiled_in_thread)
+    thread.start()
+    thread.join()
+    profiler.stop()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, 'crbuild.pstats')
+      out = io.StringIO()
+      profiler.write(path, out=out)
+      functions = [func[2] for func in pstats.Stats(path).stats]
+    self.assertIn('profiled_in_thread', functions)
+    self.assertIn('profiled_in_thread', out.getvalue())
+    self.assertIn('Profile written to', out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
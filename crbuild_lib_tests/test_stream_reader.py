@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (stream_reader)
+
+def fake_symbolize_frames(lines):
+  return [line + ' in symbolized' for line in lines]
+
+class TestStreamReader(unittest.TestCase):
+
+  @staticmethod
+  def _read(contents, symbolize_frames=None):
+    '''Pass |contents| (list of bytes for stdout) through a StreamReader and
+    return what was written.'''
+    read_fd, write_fd = os.pipe()
+    out = io.TextIOWrapper(io.BytesIO())
+    with os.fdopen(read_fd, 'rb') as in_stream:
+      reader = stream_reader.StreamReader([(in_stream, out)], None, False)
+      if symbolize_frames:
+        reader._symbolize = True
+        reader._symbolize_frames = symbolize_frames
+      with os.fdopen(write_fd, 'wb') as f:
+        for data in contents:
+          f.write(data)
+      reader.join()
+    return out.buffer.getvalue()
+
+  def test_pass_through(self):
+    contents = [b'first line\nsecond ', b'line\n\xff\xfe not utf-8\n',
+                b'x' * 1000000, b'no trailing newline']
+    self.assertEqual(b''.join(contents), TestStreamReader._read(contents))
+
+  def test_symbolize(self):
+    contents = [b'ERROR: AddressSanitizer\n    #0 0x4a1b2c (/out/base_un',
+                b'ittests+0x1b2c)\nnot a frame\n    #1 0x4a1b3d (/out/lib.so',
+                b'+0x3d)']
+    expected = b'ERROR: AddressSanitizer\n' \
+        b'    #0 0x4a1b2c (/out/base_unittests+0x1b2c) in symbolized\n' \
+        b'not a frame\n' \
+        b'    #1 0x4a1b3d (/out/lib.so+0x3d) in symbolized'
+    self.assertEqual(expected,
+                     TestStreamReader._read(contents, fake_symbolize_frames))
+
+  def test_symbolize_partial(self):
+    # Frames in the sanitizer runtime name the function.
+    contents = [b'    #0 0x7f01 in __interceptor_malloc '
+                b'(/lib/libasan.so+0x10)\n',
+                b'    #1 0x7f02 in operator new(unsigned long) '
+                b'(/lib/libasan.so+0x20)\n']
+    self.assertEqual(b'    #0 0x7f01 in __interceptor_malloc '
+                     b'(/lib/libasan.so+0x10) in symbolized\n'
+                     b'    #1 0x7f02 in operator new(unsigned long) '
+                     b'(/lib/libasan.so+0x20) in symbolized\n',
+                     TestStreamReader._read(contents, fake_symbolize_frames))
+
+  def test_multiple_streams(self):
+    pipes = [os.pipe(), os.pipe()]
+    outs = [io.TextIOWrapper(io.BytesIO()), io.TextIOWrapper(io.BytesIO())]
+    in_streams = [os.fdopen(p[0], 'rb') for p in pipes]
+    reader = stream_reader.StreamReader(list(zip(in_streams, outs)), None,
+                                        False)
+    for idx, p in enumerate(pipes):
+      with os.fdopen(p[1], 'wb') as f:
+        f.write(b'stream %d\n' % idx)
+    reader.join()
+    for s in in_streams:
+      s.close()
+    self.assertEqual(b'stream 0\n', outs[0].buffer.getvalue())
+    self.assertEqual(b'stream 1\n', outs[1].buffer.getvalue())
+
+class TestPrefixedOutput(unittest.TestCase):
+
+  def test_prefixed(self):
+    out = io.TextIOWrapper(io.BytesIO())
+    first = stream_reader.PrefixedOutput(out, '[first] ')
+    second = stream_reader.PrefixedOutput(out, '[second] ')
+    first.buffer.write(b'one\ntw')
+    second.buffer.write(b'three\n')
+    first.buffer.write(b'o\n')
+    second.buffer.write(b'four')
+    first.close()
+    second.close()
+    self.assertEqual(b'[first] one\n[second] three\n[first] two\n'
+                     b'[second] four\n', out.buffer.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import struct
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (symbolizer)
+
+# Replies to each request with a function named after the offset, and counts
+# the requests it receives.
+FAKE_LLVM_SYMBOLIZER = '''#!%s
+import sys
+for line in sys.stdin:
+  module, offset = line.split()
+  with open(%r, 'a') as f:
+    f.write(line)
+  print('func_%%s' %% offset)
+  print('file.cc:%%d:0' %% int(offset, 16))
+  print()
+  sys.stdout.flush()
+'''
+
+def create_elf64(build_id):
+  '''Return a minimal ELF64 file containing a PT_NOTE with a build ID.'''
+  note = struct.pack('<III', 4, len(build_id), 3) + b'GNU\0' + build_id
+  phoff = 64
+  note_offset = phoff + 56
+  header = b'\x7fELF' + bytes([2, 1, 1]) + bytes(9)
+  header += struct.pack('<HHIQQQIHHHHHH', 3, 62, 1, 0, phoff, 0, 0, 64, 56,
+                        1, 0, 0, 0)
+  phdr = struct.pack('<IIQQQQQQ', 4, 4, note_offset, 0, 0, len(note),
+                     len(note), 4)
+  return header + phdr + note
+
+class TestSymbolizer(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.requests_log = os.path.join(self.tmp_dir.name, 'requests.txt')
+    self.tool = os.path.join(self.tmp_dir.name, 'llvm-symbolizer')
+    with open(self.tool, 'w') as f:
+      f.write(FAKE_LLVM_SYMBOLIZER % (sys.executable, self.requests_log))
+    os.chmod(self.tool, stat.S_IRWXU)
+    self.module = os.path.join(self.tmp_dir.name, 'libfoo.so')
+    with open(self.module, 'wb') as f:
+      f.write(create_elf64(bytes.fromhex('0123456789abcdef')))
+    self.cache_dir = os.path.join(self.tmp_dir.name, 'cache')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _num_requests(self):
+    if not os.path.exists(self.requests_log):
+      return 0
+    with open(self.requests_log) as f:
+      return len(f.readlines())
+
+  def test_elf_build_id(self):
+    self.assertEqual('0123456789abcdef', symbolizer.elf_build_id(self.module))
+    self.assertEqual(None, symbolizer.elf_build_id(self.tool))
+
+  def test_symbolize_lines(self):
+    lines = ['    #0 0x7f00 (%s+0x10)' % self.module,
+             'not a frame',
+             '    #1 0x7f01 (%s+0x20)' % self.module,
+             '    #2 0x7f02 (/does/not/exist.so+0x30)']
+    expected = ['    #0 0x7f00 in func_0x10 file.cc:16:0',
+                'not a frame',
+                '    #1 0x7f01 in func_0x20 file.cc:32:0',
+                '    #2 0x7f02 (/does/not/exist.so+0x30)']
+    s = symbolizer.Symbolizer(self.tool, self.cache_dir, pool_size=2)
+    self.assertListEqual(expected, s.symbolize_lines(lines))
+    self.assertEqual(2, self._num_requests())
+
+    # Cached in memory.
+    self.assertListEqual(expected, s.symbolize_lines(lines))
+    self.assertEqual(2, self._num_requests())
+    s.close()
+
+    # And on disk (keyed by build ID).
+    s = symbolizer.Symbolizer(self.tool, self.cache_dir, pool_size=2)
+    self.assertListEqual(expected, s.symbolize_lines(lines))
+    self.assertEqual(2, self._num_requests())
+    self.assertTrue(os.path.exists(os.path.join(self.cache_dir,
+                                                '0123456789abcdef.json')))
+
+  def test_symbolize_partial_frame(self):
+    # As printed by the sanitizer runtime for its own functions.
+    s = symbolizer.Symbolizer(self.tool, self.cache_dir, pool_size=2)
+    self.assertListEqual(
+        ['    #0 0x7f03 in func_0x40 file.cc:64:0'],
+        s.symbolize_lines(['    #0 0x7f03 in malloc (%s+0x40)' % self.module]))
+    # The module is the last (module+offset), not the argument list.
+    self.assertListEqual(
+        ['    #3 0x7f03 in func_0x40 file.cc:64:0'],
+        s.symbolize_lines(['    #3 0x7f03 in operator new(unsigned long) '
+                           '(%s+0x40)' % self.module]))
+    s.close()
+
+  def test_close_all(self):
+    s = symbolizer.Symbolizer(self.tool, self.cache_dir, pool_size=1)
+    s.symbolize_lines(['    #0 0x7f00 (%s+0x10)' % self.module])
+    process = s._pool[0]._process
+    instances = symbolizer.Symbolizer._instances
+    symbolizer.Symbolizer._instances = {self.tool: s}
+    try:
+      symbolizer.Symbolizer.close_all()
+    finally:
+      symbolizer.Symbolizer._instances = instances
+    self.assertIsNotNone(process.returncode)
+    self.assertListEqual([None], s._pool)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import (trace)
+
+class TestTracer(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write(self, tracer):
+    path = os.path.join(self.tmp_dir.name, 'trace.json')
+    tracer.write(path)
+    with open(path) as f:
+      return [e for e in json.load(f)['traceEvents'] if e['ph'] == 'X']
+
+  def test_span(self):
+    tracer = trace.Tracer()
+    with tracer.span('load config', args={'file': 'config.yml'}):
+      pass
+    events = self._write(tracer)
+    self.assertEqual(1, len(events))
+    self.assertEqual('load config', events[0]['name'])
+    self.assertEqual({'file': 'config.yml'}, events[0]['args'])
+    self.assertGreaterEqual(events[0]['dur'], 0)
+
+  def test_import_ninja_log(self):
+    log_path = os.path.join(self.tmp_dir.name, '.ninja_log')
+    with open(log_path, 'w') as f:
+      f.write('# ninja log v5\n')
+      f.write('0\t100\t1\tobj/old.o\tabc\n')
+    offset = trace.Tracer.ninja_log_size(self.tmp_dir.name)
+    with open(log_path, 'a') as f:
+      f.write('0\t100\t1\tobj/a.o\tabc\n')
+      f.write('10\t50\t1\tobj/b.o\tabc\n')
+      f.write('10\t50\t1\tobj/b.h\tabc\n')
+      f.write('100\t200\t1\tbase_unittests\tabc\n')
+    tracer = trace.Tracer()
+    tracer.import_ninja_log(self.tmp_dir.name, offset, tracer._start)
+    events = self._write(tracer)
+    self.assertListEqual(
+        [('a.o', 0, 100000, 1), ('b.o', 10000, 40000, 2),
+         ('base_unittests', 100000, 100000, 1)],
+        [(e['name'], e['ts'], e['dur'], e['tid']) for e in events])
+    self.assertListEqual(['obj/b.o', 'obj/b.h'], events[1]['args']['outputs'])
+
+  def test_import_missing_ninja_log(self):
+    # Ninja failing before it writes a log shouldn't hide its error.
+    tracer = trace.Tracer()
+    with self.assertRaises(subprocess.CalledProcessError):
+      try:
+        subprocess.check_call([sys.executable, '-c', 'raise SystemExit(1)'])
+      finally:
+        tracer.import_ninja_log(self.tmp_dir.name,
+                                trace.Tracer.ninja_log_size(self.tmp_dir.name),
+                                tracer._start)
+    self.assertListEqual([], self._write(tracer))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -154,6 +154,13 @@ class TestVariableExpander(unittest.TestCase):
     self.assertListEqual(exp.expand_variables(['${xvfb}', 'one', 'two']),
                          ['one', 'two'])
 
+    # Run on a leased display rather than by testing/xvfb.py.
+    opts = self._create_opts('linux')
+    exp = variable_expander.VariableExpander(opts, display=':99')
+    self.assertEqual(exp.get_value('xvfb'), None)
+    self.assertListEqual(exp.expand_variables(['${xvfb}', 'one', 'two']),
+                         ['one', 'two'])
+
   def test_run_args(self):
     opts = self._create_opts('linux')
     exp = variable_expander.VariableExpander(opts)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from wpt_lib import html_report
+
+class TestHtmlReport(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.report = html_report.HtmlReport(
+        os.path.join(self.tmp_dir.name, 'report'), 'Clank')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _read(self, *path):
+    with open(os.path.join(self.tmp_dir.name, 'report', *path),
+              encoding='utf-8') as f:
+      return f.read()
+
+  def test_incremental(self):
+    self.report.add_result({'test': '/dom/a.html', 'status': 'OK',
+                            'subtests': [{'name': '<x>', 'status': 'FAIL',
+                                          'message': 'a < b'}]})
+    self.report.progress = '1 of 2 chunks done.'
+    index_path = self.report.write()
+    index = self._read('index.html')
+    self.assertIn('http-equiv="refresh"', index)
+    self.assertIn('1 of 2 chunks done.', index)
+    self.assertIn('<a href="dirs/dom.html">/dom</a>', index)
+    page = self._read('dirs', 'dom.html')
+    self.assertIn('&lt;x&gt;: FAIL a &lt; b', page)
+    # Written rows are only kept on disk.
+    self.assertDictEqual({}, self.report._pending)
+    self.assertIn('/dom/a.html', self._read('rows', 'dom.html'))
+
+    # Only pages of directories with new results are rewritten.
+    os.remove(os.path.join(self.tmp_dir.name, 'report', 'dirs', 'dom.html'))
+    self.report.add_result({'test': '/css/a/b.html', 'status': 'PASS'})
+    self.assertEqual(index_path, self.report.write())
+    self.assertFalse(os.path.exists(
+        os.path.join(self.tmp_dir.name, 'report', 'dirs', 'dom.html')))
+    self.assertIn('<a href="dirs/css%252Fa.html">/css/a</a>',
+                  self._read('index.html'))
+    self.assertIn('class="pass">PASS', self._read('dirs', 'css%2Fa.html'))
+
+    self.report.write(finished=True)
+    self.assertNotIn('http-equiv="refresh"', self._read('index.html'))
+    self.assertNotIn('http-equiv="refresh"', self._read('dirs', 'dom.html'))
+
+if __name__ == '__main__':
+    unittest.main()
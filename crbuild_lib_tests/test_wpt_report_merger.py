@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from wpt_lib import report_merger
+
+def _result(test, status='OK', subtests=()):
+  return {'test': test, 'status': status,
+          'subtests': [{'name': name, 'status': s} for name, s in subtests]}
+
+class TestReportMerger(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _write_log(self, name, data):
+    path = os.path.join(self.tmp_dir.name, name)
+    with open(path, 'w') as f:
+      f.write(data if isinstance(data, str) else json.dumps(data))
+    return path
+
+  def test_read_report(self):
+    report = {'results': [_result('/a/b.html'), _result('/a/c.html?x=é')],
+              'time_start': 10, 'run_info': {'os': 'android'}, 'n': 1.5e3}
+    results = []
+    # Tiny reads to split values (and UTF-8 characters) across reads.
+    old_read_size = report_merger.JsonStream.read_size
+    report_merger.JsonStream.read_size = 3
+    try:
+      members = report_merger.read_report(
+          io.BytesIO(json.dumps(report, ensure_ascii=False).encode('utf-8')),
+          results.append)
+    finally:
+      report_merger.JsonStream.read_size = old_read_size
+    self.assertListEqual(report['results'], results)
+    self.assertDictEqual({'time_start': 10, 'run_info': {'os': 'android'},
+                          'n': 1500.0}, members)
+
+  def test_merge(self):
+    log1 = self._write_log('1.json', {
+        'results': [_result('/dom/a.html', subtests=[('x', 'PASS'),
+                                                     ('y', 'FAIL')])],
+        'time_start': 20, 'time_end': 30, 'run_info': {'product': 'p'}})
+    log2 = self._write_log('2.json', {
+        'results': [_result('/dom/b.html', 'TIMEOUT', [('x', 'PASS')]),
+                    _result('/css/c.html', 'PASS')],
+        'time_start': 10, 'time_end': 25, 'run_info': {'product': 'q'}})
+    # Cut short by a crash.
+    log3 = self._write_log('3.json', '{"results": [%s, {"test": ' %
+                           json.dumps(_result('/css/d.html', 'ERROR')))
+    combined = os.path.join(self.tmp_dir.name, 'combined.json')
+    seen = []
+    merger = report_merger.ReportMerger(combined, [seen.append])
+    self.assertTrue(merger.add_log(log1))
+    self.assertTrue(merger.add_log(log2))
+    self.assertFalse(merger.add_log(log3))
+    self.assertFalse(merger.add_log(os.path.join(self.tmp_dir.name, 'x')))
+    merger.close()
+    with open(combined) as f:
+      data = json.load(f)
+    self.assertListEqual(['/dom/a.html', '/dom/b.html', '/css/c.html',
+                          '/css/d.html'], [r['test'] for r in data['results']])
+    self.assertEqual(data['results'], seen)
+    self.assertEqual(10, data['time_start'])
+    self.assertEqual(30, data['time_end'])
+    self.assertDictEqual({'product': 'p'}, data['run_info'])
+    self.assertDictEqual(
+        {'/dom': {'tests': 2, 'passes': 2, 'failures': 2},
+         '/css': {'tests': 2, 'passes': 1, 'failures': 1}},
+        {d: s.to_dict() for d, s in merger.directories.items()})
+
+  def test_empty(self):
+    combined = os.path.join(self.tmp_dir.name, 'combined.json')
+    merger = report_merger.ReportMerger(combined)
+    self.assertTrue(merger.add_log(self._write_log('1.json', {})))
+    merger.close()
+    with open(combined) as f:
+      self.assertDictEqual({'results': []}, json.load(f))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from wpt_lib import results_store
+
+def result(test, status, subtests=()):
+  return {'test': test, 'status': status,
+          'subtests': [{'name': name, 'status': s} for name, s in subtests]}
+
+class TestResultsStore(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.store = results_store.ResultsStore(
+        os.path.join(self.tmp_dir.name, 'cache', 'results.sqlite'))
+
+  def tearDown(self):
+    self.store.close()
+    self.tmp_dir.cleanup()
+
+  def add_run(self, name, results, **kwargs):
+    self.store.start_run(name, 'chrome_android', **kwargs)
+    for r in results:
+      self.store.add_result(r)
+    self.store.finish_run()
+
+  def test_diff(self):
+    self.add_run('base', [
+        result('/a.html', 'OK', [('one', 'PASS'), ('two', 'FAIL')]),
+        result('/b.html', 'PASS'),
+        result('/c.html', 'TIMEOUT'),
+        result('/old.html', 'PASS'),
+    ], api_level='33', build='120.0')
+    self.add_run('new', [
+        result('/a.html', 'OK', [('one', 'FAIL'), ('two', 'PASS')]),
+        result('/b.html', 'PASS'),
+        result('/c.html', 'ERROR'),
+        result('/new.html', 'FAIL'),
+    ])
+    regressions, progressions = self.store.diff('base', 'new')
+    self.assertEqual([('/a.html', 'one', 'PASS', 'FAIL')], regressions)
+    self.assertEqual([('/a.html', 'two', 'FAIL', 'PASS')], progressions)
+    # Swapping the runs swaps regressions and progressions.
+    self.assertEqual([('/a.html', 'two', 'PASS', 'FAIL')],
+                     self.store.diff('new', 'base')[0])
+    self.assertEqual(['new', 'base'], [r[0] for r in self.store.runs()])
+    self.assertEqual(('chrome_android', '33', '120.0'),
+                     tuple(self.store.runs()[1][1:4]))
+
+  def test_replace_run(self):
+    self.add_run('base', [result('/a.html', 'PASS')])
+    self.add_run('new', [result('/a.html', 'FAIL')])
+    self.add_run('new', [result('/a.html', 'PASS')])
+    self.assertEqual(([], []), self.store.diff('base', 'new'))
+    self.assertEqual(2, len(self.store.runs()))
+
+  def test_batches(self):
+    old_batch_size = results_store.ResultsStore.batch_size
+    results_store.ResultsStore.batch_size = 3
+    try:
+      self.add_run('base', [result('/%d.html' % i, 'PASS') for i in range(10)])
+      self.add_run('new', [result('/%d.html' % i, 'FAIL') for i in range(10)])
+    finally:
+      results_store.ResultsStore.batch_size = old_batch_size
+    self.assertEqual(10, len(self.store.diff('base', 'new')[0]))
+
+  def test_unknown_run(self):
+    self.add_run('base', [])
+    with self.assertRaises(KeyError):
+      self.store.diff('base', 'missing')
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import adb_client
+from fake_adb_server import (FakeAdbServer, FakeDevice)
+from wpt_lib import wpt_runner
+
+# Records its arguments in the file given as --log-wptreport.
+FAKE_WPT = '''#!%s
+import json
+import sys
+log = [a for a in sys.argv if a.startswith('--log-wptreport=')][0]
+with open(log.split('=', 1)[1], 'w') as f:
+  json.dump(sys.argv[1:], f)
+'''
+
+class TestWptRunner(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    wpt_app = os.path.join(self.tmp_dir.name, 'wpt')
+    with open(wpt_app, 'w') as f:
+      f.write(FAKE_WPT % sys.executable)
+    os.chmod(wpt_app, stat.S_IRWXU)
+    self.info = wpt_runner.TestInfo(self.tmp_dir.name, wpt_app, 'chromedriver',
+                                    'chrome_android', 'org.chromium.chrome',
+                                    '/dom/')
+    self.info.logfile = os.path.join(self.tmp_dir.name, 'log.json')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def _args(self):
+    with open(self.info.logfile) as f:
+      return json.load(f)
+
+  def test_chunk(self):
+    self.info.device_serials = ['phone']
+    self.info.chunk = 2
+    self.info.total_chunks = 8
+    self.assertEqual('WPT run chunk 2 of 8 completed without error',
+                     wpt_runner.WptRunner._run_one(self.info))
+    args = self._args()
+    self.assertIn('--device-serial=phone', args)
+    self.assertIn('--this-chunk=2', args)
+    self.assertEqual('testharness', args[args.index('--test-type') + 1])
+    self.assertNotIn('--processes=1', args)
+    self.assertListEqual(['chrome_android', '/dom/'], args[-2:])
+
+  def test_include_file(self):
+    self.info.device_serials = ['phone']
+    self.info.chunk = 1
+    self.info.total_chunks = 8
+    self.info.include_file = 'tests.txt'
+    wpt_runner.WptRunner._run_one(self.info)
+    args = self._args()
+    self.assertIn('--include-file=tests.txt', args)
+    self.assertNotIn('--this-chunk=1', args)
+    self.assertEqual('chrome_android', args[-1])
+
+  def test_stale_log_removed(self):
+    with open(self.info.logfile, 'w') as f:
+      f.write('{"results": []}')
+    self.info.wpt_app = os.path.join(self.tmp_dir.name, 'failing-wpt')
+    with open(self.info.wpt_app, 'w') as f:
+      f.write('#!/bin/sh\nexit 1\n')
+    os.chmod(self.info.wpt_app, stat.S_IRWXU)
+    with self.assertRaises(subprocess.CalledProcessError):
+      wpt_runner.WptRunner._run_one(self.info)
+    self.assertFalse(os.path.exists(self.info.logfile))
+
+  def test_shared_server(self):
+    self.info.device_serials = ['phone', 'tablet']
+    self.assertEqual('WPT run completed without error',
+                     wpt_runner.WptRunner._run_one(self.info))
+    args = self._args()
+    self.assertIn('--device-serial=phone', args)
+    self.assertIn('--device-serial=tablet', args)
+    self.assertIn('--processes=2', args)
+    self.assertFalse(any(a.startswith('--this-chunk') for a in args))
+
+class TestPrepareDevices(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.phone = FakeDevice('phone')
+    self.phone.settings = {'window_animation_scale': '0',
+                           'transition_animation_scale': '1.0',
+                           'animator_duration_scale': '0.5'}
+    self.tablet = FakeDevice('tablet', shell_v2=False)
+    self.tablet.settings = {name: value for name, value in
+                            wpt_runner.WptRunner.device_settings}
+    self.server = FakeAdbServer([self.phone, self.tablet])
+    adb_client.AdbClient._instance = adb_client.AdbClient(
+        port=self.server.port, start_server=False)
+    # The fake devices' files are local.
+    self.old_command_line_file = wpt_runner.WptRunner.command_line_file
+    wpt_runner.WptRunner.command_line_file = os.path.join(
+        self.tmp_dir.name, 'webview-command-line')
+
+  def tearDown(self):
+    wpt_runner.WptRunner.command_line_file = self.old_command_line_file
+    adb_client.AdbClient._instance = None
+    self.server.close()
+    self.tmp_dir.cleanup()
+
+  def test_prepare_devices(self):
+    path = wpt_runner.WptRunner.command_line_file
+    preparing = wpt_runner.WptRunner.prepare_devices(['phone'])
+    self.assertEqual(['transition_animation_scale', 'animator_duration_scale',
+                      path], preparing['phone'].result())
+    self.assertEqual(1, len(self.phone.commands))
+    with open(path) as f:
+      self.assertEqual(wpt_runner.WptRunner.command_line + '\n', f.read())
+    # The separate steps, as before prepare_device, are still available.
+    wpt_runner.WptRunner.disable_animations('phone')
+    self.assertNotIn(path, self.phone.commands[-1])
+    wpt_runner.WptRunner.setup_device_command_line('phone')
+    self.assertNotIn('settings', self.phone.commands[-1])
+    # Nothing is changed on a prepared device.
+    preparing = wpt_runner.WptRunner.prepare_devices(['tablet'])
+    self.assertEqual([], preparing['tablet'].result())
+
+if __name__ == '__main__':
+    unittest.main()
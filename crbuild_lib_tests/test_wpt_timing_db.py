@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from wpt_lib import (timing_db, wpt_runner)
+
+class TestTimingDb(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmp_dir.name, 'timings.json')
+
+  def tearDown(self):
+    self.tmp_dir.cleanup()
+
+  def test_add_results(self):
+    db = timing_db.TimingDb(self.path)
+    self.assertFalse(db.has_timings('chrome_android'))
+    db.add_results('chrome_android', [
+        {'test': '/a.html', 'status': 'OK', 'duration': 100},
+        {'test': '/b.html', 'status': 'OK'}])
+    db.add('chrome_android', '/a.html', 300)
+    db.save()
+    db = timing_db.TimingDb(self.path)
+    self.assertTrue(db.has_timings('chrome_android'))
+    self.assertFalse(db.has_timings('android_webview'))
+    # A moving average of 100 and 300.
+    self.assertListEqual([['/a.html']],
+                         db.partition('chrome_android', ['/a.html'], 4))
+    with open(self.path) as f:
+      self.assertDictEqual({'chrome_android': {'/a.html': 200}}, json.load(f))
+
+  def test_partition(self):
+    db = timing_db.TimingDb(self.path)
+    for test, duration in (('/a', 70), ('/b', 50), ('/c', 40), ('/d', 30),
+                           ('/e', 10)):
+      db.add('p', test, duration)
+    chunks = db.partition('p', ['/a', '/b', '/c', '/d', '/e', '/new'], 2)
+    # /new is estimated as the median (40), giving 120ms per chunk.
+    self.assertListEqual([['/a', '/new', '/e'], ['/b', '/c', '/d']],
+                         sorted(chunks))
+    self.assertEqual(3, len(db.partition('p', ['/a', '/b', '/c'], 8)))
+
+class TestGetTests(unittest.TestCase):
+
+  def _write_manifest(self, items, reftests=None):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+    with open(os.path.join(tmp_dir.name, 'MANIFEST.json'), 'w') as f:
+      json.dump({'items': {'testharness': items,
+                           'reftest': reftests or {}}}, f)
+    return tmp_dir.name
+
+  def test_manifest_v8(self):
+    wpt_dir = self._write_manifest({
+        'dom': {'a.html': ['abc', [None, {}]],
+                'b.html': ['def', ['/dom/b.html?1', {}],
+                           ['/dom/b.html?2', {}]]},
+        'css': {'c.html': ['123', [None, {}]]}})
+    self.assertListEqual(['/css/c.html', '/dom/a.html', '/dom/b.html?1',
+                          '/dom/b.html?2'],
+                         wpt_runner.WptRunner._get_tests(wpt_dir))
+    self.assertListEqual(['/dom/a.html', '/dom/b.html?1', '/dom/b.html?2'],
+                         wpt_runner.WptRunner._get_tests(wpt_dir, 'dom/'))
+
+  def test_manifest_v5(self):
+    wpt_dir = self._write_manifest({'dom/a.html': [['/dom/a.html', {}]]})
+    self.assertListEqual(['/dom/a.html'],
+                         wpt_runner.WptRunner._get_tests(wpt_dir))
+
+  def test_test_types(self):
+    wpt_dir = self._write_manifest(
+        {'dom': {'a.html': ['abc', [None, {}]]}},
+        {'css': {'r.html': ['def', [None, [['/css/r-ref.html', '==']], {}]]}})
+    # Only the types run are planned (wpt run --test-type).
+    self.assertEqual(('testharness',), wpt_runner.WptRunner.test_types)
+    self.assertListEqual(['/dom/a.html'],
+                         wpt_runner.WptRunner._get_tests(wpt_dir))
+    self.assertListEqual(['/css/r.html', '/dom/a.html'],
+                         wpt_runner.WptRunner._get_tests(
+                             wpt_dir, test_types=['testharness', 'reftest']))
+
+  def test_no_manifest(self):
+    self.assertIsNone(wpt_runner.WptRunner._get_tests('/nonexistent'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+def GetAbsPathRelativeToThisFileDir(rel_path):
+  return os.path.abspath(os.path.join(os.path.dirname(__file__),
+                         rel_path))
+
+sys.path.append(GetAbsPathRelativeToThisFileDir('..'))
+
+from crbuild_lib import xvfb_pool
+
+# Serves :N (its first argument) on a socket in XvfbPool.socket_dir.
+FAKE_XVFB = '''#!%s
+import os
+import socket
+import sys
+path = os.path.join(%r, 'X' + sys.argv[1][1:])
+if os.path.exists(path):
+  os.remove(path)
+sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+sock.bind(path)
+sock.listen(5)
+while True:
+  sock.accept()[0].close()
+'''
+
+class TestXvfbPool(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.old_socket_dir = xvfb_pool.XvfbPool.socket_dir
+    xvfb_pool.XvfbPool.socket_dir = self.tmp_dir.name
+    xvfb = os.path.join(self.tmp_dir.name, 'Xvfb')
+    with open(xvfb, 'w') as f:
+      f.write(FAKE_XVFB % (sys.executable, self.tmp_dir.name))
+    os.chmod(xvfb, stat.S_IRWXU)
+    self.pool = xvfb_pool.XvfbPool(os.path.join(self.tmp_dir.name, 'locks'),
+                                   2, xvfb)
+
+  def tearDown(self):
+    self.pool.stop()
+    xvfb_pool.XvfbPool.socket_dir = self.old_socket_dir
+    self.tmp_dir.cleanup()
+
+  def test_lease(self):
+    with self.pool.lease() as display:
+      self.assertEqual(':99', display)
+      pids = self.pool._read_pids(99)
+      # A concurrent lease gets another display.
+      with self.pool.lease() as display:
+        self.assertEqual(':100', display)
+    # The display's Xvfb is kept for the next lease.
+    with self.pool.lease() as display:
+      self.assertEqual(':99', display)
+      self.assertEqual(pids, self.pool._read_pids(99))
+
+  def test_restart(self):
+    with self.pool.lease():
+      pid = self.pool._read_pids(99)[0]
+    os.kill(pid, signal.SIGKILL)
+    self.pool._processes[99][0].wait()
+    with self.pool.lease() as display:
+      self.assertEqual(':99', display)
+      self.assertNotEqual(pid, self.pool._read_pids(99)[0])
+      self.assertTrue(self.pool._accepts_connections(99))
+
+  def test_wait(self):
+    self.pool.max_displays = 1
+    leased = threading.Event()
+    with self.pool.lease():
+      def lease():
+        with self.pool.lease():
+          leased.set()
+      thread = threading.Thread(target=lease)
+      thread.start()
+      self.assertFalse(leased.wait(0.3))
+    thread.join()
+    self.assertTrue(leased.is_set())
+
+  def test_stale_pid_file(self):
+    # After a reboot the PID of a dead Xvfb may be any other process.
+    other = subprocess.Popen(['sleep', '60'], start_new_session=True)
+    try:
+      os.makedirs(self.pool.lock_dir)
+      with open(self.pool._path(99, 'pid'), 'w') as f:
+        f.write(str(other.pid))
+      with self.pool.lease() as display:
+        self.assertEqual(':99', display)
+        self.assertNotEqual([other.pid], self.pool._read_pids(99))
+      self.assertIsNone(other.poll())
+    finally:
+      other.kill()
+      other.wait()
+
+  def test_foreign_displays(self):
+    # Another X server on every display.
+    self.pool.max_displays = 1
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.bind(os.path.join(self.tmp_dir.name, 'X99'))
+      sock.listen(1)
+      with self.assertRaises(xvfb_pool.XvfbError):
+        with self.pool.lease():
+          pass
+    finally:
+      sock.close()
+
+  def test_start_failure(self):
+    self.pool.xvfb = os.path.join(self.tmp_dir.name, 'missing')
+    with self.assertRaises(xvfb_pool.XvfbError):
+      with self.pool.lease():
+        pass
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,3 +1,4 @@
 #!/usr/bin/env python3
 
+from .commands import wpt_command
 from .wpt_runner import WptRunner
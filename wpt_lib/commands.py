@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+
+from .results_store import ResultsStore
+from .wpt_runner import WptRunner
+
+def _print_changes(title, rows):
+  print('%s (%d):' % (title, len(rows)))
+  for test, subtest, status_a, status_b in rows:
+    name = '%s %s' % (test, subtest) if subtest else test
+    print('  %s: %s -> %s' % (name, status_a, status_b))
+
+def wpt_command(argv):
+  '''Handle "crbuild wpt <command> ...", returning the exit status.'''
+  parser = argparse.ArgumentParser(prog='crbuild wpt',
+                                   description='Query stored WPT results.')
+  commands = parser.add_subparsers(dest='command')
+  commands.required = True
+  commands.add_parser('runs', help='List the stored WPT runs.')
+  diff = commands.add_parser(
+      'diff', help='Show the tests which regressed or progressed from one '
+      'run to another (exit status 1 if any regressed).')
+  diff.add_argument('run_a', help='The name of the earlier (baseline) run.')
+  diff.add_argument('run_b', help='The name of the later run.')
+  args = parser.parse_args(argv)
+
+  store = ResultsStore(WptRunner.results_store_path())
+  try:
+    if args.command == 'runs':
+      for name, product, api_level, build, run_time in store.runs():
+        print('%-32s %s  %s API %s build %s' % (
+            name, time.strftime('%Y-%m-%d %H:%M', time.localtime(run_time)),
+            product, api_level, build))
+      return 0
+    try:
+      regressions, progressions = store.diff(args.run_a, args.run_b)
+    except KeyError as e:
+      print(e.args[0])
+      return 2
+    _print_changes('Regressions', regressions)
+    _print_changes('Progressions', progressions)
+    return 1 if regressions else 0
+  finally:
+    store.close()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import html
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+
+from .report_merger import (DirectoryStats, ReportMerger)
+
+class HtmlReport(object):
+  '''An HTML report of WPT results, written while the run progresses.
+
+  index.html lists every directory with its pass/fail counts, each linking
+  to a page with that directory's results, so no page holds the whole
+  (huge) result table. Results are added as they are merged (add_result
+  is a ReportMerger result handler) and write() rewrites the index and the
+  pages of directories with new results. Until finished the index reloads
+  itself, so partial results can be browsed while the run continues.
+
+  Only the counts are kept in memory. Each directory's table rows are
+  appended, as they are written, to a fragment in rows/ which its page is
+  made from, so memory use doesn't grow with the number of results.
+  '''
+
+  refresh_seconds = 30
+  # The most failing subtests listed for one test.
+  max_failures_shown = 20
+
+  _style = ('body{font-family:sans-serif}table{border-collapse:collapse}'
+            'td,th{border:1px solid #ccc;padding:2px 6px;text-align:left}'
+            '.pass{background:#cfc}.fail{background:#fcc}')
+
+  def __init__(self, report_dir, ua_name):
+    self.report_dir = report_dir
+    self.ua_name = ua_name
+    self.index_path = os.path.join(report_dir, 'index.html')
+    self.progress = ''
+    self._lock = threading.Lock()
+    self._directories = {}  # Directory -> DirectoryStats.
+    self._pending = {}      # Directory -> rows not yet in its fragment.
+    self._dirty = set()     # Directories whose page needs writing.
+    # Pages of a previous run's directories would otherwise be left behind.
+    for name in ('dirs', 'rows'):
+      shutil.rmtree(os.path.join(report_dir, name), ignore_errors=True)
+      os.makedirs(os.path.join(report_dir, name))
+
+  @staticmethod
+  def _page_name(directory):
+    return urllib.parse.quote(directory.strip('/') or 'root', safe='') + \
+        '.html'
+
+  def add_result(self, result):
+    test = result.get('test', '')
+    directory = ReportMerger.directory(test)
+    failures = [(s.get('name', ''), s.get('status'), s.get('message') or '')
+                for s in result.get('subtests') or []
+                if s.get('status') not in DirectoryStats.pass_statuses]
+    row = HtmlReport._row(test, result.get('status'),
+                          failures[:HtmlReport.max_failures_shown])
+    with self._lock:
+      self._directories.setdefault(directory, DirectoryStats()).add(result)
+      self._pending.setdefault(directory, []).append(row)
+      self._dirty.add(directory)
+
+  @staticmethod
+  def _write_file(path, text):
+    # Replaced atomically so a browser never loads a partial page.
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      f.write(text)
+    os.replace(tmp_path, path)
+
+  def _page(self, title, body, finished):
+    head = '<meta charset="utf-8"><title>%s</title><style>%s</style>' % (
+        html.escape(title), HtmlReport._style)
+    if not finished:
+      head += '<meta http-equiv="refresh" content="%d">' % \
+          HtmlReport.refresh_seconds
+    return '<!DOCTYPE html><html><head>%s</head><body><h1>%s</h1>%s' \
+           '</body></html>\n' % (head, html.escape(title), body)
+
+  @staticmethod
+  def _stats_cells(stats):
+    cls = 'fail' if stats.failures else 'pass'
+    return '<td>%d</td><td class="%s">%d</td><td>%d</td>' % (
+        stats.tests, cls, stats.passes, stats.failures)
+
+  def _index_body(self):
+    total = DirectoryStats()
+    rows = []
+    for directory in sorted(self._directories):
+      stats = self._directories[directory]
+      total.tests += stats.tests
+      total.passes += stats.passes
+      total.failures += stats.failures
+      rows.append('<tr><td><a href="dirs/%s">%s</a></td>%s</tr>' % (
+          urllib.parse.quote(HtmlReport._page_name(directory)),
+          html.escape(directory or '/'), HtmlReport._stats_cells(stats)))
+    return ('<p>%s Updated %s.</p><table><tr><th>Directory</th><th>Tests'
+            '</th><th>Passes</th><th>Failures</th></tr><tr><th>Total</th>%s'
+            '</tr>%s</table>' % (
+                html.escape(self.progress), time.strftime('%H:%M:%S'),
+                HtmlReport._stats_cells(total), ''.join(rows)))
+
+  @staticmethod
+  def _row(test, status, failures):
+    cls = 'fail' if failures or \
+        status not in DirectoryStats.pass_statuses else 'pass'
+    details = ''.join('<li>%s: %s %s</li>' % (
+        html.escape(name), html.escape(str(s)), html.escape(message))
+                      for name, s, message in failures)
+    return '<tr><td>%s</td><td class="%s">%s</td><td><ul>%s</ul></td></tr>' \
+        '\n' % (html.escape(test), cls, html.escape(str(status)), details)
+
+  def _fragment_path(self, directory):
+    return os.path.join(self.report_dir, 'rows',
+                        HtmlReport._page_name(directory))
+
+  def _directory_body(self, directory):
+    with open(self._fragment_path(directory), 'r', encoding='utf-8') as f:
+      rows = f.read()
+    return ('<p><a href="../index.html">All directories</a></p><table><tr>'
+            '<th>Test</th><th>Status</th><th>Failing subtests</th></tr>%s'
+            '</table>' % rows)
+
+  def write(self, finished=False):
+    '''Write the index and the pages of directories with new results.
+    Returns the path of the index.'''
+    with self._lock:
+      for directory, rows in self._pending.items():
+        with open(self._fragment_path(directory), 'a',
+                  encoding='utf-8') as f:
+          f.write(''.join(rows))
+      self._pending = {}
+      # Once finished every page is rewritten so none reloads itself.
+      for directory in self._directories if finished else self._dirty:
+        HtmlReport._write_file(
+            os.path.join(self.report_dir, 'dirs',
+                         HtmlReport._page_name(directory)),
+            self._page('%s: %s' % (self.ua_name, directory or '/'),
+                       self._directory_body(directory), finished))
+      self._dirty = set()
+      HtmlReport._write_file(
+          self.index_path,
+          self._page('%s WPT results' % self.ua_name, self._index_body(),
+                     finished))
+    return self.index_path
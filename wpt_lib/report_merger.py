@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import codecs
+import json
+import posixpath
+import re
+import threading
+
+class JsonStream(object):
+  '''Reads a JSON document from a file one value at a time, so that a huge
+  document (e.g. a wptreport log) can be processed in bounded memory.'''
+
+  read_size = 1024 * 1024
+  _whitespace_re = re.compile(r'\s*')
+
+  def __init__(self, f):
+    self._file = f
+    self._decoder = json.JSONDecoder()
+    self._utf8 = codecs.getincrementaldecoder('utf-8')()
+    self._buf = ''
+    self._pos = 0
+    self._eof = False
+
+  def _fill(self):
+    '''Read more of the file into the buffer. Returns False at EOF.'''
+    if self._eof:
+      return False
+    data = self._file.read(JsonStream.read_size)
+    self._eof = not data
+    self._buf = self._buf[self._pos:] + self._utf8.decode(data,
+                                                          final=self._eof)
+    self._pos = 0
+    return not self._eof
+
+  def peek(self):
+    '''Return the next non-whitespace character ('' at EOF).'''
+    while True:
+      self._pos = JsonStream._whitespace_re.match(self._buf, self._pos).end()
+      if self._pos < len(self._buf) or not self._fill():
+        return self._buf[self._pos:self._pos + 1]
+
+  def expect(self, char):
+    if self.peek() != char:
+      raise ValueError('Expected %r at %r' % (
+          char, self._buf[self._pos:self._pos + 20]))
+    self._pos += 1
+
+  def value(self):
+    '''Read the next complete JSON value.'''
+    self.peek()
+    while True:
+      try:
+        value, end = self._decoder.raw_decode(self._buf, self._pos)
+      except ValueError:
+        if not self._fill():
+          raise
+        continue
+      # A number at the end of the buffer may continue in the next read.
+      if end == len(self._buf) and self._fill():
+        continue
+      self._pos = end
+      return value
+
+def read_report(f, on_result):
+  '''Read a wptreport log from |f|, calling |on_result| with each result in
+  turn (without keeping them), and return the other top level members
+  (run_info, time_start...).'''
+  stream = JsonStream(f)
+  members = {}
+  stream.expect('{')
+  if stream.peek() == '}':
+    return members
+  while True:
+    key = stream.value()
+    stream.expect(':')
+    if key == 'results':
+      stream.expect('[')
+      if stream.peek() != ']':
+        while True:
+          on_result(stream.value())
+          if stream.peek() != ',':
+            break
+          stream.expect(',')
+      stream.expect(']')
+    else:
+      members[key] = stream.value()
+    if stream.peek() != ',':
+      break
+    stream.expect(',')
+  stream.expect('}')
+  return members
+
+class DirectoryStats(object):
+  '''Pass/fail counts of the results of the tests in one directory.
+
+  Tests with subtests count each subtest, others count the test status.'''
+
+  pass_statuses = ('OK', 'PASS')
+
+  def __init__(self):
+    self.tests = 0
+    self.passes = 0
+    self.failures = 0
+
+  def add(self, result):
+    self.tests += 1
+    statuses = [s.get('status') for s in result.get('subtests') or []]
+    if not statuses or result.get('status') not in DirectoryStats.pass_statuses:
+      # The harness status, e.g. an ERROR or TIMEOUT, counts too.
+      statuses.append(result.get('status'))
+    for status in statuses:
+      if status in DirectoryStats.pass_statuses:
+        self.passes += 1
+      else:
+        self.failures += 1
+
+  def to_dict(self):
+    return {'tests': self.tests, 'passes': self.passes,
+            'failures': self.failures}
+
+class ReportMerger(object):
+  '''Merges wptreport logs (e.g. one per chunk) into one as they are added.
+
+  Each log is parsed incrementally and every result is written straight to
+  the combined log, so memory use doesn't depend on the size of the logs.
+  Per-directory pass/fail counts are kept as results are read, and every
+  result is also passed to each function in |result_handlers|.
+
+  A log cut short (e.g. by a crash) contributes the results before the
+  point it was cut.
+  '''
+
+  def __init__(self, path, result_handlers=None):
+    self.path = path
+    self.result_handlers = list(result_handlers or [])
+    self.directories = {}  # Directory -> DirectoryStats.
+    self.num_results = 0
+    self._members = {}
+    self._lock = threading.Lock()
+    self._file = open(path, 'w')
+    self._file.write('{"results": [')
+
+  @staticmethod
+  def directory(test):
+    '''Return the directory of a test URL, e.g. /dom/nodes.'''
+    return posixpath.dirname(test.split('?')[0].split('#')[0])
+
+  def _add_result(self, result):
+    if self.num_results:
+      self._file.write(',\n')
+    json.dump(result, self._file)
+    self.num_results += 1
+    directory = ReportMerger.directory(result.get('test', ''))
+    self.directories.setdefault(directory, DirectoryStats()).add(result)
+    for handler in self.result_handlers:
+      handler(result)
+
+  def _merge_members(self, members):
+    for key, value in members.items():
+      if key not in self._members:
+        self._members[key] = value
+      elif key == 'time_start':
+        self._members[key] = min(self._members[key], value)
+      elif key == 'time_end':
+        self._members[key] = max(self._members[key], value)
+
+  def add_log(self, path):
+    '''Add the results of a wptreport log. Returns False if the log is
+    missing or malformed (results read before the problem are kept).'''
+    with self._lock:
+      try:
+        with open(path, 'rb') as f:
+          self._merge_members(read_report(f, self._add_result))
+        return True
+      except (IOError, ValueError) as e:
+        print('%s: %s' % (path, e))
+        return False
+
+  def close(self):
+    '''Finish writing the combined log.'''
+    with self._lock:
+      self._file.write(']')
+      for key, value in sorted(self._members.items()):
+        self._file.write(', %s: ' % json.dumps(key))
+        json.dump(value, self._file)
+      self._file.write('}')
+      self._file.close()
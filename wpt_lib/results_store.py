@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+import time
+
+class ResultsStore(object):
+  '''Stores the results of WPT runs in an SQLite database so that runs can
+  be compared quickly without reading their (huge) wptreport logs.
+
+  Test, subtest and status names are stored once, in the strings table, and
+  results refer to them by id, which keeps the database compact. Results
+  are keyed (and so indexed) by (run, test, subtest) so comparing two runs
+  is a single indexed join. The harness status of a test is stored with an
+  empty subtest name.
+  '''
+
+  pass_statuses = ('OK', 'PASS')
+  # Results inserted per transaction while a run is being added.
+  batch_size = 10000
+
+  _schema = '''
+    CREATE TABLE IF NOT EXISTS runs (
+      id INTEGER PRIMARY KEY,
+      name TEXT UNIQUE NOT NULL,
+      product TEXT,
+      api_level TEXT,
+      build TEXT,
+      time REAL);
+    CREATE TABLE IF NOT EXISTS strings (
+      id INTEGER PRIMARY KEY,
+      value TEXT UNIQUE NOT NULL);
+    CREATE TABLE IF NOT EXISTS results (
+      run_id INTEGER NOT NULL,
+      test_id INTEGER NOT NULL,
+      subtest_id INTEGER NOT NULL,
+      status_id INTEGER NOT NULL,
+      PRIMARY KEY (run_id, test_id, subtest_id)) WITHOUT ROWID;
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Results are added from the threads merging chunk logs.
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._db.executescript(ResultsStore._schema)
+    self._string_ids = {}
+    self._pending = []
+    self._run_id = None
+
+  def _string_id(self, value):
+    string_id = self._string_ids.get(value)
+    if string_id is None:
+      self._db.execute('INSERT OR IGNORE INTO strings (value) VALUES (?)',
+                       (value,))
+      string_id = self._db.execute('SELECT id FROM strings WHERE value = ?',
+                                   (value,)).fetchone()[0]
+      self._string_ids[value] = string_id
+    return string_id
+
+  def start_run(self, name, product=None, api_level=None, build=None):
+    '''Start adding the results of a run, replacing any run of that name.'''
+    with self._lock, self._db:
+      old = self._db.execute('SELECT id FROM runs WHERE name = ?',
+                             (name,)).fetchone()
+      if old:
+        self._db.execute('DELETE FROM results WHERE run_id = ?', old)
+        self._db.execute('DELETE FROM runs WHERE id = ?', old)
+      self._run_id = self._db.execute(
+          'INSERT INTO runs (name, product, api_level, build, time) '
+          'VALUES (?, ?, ?, ?, ?)',
+          (name, product, api_level, build, time.time())).lastrowid
+
+  def add_result(self, result):
+    '''Add a wptreport result to the run (a ReportMerger result handler).'''
+    with self._lock:
+      test_id = self._string_id(result['test'])
+      self._pending.append((self._run_id, test_id, self._string_id(''),
+                            self._string_id(result.get('status') or '')))
+      for subtest in result.get('subtests') or []:
+        self._pending.append((self._run_id, test_id,
+                              self._string_id(subtest.get('name') or ''),
+                              self._string_id(subtest.get('status') or '')))
+      if len(self._pending) >= ResultsStore.batch_size:
+        self._flush()
+
+  def _flush(self):
+    with self._db:
+      self._db.executemany('INSERT OR REPLACE INTO results VALUES '
+                           '(?, ?, ?, ?)', self._pending)
+    self._pending = []
+
+  def finish_run(self):
+    with self._lock:
+      self._flush()
+      self._run_id = None
+
+  def runs(self):
+    '''Return a list of (name, product, api_level, build, time), newest
+    first.'''
+    with self._lock:
+      return self._db.execute(
+          'SELECT name, product, api_level, build, time FROM runs '
+          'ORDER BY time DESC').fetchall()
+
+  def _run(self, name):
+    row = self._db.execute('SELECT id FROM runs WHERE name = ?',
+                           (name,)).fetchone()
+    if not row:
+      raise KeyError('No WPT run named %s' % name)
+    return row[0]
+
+  def diff(self, name_a, name_b):
+    '''Compare two runs returning (regressions, progressions), each a sorted
+    list of (test, subtest, status in a, status in b). A regression passed
+    in |name_a| but not in |name_b|, a progression the reverse. Results in
+    only one of the runs are ignored.'''
+    with self._lock:
+      rows = self._db.execute('''
+          SELECT test.value, subtest.value, status_a.value, status_b.value
+          FROM results AS a
+          JOIN results AS b ON b.run_id = ? AND b.test_id = a.test_id AND
+                               b.subtest_id = a.subtest_id
+          JOIN strings AS test ON test.id = a.test_id
+          JOIN strings AS subtest ON subtest.id = a.subtest_id
+          JOIN strings AS status_a ON status_a.id = a.status_id
+          JOIN strings AS status_b ON status_b.id = b.status_id
+          WHERE a.run_id = ? AND a.status_id != b.status_id''',
+          (self._run(name_b), self._run(name_a))).fetchall()
+    regressions = []
+    progressions = []
+    for row in sorted(rows):
+      passed_a = row[2] in ResultsStore.pass_statuses
+      passed_b = row[3] in ResultsStore.pass_statuses
+      if passed_a and not passed_b:
+        regressions.append(row)
+      elif passed_b and not passed_a:
+        progressions.append(row)
+    return regressions, progressions
+
+  def close(self):
+    with self._lock:
+      self._db.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import heapq
+import json
+import os
+import threading
+
+class TimingDb(object):
+  '''Remembers how long each WPT test took to run (per product, as devices
+  running different browsers differ), read from wptreport logs, so a run
+  can be split into chunks which take about the same time.
+
+  Stored as JSON: {product: {test: duration in ms}}. Each duration is a
+  moving average, so one slow (e.g. timed out) run doesn't skew it.
+  '''
+
+  # Estimate (ms) for tests with no timing, when no test has one.
+  default_duration = 1000
+  # Weight of the latest duration in the moving average.
+  smoothing = 0.5
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._durations = {}
+    try:
+      with open(path, 'r') as f:
+        self._durations = json.load(f)
+    except (IOError, ValueError):
+      pass
+
+  def has_timings(self, product):
+    return bool(self._durations.get(product))
+
+  def add(self, product, test, duration):
+    with self._lock:
+      durations = self._durations.setdefault(product, {})
+      old = durations.get(test)
+      if old is not None:
+        duration = old + TimingDb.smoothing * (duration - old)
+      durations[test] = int(duration)
+
+  def add_result(self, product, result):
+    '''Record the duration of a wptreport result (wptreport has a duration
+    for each test since 2020; older logs have none).'''
+    if result.get('duration') is not None:
+      self.add(product, result['test'], result['duration'])
+
+  def add_results(self, product, results):
+    for result in results:
+      self.add_result(product, result)
+
+  def save(self):
+    with self._lock:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+      with open(tmp_path, 'w') as f:
+        json.dump(self._durations, f)
+      os.replace(tmp_path, self.path)
+
+  def _default_estimate(self, durations):
+    '''The estimate for new tests: the median of the known durations.'''
+    if not durations:
+      return TimingDb.default_duration
+    values = sorted(durations.values())
+    return values[len(values) // 2]
+
+  def partition(self, product, tests, num_chunks):
+    '''Split |tests| into (at most) |num_chunks| lists with about the same
+    total expected duration, longest first.
+
+    This is longest-processing-time-first bin packing: each test, longest
+    first, goes into the chunk with the least total so far.'''
+    durations = self._durations.get(product, {})
+    default = self._default_estimate(durations)
+    chunks = [(0, i, []) for i in range(min(num_chunks, len(tests)))]
+    for test in sorted(tests, key=lambda t: (-durations.get(t, default), t)):
+      total, i, chunk_tests = heapq.heappop(chunks)
+      chunk_tests.append(test)
+      heapq.heappush(chunks, (total + durations.get(test, default), i,
+                              chunk_tests))
+    return [chunk_tests for _, _, chunk_tests in
+            sorted(chunks, key=lambda c: (-c[0], c[1]))]
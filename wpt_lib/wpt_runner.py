@@ -2,10 +2,21 @@
 
 import concurrent.futures
 import copy
+import functools
 import json
 import os
+import shlex
 import subprocess
 import tempfile
+import time
+
+from crbuild_lib.adb_client import (AdbClient, AdbError)
+from crbuild_lib.device_pool import DevicePool
+from crbuild_lib.env import Env
+from .html_report import HtmlReport
+from .report_merger import ReportMerger
+from .results_store import ResultsStore
+from .timing_db import TimingDb
 
 class TestInfo(object):
   def __init__(self, wpt_dir, wpt_app, webdriver_binary, product, package_name,
@@ -16,12 +27,32 @@ class TestInfo(object):
     self.product = product
     self.package_name = package_name
     self.test = test
+    self.device_serials = []
+    self.logfile = None
+    self.chunk = None
+    self.total_chunks = None
+    self.include_file = None
 
 class WptRunner(object):
+  # The suite is split into more chunks than devices, which take the next
+  # chunk as they finish (see DevicePool), so a slow device or chunk
+  # doesn't hold up the whole run.
+  chunks_per_device = 4
+  # The types of test run. Chunks planned from timings list the tests of
+  # every one of these types (see _get_tests).
+  test_types = ('testharness',)
+  # Global settings each device needs for WPT: (name, value).
+  device_settings = (('window_animation_scale', '0'),
+                     ('transition_animation_scale', '0'),
+                     ('animator_duration_scale', '0'))
+  command_line_file = '/data/local/tmp/webview-command-line'
+  command_line = ('_ --host-resolver-rules="MAP nonexistent.*.test ~NOTFOUND, '
+                  'MAP *.test 127.0.0.1"')
+
   @staticmethod
-  def _get_log_files(ua_name, devices):
-    return [os.path.join(tempfile.gettempdir(), ua_name + '-' + d + '-log.json') \
-            for d in devices]
+  def _get_log_file(ua_name, chunk, device):
+    return os.path.join(tempfile.gettempdir(), '%s-chunk%d-%s-log.json' % (
+        ua_name, chunk, device))
 
   @staticmethod
   def _run_one(test_info):
@@ -29,91 +60,287 @@ class WptRunner(object):
       test_info.wpt_app,
       'run',
       '--webdriver-binary=%s' % test_info.webdriver_binary,
-      '--test-type=testharness',
+      '--test-type',
+    ] + list(WptRunner.test_types) + [
       '--log-wptreport=%s' % test_info.logfile,
       '--log-tbpl=-',
       '--log-tbpl-level=info',
-      '--this-chunk=%d' % test_info.chunk,
-      '--total-chunks=%d' % test_info.total_chunks,
-      '--chunk-type=hash',
-      '--device-serial=%s' % test_info.device_serial,
+      # Only fail (and so be retried) on errors, not unexpected results.
+      '--no-fail-on-unexpected',
     ]
+    cmd.extend('--device-serial=%s' % serial
+               for serial in test_info.device_serials)
+    if len(test_info.device_serials) > 1:
+      # One test process (browser) per device, all sharing wpt's servers.
+      cmd.append('--processes=%d' % len(test_info.device_serials))
+    if test_info.include_file:
+      cmd.append('--include-file=%s' % test_info.include_file)
+    elif test_info.chunk:
+      cmd.extend(['--this-chunk=%d' % test_info.chunk,
+                  '--total-chunks=%d' % test_info.total_chunks,
+                  '--chunk-type=hash'])
     if test_info.package_name:
       cmd.append('--package-name=%s' % test_info.package_name)
     cmd.append(test_info.product)
-    if test_info.test:
+    if test_info.test and not test_info.include_file:
       cmd.append(test_info.test)
+    # A previous run's log would otherwise be merged (and stored as this
+    # run's results) if wpt fails before writing one.
+    if os.path.exists(test_info.logfile):
+      os.remove(test_info.logfile)
     subprocess.check_call(cmd)
+    if not test_info.chunk:
+      return 'WPT run completed without error'
     return 'WPT run chunk %d of %d completed without error' % \
         (test_info.chunk, test_info.total_chunks)
 
   @staticmethod
-  def _generate_report(wpt_dir, ua_name, logfile):
-    app = os.path.join(wpt_dir, 'tools', 'runner', 'report.py')
-    report_file = os.path.join(wpt_dir, 'tools', 'runner', 'wpt_report.html')
-    with open(report_file, 'w') as out_file:
-      cmd = ['python', app, ua_name, logfile]
-      subprocess.check_call(cmd, stdout=out_file)
-    return report_file
-
-  @staticmethod
-  def _combine_logfiles(logfiles, combined):
-    combined_data = {}
-    for logfile in logfiles:
-      with open(logfile) as f:
-        data = json.load(f)
-        if not combined_data:
-          combined_data = data
-        else:
-          combined_data['results'].extend(data['results'])
-
-    with open(combined, 'w') as f:
-      json.dump(combined_data, f)
-
-  @staticmethod
-  def run(test_info, ua_name, devices):
-    futures = []
-    logfiles = WptRunner._get_log_files(ua_name, devices)
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-      chunk = 1
-      for (device, logfile) in zip(devices, logfiles):
-        info = copy.copy(test_info)
-        info.device_serial = device
-        info.logfile = logfile
-        info.chunk = chunk
-        info.total_chunks = len(devices)
-        futures.append(executor.submit(WptRunner._run_one, info))
-        chunk += 1
-    for future in futures:
+  def _get_timing_db():
+    return TimingDb(os.path.join(Env.get_cache_dir(), 'wpt_timings.json'))
+
+  @staticmethod
+  def results_store_path():
+    return os.path.join(Env.get_cache_dir(), 'wpt_results.sqlite')
+
+  @staticmethod
+  def _get_run_metadata(devices, package_name):
+    '''Return the (API levels, build) of the devices and the browser.'''
+    client = AdbClient.get()
+    try:
+      api_levels = sorted(set(client.getprop(d, 'ro.build.version.sdk')
+                              for d in devices))
+      build = None
+      if package_name:
+        out = client.check_shell(devices[0], 'dumpsys package %s | '
+                                 'grep -m 1 versionName' % package_name)
+        build = out.strip().split('=')[-1] or None
+      return ','.join(api_levels), build
+    except (AdbError, OSError, subprocess.CalledProcessError):
+      return None, None
+
+  @staticmethod
+  def _get_tests(wpt_dir, prefix=None, test_types=None):
+    '''Return the URLs of the tests of |test_types| (by default those run)
+    in the wpt manifest (only those below |prefix| if given), or None if
+    there is no manifest.'''
+    try:
+      with open(os.path.join(wpt_dir, 'MANIFEST.json'), 'r') as f:
+        items = json.load(f)['items']
+    except (IOError, ValueError, KeyError):
+      return None
+    tests = []
+
+    def add_tests(path, node):
+      if isinstance(node, dict):
+        for name, child in node.items():
+          add_tests(path + '/' + name if path else name, child)
+        return
+      # [hash, [url, ...], ...] (version 8, a null url meaning the path) or
+      # [[url, ...], ...] (older versions). Reftests also list references.
+      for item in node:
+        if isinstance(item, list):
+          tests.append(item[0] or '/' + path)
+
+    for test_type in test_types or WptRunner.test_types:
+      add_tests('', items.get(test_type, {}))
+    if prefix:
+      prefix = '/' + prefix.lstrip('/')
+      tests = [t for t in tests if t.startswith(prefix)]
+    return sorted(tests)
+
+  @staticmethod
+  def _write_include_file(ua_name, chunk, tests):
+    path = os.path.join(tempfile.gettempdir(), '%s-chunk%d-tests.txt' % (
+        ua_name, chunk))
+    with open(path, 'w') as f:
+      f.write(''.join('%s\n' % test for test in tests))
+    return path
+
+  @staticmethod
+  def _device_prepared(device, preparing):
+    '''Wait for |device| to be prepared (see prepare_devices), returning
+    whether it succeeded.'''
+    try:
+      changed = preparing[device].result()
+    except (AdbError, OSError, subprocess.CalledProcessError) as e:
+      print('[%s] Preparing the device failed: %s' % (device, e))
+      return False
+    if changed:
+      print('[%s] Prepared the device: %s' % (device, ', '.join(changed)))
+    return True
+
+  @staticmethod
+  def _run_chunks(test_info, ua_name, pool, preparing, num_chunks, timing_db,
+                  merger, report):
+    num_chunks = num_chunks or WptRunner.chunks_per_device * len(pool.devices)
+    # Once test durations are known, chunks are planned to take the same
+    # time. Otherwise (and for tests not in the manifest) wpt hashes tests
+    # into chunks.
+    chunk_tests = None
+    if timing_db.has_timings(test_info.product):
+      tests = WptRunner._get_tests(test_info.wpt_dir, test_info.test)
+      if tests:
+        chunk_tests = timing_db.partition(test_info.product, tests,
+                                          num_chunks)
+        num_chunks = len(chunk_tests)
+    logfiles = {}  # Chunk index -> log of its last run.
+    # Chunk logs are merged (and the report updated) as each chunk passes,
+    # and at the end for those which failed on every device.
+    merged = []
+
+    def merge_chunk_log(index):
+      if index in logfiles and os.path.exists(logfiles[index]):
+        merger.add_log(logfiles[index])
+      merged.append(index)
+      report.progress = '%d of %d chunks done.' % (len(merged), num_chunks)
+      report.write()
+
+    def run_chunk(device, shard):
+      info = copy.copy(test_info)
+      info.device_serials = [device]
+      info.chunk = shard.index + 1
+      info.total_chunks = shard.total
+      if chunk_tests:
+        info.include_file = WptRunner._write_include_file(
+            ua_name, info.chunk, chunk_tests[shard.index])
+      info.logfile = WptRunner._get_log_file(ua_name, info.chunk, device)
+      logfiles[shard.index] = info.logfile
       try:
-        print(future.result())
+        print('[%s] %s' % (device, WptRunner._run_one(info)))
       except subprocess.CalledProcessError as e:
-        print('CalledProcessError:', e)
-      except Exception as e:
-        print('Exception:', e)
-    combined_logfile = os.path.join(tempfile.gettempdir(),
-                                    "wpt_log_%s.json" % ua_name)
-    WptRunner._combine_logfiles(logfiles, combined_logfile)
-    return WptRunner._generate_report(test_info.wpt_dir, ua_name,
-                                      combined_logfile)
+        print('[%s] CalledProcessError: %s' % (device, e))
+        return [e]
+      merge_chunk_log(shard.index)
+      return []
+
+    def setup(device):
+      # Each device starts on chunks as soon as it is prepared.
+      if WptRunner._device_prepared(device, preparing):
+        return []
+      return [RuntimeError('%s not prepared for WPT' % device)]
+
+    shards = pool.run(num_chunks, run_chunk, setup=setup)
+    for line in DevicePool.summary(shards):
+      print(line)
+    for shard in shards:
+      if shard.index not in merged:
+        merge_chunk_log(shard.index)
 
   @staticmethod
-  def _run_adb(device, cmd):
-    subprocess.check_call(['adb', '-s', device] + cmd)
+  def _run_shared(test_info, ua_name, devices, preparing, merger, report):
+    '''Run the whole suite with one wpt run: its servers are started once
+    and shared by a browser per device, which take tests from one queue.'''
+    info = copy.copy(test_info)
+    info.device_serials = [d for d in devices
+                           if WptRunner._device_prepared(d, preparing)]
+    if not info.device_serials:
+      print('No devices could be prepared for WPT.')
+      return
+    info.logfile = os.path.join(tempfile.gettempdir(),
+                                '%s-shared-log.json' % ua_name)
+    try:
+      print(WptRunner._run_one(info))
+    except subprocess.CalledProcessError as e:
+      print('CalledProcessError: %s' % e)
+    merger.add_log(info.logfile)
+    report.progress = 'Done.'
+
+  @staticmethod
+  def run(test_info, ua_name, devices, num_chunks=None, shared_server=False,
+          run_name=None):
+    '''Run WPT on |devices| returning the path of the HTML report.
+
+    By default the suite is split into chunks, each run by its own wpt run
+    on one device (see _run_chunks). With |shared_server| a single wpt run
+    drives all devices instead, so wpt's servers are only started once.
+
+    The results are also stored as |run_name| (by default <ua_name>-<time>)
+    for comparison with other runs ("crbuild wpt diff").'''
+    pool = DevicePool(devices, retry_failures=True)
+    if not pool.devices:
+      print('No online devices to run WPT on.')
+      return None
+    # Devices are prepared while the run is set up here (not while wpt run
+    # starts, which needs the device prepared).
+    preparing = WptRunner.prepare_devices(pool.devices)
+    timing_db = WptRunner._get_timing_db()
+    report = HtmlReport(os.path.join(tempfile.gettempdir(),
+                                     'wpt_report_%s' % ua_name), ua_name)
+    run_name = run_name or '%s-%s' % (ua_name, time.strftime('%Y%m%d-%H%M%S'))
+    store = ResultsStore(WptRunner.results_store_path())
+    api_levels, build = WptRunner._get_run_metadata(pool.devices,
+                                                    test_info.package_name)
+    store.start_run(run_name, test_info.product, api_levels, build)
+    merger = ReportMerger(
+        os.path.join(tempfile.gettempdir(), 'wpt_log_%s.json' % ua_name),
+        [functools.partial(timing_db.add_result, test_info.product),
+         report.add_result, store.add_result])
+    if shared_server:
+      # The one log is only merged once the run finishes.
+      print('Report (written when the run finishes): %s' % report.index_path)
+      WptRunner._run_shared(test_info, ua_name, pool.devices, preparing,
+                            merger, report)
+    else:
+      print('Report (updated as chunks finish): %s' % report.write())
+      WptRunner._run_chunks(test_info, ua_name, pool, preparing, num_chunks,
+                            timing_db, merger, report)
+    merger.close()
+    timing_db.save()
+    store.finish_run()
+    store.close()
+    print('Results stored as WPT run %s' % run_name)
+    return report.write(finished=True)
+
+  @staticmethod
+  def _prepare_script(settings=True, command_line=True):
+    '''Return a shell script which applies device_settings and/or writes the
+    command line file where they differ from what is wanted, printing the
+    name of each it changed.'''
+    lines = ['failed=0']
+    if settings:
+      lines.append('current=$(settings list global)')
+      for name, value in WptRunner.device_settings:
+        lines.append(
+            'echo "$current" | grep -qxF %s || { settings put global %s %s '
+            '&& echo %s || failed=1; }' % (
+                shlex.quote('%s=%s' % (name, value)), name,
+                shlex.quote(value), name))
+    if command_line:
+      path = shlex.quote(WptRunner.command_line_file)
+      text = shlex.quote(WptRunner.command_line)
+      lines.append('[ "$(cat %s 2>/dev/null)" = %s ] || { echo %s > %s && '
+                   'echo %s || failed=1; }' % (path, text, text, path, path))
+    lines.append('exit $failed')
+    return '\n'.join(lines)
+
+  @staticmethod
+  def prepare_device(device, settings=True, command_line=True):
+    '''Prepare a device for WPT with one shell command, returning the list
+    of settings (and files) changed, which is empty for a device already
+    prepared. Raises subprocess.CalledProcessError if any can't be set.'''
+    return AdbClient.get().check_shell(
+        device, WptRunner._prepare_script(settings, command_line)).split()
 
   @staticmethod
   def disable_animations(device):
-    WptRunner._run_adb(device, ['shell', 'settings', 'put', 'global',
-                                'window_animation_scale', '0'])
-    WptRunner._run_adb(device, ['shell', 'settings', 'put', 'global',
-                                'transition_animation_scale', '0'])
-    WptRunner._run_adb(device, ['shell', 'settings', 'put', 'global',
-                                'animator_duration_scale', '0'])
+    WptRunner.prepare_device(device, command_line=False)
 
   @staticmethod
   def setup_device_command_line(device):
-    shell_cmd = "echo '_ --host-resolver-rules=\"MAP nonexistent.*.test " \
-                "~NOTFOUND, MAP *.test 127.0.0.1\"' > " \
-                "/data/local/tmp/webview-command-line"
-    WptRunner._run_adb(device, ['shell', shell_cmd])
+    WptRunner.prepare_device(device, settings=False)
+
+  @staticmethod
+  def prepare_devices(devices):
+    '''Start preparing |devices| concurrently, returning a dict of device
+    -> concurrent.futures.Future of its prepare_device.
 
+    This overlaps preparation with crbuild's side of setting up a run (the
+    timing database, chunk planning from the manifest, the report); wpt
+    run is only started on a device once it is prepared, so wpt's own
+    startup isn't overlapped.'''
+    executor = concurrent.futures.ThreadPoolExecutor(max(len(devices), 1))
+    futures = {d: executor.submit(WptRunner.prepare_device, d)
+               for d in devices}
+    # The threads exit once the devices are prepared.
+    executor.shutdown(wait=False)
+    return futures